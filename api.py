@@ -0,0 +1,443 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import db
+import exports
+import services
+from exports import json_default
+
+logger = logging.getLogger(__name__)
+
+
+def load_api_config():
+    """
+    API_HOST / API_PORT: listen address (default 127.0.0.1:8080).
+    API_WORKERS: threads running service calls (default DB_POOL_SIZE, so no
+        request thread ever waits for a pooled connection).
+    API_TOKEN: when set, every request must send ``Authorization: Bearer <token>``.
+    API_MAX_BODY: largest accepted request body in bytes.
+    """
+    return {
+        "host": os.getenv("API_HOST", "127.0.0.1"),
+        "port": int(os.getenv("API_PORT", 8080)),
+        "workers": int(os.getenv("API_WORKERS", 0)) or max(db.load_pool_config()["size"], 1),
+        "token": os.getenv("API_TOKEN") or None,
+        "max_body": int(os.getenv("API_MAX_BODY", 1_000_000)),
+    }
+
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_CHUNK = 64 * 1024
+
+
+class Download:
+    """A handler result sent as a file attachment in chunks, then deleted."""
+
+    def __init__(self, path, filename, content_type):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _int(values, name, default=None):
+    value = values.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise HTTPError(400, f"{name} is required")
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be a whole number")
+
+
+def _quantity(values, name="quantity"):
+    quantity = _int(values, name)
+    if quantity <= 0:
+        raise HTTPError(400, f"{name} must be positive")
+    return quantity
+
+
+def _limit(values, default, cap):
+    limit = _int(values, "limit", default=default)
+    if limit <= 0:
+        raise HTTPError(400, "limit must be positive")
+    return min(limit, cap)
+
+
+def _optional_int(values, name):
+    return _int(values, name, default=0) or None
+
+
+def _date(values, name):
+    value = values.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be a YYYY-MM-DD date")
+
+
+def _price(values, name):
+    try:
+        price = float(values.get(name) or 0)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"{name} must be a number")
+    if price < 0:
+        raise HTTPError(400, f"{name} cannot be negative")
+    return price
+
+
+# Handlers run on the worker threads and take (path match groups, query, JSON body).
+def list_products(args, query, body):
+    return services.list_products()
+
+
+def search_products(args, query, body):
+    return services.search_products(query.get("q", ""), limit=_limit(query, services.SEARCH_LIMIT, 100))
+
+
+def get_product(args, query, body):
+    product = services.get_product(int(args[0]))
+    if not product:
+        raise HTTPError(404, f"Product {args[0]} not found")
+    return product
+
+
+def get_product_stock(args, query, body):
+    return services.get_product_stock(int(args[0]))
+
+
+def create_sale(args, query, body):
+    if "lines" in body:
+        if not isinstance(body["lines"], list) or not all(isinstance(line, dict) for line in body["lines"]):
+            raise HTTPError(400, "lines must be a list of objects")
+        lines = [
+            {
+                "product_id": _int(line, "product_id"),
+                "quantity": _quantity(line),
+                "sale_price": _price(line, "sale_price"),
+            }
+            for line in body["lines"]
+        ]
+        count = services.add_sale_order(_int(body, "customer_id"), lines, sale_date=_date(body, "sale_date"))
+        return {"lines": count}
+    sale_id = services.add_sale(
+        _int(body, "product_id"),
+        _int(body, "customer_id"),
+        _quantity(body),
+        sale_date=_date(body, "sale_date"),
+        sale_price=_price(body, "sale_price"),
+    )
+    return {"sale_id": sale_id}
+
+
+def create_purchase(args, query, body):
+    purchase_id = services.add_purchase(
+        _int(body, "product_id"),
+        _int(body, "supplier_id"),
+        _quantity(body),
+        expiry_date=_date(body, "expiry_date"),
+        purchase_date=_date(body, "purchase_date"),
+        purchase_price=_price(body, "purchase_price"),
+    )
+    return {"purchase_id": purchase_id}
+
+
+def sales_report(args, query, body):
+    return services.get_sales_report(
+        limit=_limit(query, 50, 1000),
+        before_id=_optional_int(query, "before_id"),
+        from_date=_date(query, "from_date"),
+        to_date=_date(query, "to_date"),
+        product_id=_optional_int(query, "product_id"),
+        customer_id=_optional_int(query, "customer_id"),
+    )
+
+
+def purchase_report(args, query, body):
+    return services.get_purchase_report(
+        limit=_limit(query, 50, 1000),
+        before_id=_optional_int(query, "before_id"),
+        from_date=_date(query, "from_date"),
+        to_date=_date(query, "to_date"),
+        product_id=_optional_int(query, "product_id"),
+        supplier_id=_optional_int(query, "supplier_id"),
+    )
+
+
+def low_stock_report(args, query, body):
+    return services.get_low_stock(_int(query, "threshold", default=5))
+
+
+def near_expiry_report(args, query, body):
+    return services.get_near_expiry(_int(query, "days", default=30))
+
+
+def expired_report(args, query, body):
+    return services.get_expired()
+
+
+def dashboard(args, query, body):
+    return services.get_dashboard_summary(_int(query, "low_stock_threshold", default=5))
+
+
+def export_report(args, query, body):
+    """
+    The export is written to a temporary file on the worker thread, one fetch
+    batch at a time, and sent from disk in chunks, so neither step holds the
+    whole report in memory.
+    """
+    report, fmt = args
+    if report not in exports.REPORTS:
+        raise HTTPError(404, f"No {report} export; choose from {', '.join(exports.REPORTS)}")
+    filters = {}
+    if report != "stock":
+        filters = {"from_date": _date(query, "from_date"), "to_date": _date(query, "to_date")}
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        exports.export_report(report, fmt, path, **filters)
+    except BaseException:
+        os.remove(path)
+        raise
+    return Download(path, f"{report}_{date.today().isoformat()}.{fmt}", EXPORT_CONTENT_TYPES[fmt])
+
+
+def health(args, query, body):
+    return {"status": "ok", "pool": db.pool_stats(), "replicas": db.replica_stats()}
+
+
+ROUTES = [
+    ("GET", r"/health", health),
+    ("GET", r"/products", list_products),
+    ("GET", r"/products/search", search_products),
+    ("GET", r"/products/(\d+)", get_product),
+    ("GET", r"/products/(\d+)/stock", get_product_stock),
+    ("POST", r"/sales", create_sale),
+    ("POST", r"/purchases", create_purchase),
+    ("GET", r"/reports/sales", sales_report),
+    ("GET", r"/reports/purchases", purchase_report),
+    ("GET", r"/reports/low-stock", low_stock_report),
+    ("GET", r"/reports/near-expiry", near_expiry_report),
+    ("GET", r"/reports/expired", expired_report),
+    ("GET", r"/reports/dashboard", dashboard),
+    ("GET", r"/exports/(\w+)\.(csv|jsonl|parquet)", export_report),
+]
+_ROUTES = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in ROUTES]
+
+
+def resolve(method, path):
+    """Return (handler, path arguments) or raise 404/405."""
+    allowed = []
+    for route_method, pattern, handler in _ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, match.groups()
+            allowed.append(route_method)
+    if allowed:
+        raise HTTPError(405, f"{method} not allowed on {path}")
+    raise HTTPError(404, f"No route for {path}")
+
+
+class APIServer:
+    """
+    HTTP/1.1 JSON server on asyncio streams with keep-alive.
+
+    The event loop only parses requests and writes responses; every service
+    call runs on a fixed thread pool sized to the connection pool, so many
+    open client connections share a few database connections and excess
+    requests queue in the executor rather than in the pool.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, workers=5, token=None, max_body=1_000_000):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.stats = {"requests": 0, "errors": 0, "open_connections": 0, "connections": 0}
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > self.max_body:
+            raise HTTPError(413, f"Request body over {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    def _dispatch(self, method, target, headers, body):
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            raise HTTPError(401, "Missing or invalid API token")
+        url = urlsplit(target)
+        handler, args = resolve(method, url.path.rstrip("/") or "/")
+        query = dict(parse_qsl(url.query))
+        payload = {}
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "Body must be JSON")
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+        return handler, args, query, payload
+
+    @staticmethod
+    def _call(session, handler, args, query, payload):
+        with db.session(session):
+            return handler(args, query, payload)
+
+    async def _respond(self, method, target, headers, body, session):
+        try:
+            handler, args, query, payload = self._dispatch(method, target, headers, body)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.executor, partial(self._call, session, handler, args, query, payload)
+            )
+            return (201 if method == "POST" else 200), result
+        except HTTPError as exc:
+            return exc.status, {"error": exc.message}
+        except ValueError as exc:
+            # Service-level validation, e.g. insufficient stock.
+            return 409, {"error": str(exc)}
+        except db.INTEGRITY_ERRORS as exc:
+            # Foreign keys reject ids of rows that do not exist.
+            if getattr(exc, "errno", None) == 1452 or "FOREIGN KEY" in str(exc):
+                return 404, {"error": "Unknown product, customer or supplier id"}
+            return 400, {"error": "Request conflicts with existing data"}
+        except db.PoolTimeout as exc:
+            return 503, {"error": str(exc)}
+        except Exception:
+            logger.exception("Unhandled error for %s %s", method, target)
+            return 500, {"error": "Internal server error"}
+
+    async def handle(self, reader, writer):
+        self.stats["open_connections"] += 1
+        self.stats["connections"] += 1
+        connection = f"connection-{self.stats['connections']}"
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as exc:
+                    await self._write(writer, exc.status, {"error": exc.message}, keep_alive=False)
+                    return
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if request is None:
+                    return
+                method, target, version, headers, body = request
+                started = time.perf_counter()
+                # Clients that write and then read over different connections
+                # send the same X-Session-Id to read their own writes.
+                session = headers.get("x-session-id") or connection
+                status, result = await self._respond(method, target, headers, body, session)
+                self.stats["requests"] += 1
+                if status >= 500:
+                    self.stats["errors"] += 1
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                await self._write(writer, status, result, keep_alive)
+                logger.debug("%s %s %s %.1f ms", method, target, status, (time.perf_counter() - started) * 1000)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.stats["open_connections"] -= 1
+            writer.close()
+
+    async def _write(self, writer, status, result, keep_alive):
+        if isinstance(result, Download):
+            await self._write_file(writer, status, result, keep_alive)
+            return
+        payload = json.dumps(result, default=json_default).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _write_file(self, writer, status, download, keep_alive):
+        try:
+            with open(download.path, "rb") as fileobj:
+                head = (
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                    f"Content-Type: {download.content_type}\r\n"
+                    f"Content-Length: {os.fstat(fileobj.fileno()).st_size}\r\n"
+                    f'Content-Disposition: attachment; filename="{download.filename}"\r\n'
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode("latin-1"))
+                while True:
+                    chunk = fileobj.read(EXPORT_CHUNK)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+        finally:
+            os.remove(download.path)
+
+    async def serve(self, ready=None):
+        server = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def run(**overrides):
+    config = load_api_config()
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    server = APIServer(**config)
+    logger.info("Serving API on http://%s:%s with %s workers", config["host"], config["port"], config["workers"])
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
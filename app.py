@@ -1,14 +1,32 @@
+import functools
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import date
 
 import pandas as pd
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 
+import db
+import exports
 import services
 
 
 st.set_page_config(page_title="Home Decor Inventory", layout="wide")
 
 LOW_STOCK_THRESHOLD = 5
+REPORT_PAGE_SIZE = 50
+RECENT_ROWS = 10
+PICKER_LIMIT = 50
+RENDER_LOG_SIZE = 200
+# st.download_button holds the whole file in server memory for the session;
+# larger exports are left to the API's streamed /exports endpoint.
+EXPORT_UI_MAX_BYTES = int(os.getenv("EXPORT_UI_MAX_MB", 50)) * 1024 * 1024
 
 
 def ensure_auth():
@@ -29,66 +47,291 @@ def login_page():
             st.error("Invalid credentials")
 
 
+@contextmanager
+def render_scope(name):
+    """
+    Record the queries, database time and wall time spent rendering ``name``
+    in this session's render log. A scope opened while no other is open is a
+    fragment rerunning on its own; otherwise it is part of a full run.
+    """
+    thread = threading.get_ident()
+    stats = {"queries": 0, "db_ms": 0.0}
+
+    def hook(query, params, elapsed_ms, rows, caller):
+        # Hooks see every session's queries; count only this script thread's.
+        if threading.get_ident() == thread:
+            stats["queries"] += 1
+            stats["db_ms"] += elapsed_ms
+
+    open_scopes = st.session_state.setdefault("render_scopes", [])
+    trigger = "full run" if open_scopes or name.startswith("page:") else "fragment rerun"
+    open_scopes.append(name)
+    db.add_query_hook(hook)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        db.remove_query_hook(hook)
+        open_scopes.pop()
+        log = st.session_state.setdefault("render_log", [])
+        log.append(
+            {
+                "scope": name,
+                "trigger": trigger,
+                "queries": stats["queries"],
+                "db_ms": round(stats["db_ms"], 1),
+                "render_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        )
+        del log[:-RENDER_LOG_SIZE]
+
+
+def db_session():
+    """Route this browser session's queries as one session, so it reads its own writes."""
+    return db.session(st.session_state.setdefault("db_session", uuid.uuid4().hex))
+
+
+def fragment(func):
+    """
+    ``st.fragment`` that records its render cost: widgets inside rerun only
+    this function, and its own data loaders, instead of the whole page.
+    """
+
+    @functools.wraps(func)
+    def measured(*args, **kwargs):
+        # Fragment reruns skip main(), so they enter the session themselves.
+        with db_session(), render_scope(func.__name__):
+            return func(*args, **kwargs)
+
+    return st.fragment(measured)
+
+
+def rerun_fragment():
+    """Rerun the current fragment, or the whole page when this run was a full one."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
 def kpi_card(label, value):
     st.metric(label, value)
 
 
+def paged_report(key, loader, id_field, **filters):
+    """Render one keyset page of a report with Newer/Older controls; call from inside a fragment."""
+    state = st.session_state.setdefault(key, {"filters": None, "cursors": [None]})
+    if state["filters"] != filters:
+        state["filters"] = filters
+        state["cursors"] = [None]
+    rows = loader(limit=REPORT_PAGE_SIZE + 1, before_id=state["cursors"][-1], **filters)
+    has_older = len(rows) > REPORT_PAGE_SIZE
+    rows = rows[:REPORT_PAGE_SIZE]
+    st.dataframe(pd.DataFrame(rows))
+    st.caption(f"Page {len(state['cursors'])}")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Newer", key=f"{key}_newer", disabled=len(state["cursors"]) == 1):
+            state["cursors"].pop()
+            rerun_fragment()
+    with col2:
+        if st.button("Older", key=f"{key}_older", disabled=not has_older):
+            state["cursors"].append(rows[-1][id_field])
+            rerun_fragment()
+
+
+def product_picker(key, label="Product", any_label=None):
+    """
+    Search box plus a selectbox of the best matches from services.search_products.
+    Returns the chosen product row, or None for ``any_label`` or no matches.
+    """
+    term = st.text_input(f"Search {label.lower()}", key=f"{key}_search", placeholder="Name or category")
+    options = {any_label: None} if any_label else {}
+    options.update(
+        {f'{m["name"]} (ID {m["product_id"]})': m for m in services.search_products(term, limit=PICKER_LIMIT)}
+    )
+    if not options:
+        st.caption("No matching products.")
+        return None
+    return options[st.selectbox(label, list(options.keys()), key=f"{key}_product")]
+
+
+def subcategory_options(tree, category_id):
+    """Every category below ``category_id``, at any depth, labelled with its path."""
+    subtree = set(tree.descendants(category_id, include_self=False))
+    options = {"(None)": None}
+    options.update({tree.label(c["category_id"]): c["category_id"] for c in tree.walk() if c["category_id"] in subtree})
+    return options
+
+
+def report_filters(key, party_label, parties, party_id_field):
+    """Date range, product and counterparty filters for a history report."""
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        from_date = st.date_input("From", value=None, key=f"{key}_from")
+    with col2:
+        to_date = st.date_input("To", value=None, key=f"{key}_to")
+    with col3:
+        product = product_picker(key, any_label="(Any)")
+        product_id = product["product_id"] if product else None
+    with col4:
+        options = {"(Any)": None}
+        options.update({f'{p["name"]} (ID {p[party_id_field]})': p[party_id_field] for p in parties})
+        party_id = options[st.selectbox(party_label, list(options.keys()), key=f"{key}_party")]
+    return {"from_date": from_date, "to_date": to_date, "product_id": product_id, party_id_field: party_id}
+
+
+@fragment
+def purchase_history(key):
+    filters = report_filters(key, "Supplier", services.list_suppliers(), "supplier_id")
+    paged_report(key, services.get_purchase_report, "purchase_id", **filters)
+    avg_purchase = services.get_purchase_price_summary(**filters)
+    if avg_purchase:
+        st.subheader("Average Purchase Price by Product")
+        st.dataframe(pd.DataFrame(avg_purchase))
+
+
+@fragment
+def sales_history(key):
+    filters = report_filters(key, "Customer", services.list_customers(), "customer_id")
+    paged_report(key, services.get_sales_report, "sale_id", **filters)
+    avg_sales = services.get_sale_price_summary(**filters)
+    if avg_sales:
+        st.subheader("Average Sale Price by Product")
+        st.dataframe(pd.DataFrame(avg_sales))
+
+
+@fragment
+def sales_trends():
+    col1, col2 = st.columns(2)
+    with col1:
+        product = product_picker("trend", any_label="(All products)")
+        product_id = product["product_id"] if product else None
+    with col2:
+        metric = st.selectbox("Measure", ("revenue", "quantity", "sale_count"), key="trend_metric")
+    trend = services.get_sales_trend(product_id=product_id)
+    if not any(point[metric] for point in trend):
+        st.info("No sales in the last year.")
+        return
+    df = pd.DataFrame(trend).set_index("day")
+    for window in services.TREND_WINDOWS:
+        st.subheader(f"{window}-day moving {metric.replace('_', ' ')}")
+        st.line_chart(df[f"{metric}_{window}d"])
+
+
+@fragment
+def margins_report():
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        from_date = st.date_input("From", value=None, key="margins_from")
+    with col2:
+        to_date = st.date_input("To", value=None, key="margins_to")
+    with col3:
+        group_by = st.selectbox("Group by", ("product", "category"), key="margins_group")
+    with col4:
+        period = st.selectbox("Period", ("(None)", "month", "year", "day"), key="margins_period")
+    overview = services.get_margin_overview(
+        from_date=from_date, to_date=to_date, group_by=group_by, period=None if period == "(None)" else period
+    )
+    if not overview["rows"]:
+        st.info("No sales in this range.")
+        return
+    totals = overview["totals"]
+    revenue = totals["revenue"]
+    cogs = totals["cogs"]
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        kpi_card("Revenue", f"{revenue:,.2f}")
+    with c2:
+        kpi_card("COGS", f"{cogs:,.2f}")
+    with c3:
+        kpi_card("Gross Margin", f"{revenue - cogs:,.2f}" + (f" ({(revenue - cogs) / revenue:.0%})" if revenue else ""))
+    with c4:
+        kpi_card("Inventory Value", f"{overview['inventory_value']:,.2f}")
+    uncosted = int(totals["uncosted_units"])
+    if uncosted:
+        st.warning(f"{uncosted} units left stock with no purchase on record to cost them against; they carry no cost.")
+    st.dataframe(pd.DataFrame(overview["rows"]))
+
+
+@fragment
+def export_report_form():
+    report = st.selectbox("Report", list(exports.REPORTS.keys()), key="export_report")
+    fmt = st.selectbox("Format", exports.FORMATS, key="export_format")
+    if st.button("Prepare Export"):
+        # The export streams to disk in batches; only the finished file is handed to the browser.
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            count = exports.export_report(report, fmt, path)
+            size = os.path.getsize(path)
+            if size > EXPORT_UI_MAX_BYTES:
+                st.warning(
+                    f"This export is {count} rows ({size / 1024 / 1024:.0f} MB), over the "
+                    f"{EXPORT_UI_MAX_BYTES // 1024 // 1024} MB browser download limit. "
+                    f"Fetch it from the API at /exports/{report}.{fmt} or run "
+                    f"`python manage.py export {report} {report}.{fmt} --format {fmt}`."
+                )
+                return
+            with open(path, "rb") as fileobj:
+                st.download_button(
+                    f"Download {count} rows",
+                    data=fileobj,
+                    file_name=f"{report}_{date.today().isoformat()}.{fmt}",
+                    key="export_download",
+                )
+        finally:
+            os.remove(path)
+
+
 def dashboard_page():
     st.title("Dashboard")
-    products = services.list_products()
-    suppliers = services.list_suppliers()
-    customers = services.list_customers()
-    stock = services.get_current_stock()
-    low_stock = services.get_low_stock(LOW_STOCK_THRESHOLD)
-    purchases = services.get_purchase_report()
-    sales = services.get_sales_report()
-
-    total_stock_qty = sum(item["quantity"] for item in stock) if stock else 0
+    summary = services.get_dashboard_summary(LOW_STOCK_THRESHOLD, recent=RECENT_ROWS)
 
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     with col1:
-        kpi_card("Products", len(products))
+        kpi_card("Products", summary["products"])
     with col2:
-        kpi_card("Suppliers", len(suppliers))
+        kpi_card("Suppliers", summary["suppliers"])
     with col3:
-        kpi_card("Customers", len(customers))
+        kpi_card("Customers", summary["customers"])
     with col4:
-        kpi_card("Total Stock", total_stock_qty)
+        kpi_card("Total Stock", summary["total_stock"])
     with col5:
-        kpi_card("Low Stock", len(low_stock))
+        kpi_card("Low Stock", len(summary["low_stock"]))
     with col6:
-        kpi_card("Expired Batches", len(services.get_expired()))
+        kpi_card("Expired Batches", summary["expired_batches"])
 
-    if stock:
-        stock_df = pd.DataFrame(stock)
-        grouped = stock_df.groupby("product_name")["quantity"].sum().reset_index()
+    if summary["stock_by_product"]:
         st.subheader("Stock by Product")
-        st.bar_chart(grouped, x="product_name", y="quantity")
+        st.bar_chart(pd.DataFrame(summary["stock_by_product"]), x="product_name", y="quantity")
 
-        cat_grouped = (
-            stock_df.groupby("category_name")["quantity"].sum().reset_index().fillna("Unassigned")
-        )
         st.subheader("Stock by Category")
-        st.bar_chart(cat_grouped, x="category_name", y="quantity")
+        st.bar_chart(pd.DataFrame(summary["stock_by_category"]), x="category_name", y="quantity")
 
     st.subheader("Low Stock")
-    st.dataframe(pd.DataFrame(low_stock) if low_stock else pd.DataFrame())
-
+    st.dataframe(pd.DataFrame(summary["low_stock"]))
 
     st.subheader("Recent Purchases")
-    st.dataframe(pd.DataFrame(purchases) if purchases else pd.DataFrame())
+    st.dataframe(pd.DataFrame(summary["recent_purchases"]))
 
     st.subheader("Recent Sales")
-    st.dataframe(pd.DataFrame(sales) if sales else pd.DataFrame())
+    st.dataframe(pd.DataFrame(summary["recent_sales"]))
 
 
 def products_page():
     st.title("Products")
-    root_categories = services.list_categories()
-    if not root_categories:
+    if not services.get_category_tree().roots():
         st.warning("Add categories first.")
         return
+    add_product_form()
+    manage_products()
 
+
+@fragment
+def add_product_form():
+    tree = services.get_category_tree()
+    root_categories = tree.roots()
     st.subheader("Add Product")
     name = st.text_input("Name", key="add_product_name")
     category_options = {c["name"]: c["category_id"] for c in root_categories}
@@ -98,9 +341,7 @@ def products_page():
         key="add_product_category",
     )
     selected_category_id = category_options[category_label]
-    subcategories = services.list_categories(selected_category_id)
-    sub_opts = {"(None)": None}
-    sub_opts.update({sc["name"]: sc["category_id"] for sc in subcategories})
+    sub_opts = subcategory_options(tree, selected_category_id)
     sub_label = st.selectbox(
         "Subcategory",
         list(sub_opts.keys()),
@@ -113,84 +354,80 @@ def products_page():
         st.success("Product added")
         st.rerun()
 
-    products = services.list_products()
+
+@fragment
+def manage_products():
+    tree = services.get_category_tree()
+    root_categories = tree.roots()
     st.subheader("Manage Products")
-    if products:
-        search_term = st.text_input("Search products", key="product_search")
-        filtered = [
-            p
-            for p in products
-            if search_term.lower() in p["name"].lower()
-            or search_term.lower() in str(p.get("category_name", "")).lower()
-            or search_term.lower() in str(p.get("subcategory_name", "")).lower()
-        ]
+    search_term = st.text_input("Search products", key="product_search")
+    filtered = services.search_products(search_term, limit=PICKER_LIMIT)
+    if filtered:
         st.dataframe(pd.DataFrame(filtered))
+        st.caption(f"Best {len(filtered)} matches" if len(filtered) == PICKER_LIMIT else f"{len(filtered)} matches")
 
-        if filtered:
-            options = {f"{p['name']} (ID {p['product_id']})": p for p in filtered}
-            selected_label = st.selectbox("Select product to edit", list(options.keys()))
-            selected = options[selected_label]
+        options = {f"{p['name']} (ID {p['product_id']})": p for p in filtered}
+        selected_label = st.selectbox("Select product to edit", list(options.keys()))
+        selected = options[selected_label]
 
-            category_options = {c["name"]: c["category_id"] for c in root_categories}
-            selected_category_label = next(
-                (name for name, cid in category_options.items() if cid == selected["category_id"]),
-                list(category_options.keys())[0],
-            )
-            cat_label = st.selectbox(
-                "Category",
-                list(category_options.keys()),
-                index=list(category_options.keys()).index(selected_category_label),
-                key=f"edit_cat_{selected['product_id']}",
-            )
-            selected_category_id = category_options[cat_label]
-            subcategories = services.list_categories(selected_category_id)
-            sub_opts = {"(None)": None}
-            sub_opts.update({sc["name"]: sc["category_id"] for sc in subcategories})
-            default_sub_label = "(None)"
-            for name, cid in sub_opts.items():
-                if cid == selected.get("subcategory_id"):
-                    default_sub_label = name
-                    break
-            sub_label = st.selectbox(
-                "Subcategory",
-                list(sub_opts.keys()),
-                index=list(sub_opts.keys()).index(default_sub_label),
-                key=f"edit_subcat_{selected['product_id']}_{selected_category_id}",
-            )
-            selected_sub_id = sub_opts[sub_label]
-
-            new_name = st.text_input("Name", value=selected["name"], key=f"edit_name_{selected['product_id']}")
-            new_price = st.number_input(
-                "Price",
-                min_value=0.0,
-                value=float(selected["price"]),
-                format="%.2f",
-                key=f"edit_price_{selected['product_id']}",
-            )
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Update", key=f"btn_save_prod_{selected['product_id']}"):
-                    services.update_product(
-                        selected["product_id"],
-                        new_name,
-                        selected_category_id,
-                        selected_sub_id,
-                        new_price,
-                    )
-                    st.success("Updated")
-                    st.rerun()
-            with col2:
-                if st.button("Delete", key=f"btn_delete_prod_{selected['product_id']}"):
-                    services.delete_product(selected["product_id"])
-                    st.warning("Deleted")
-                    st.rerun()
+        category_options = {c["name"]: c["category_id"] for c in root_categories}
+        selected_category_label = next(
+            (name for name, cid in category_options.items() if cid == selected["category_id"]),
+            list(category_options.keys())[0],
+        )
+        cat_label = st.selectbox(
+            "Category",
+            list(category_options.keys()),
+            index=list(category_options.keys()).index(selected_category_label),
+            key=f"edit_cat_{selected['product_id']}",
+        )
+        selected_category_id = category_options[cat_label]
+        sub_opts = subcategory_options(tree, selected_category_id)
+        default_sub_label = "(None)"
+        for name, cid in sub_opts.items():
+            if cid == selected.get("subcategory_id"):
+                default_sub_label = name
+                break
+        sub_label = st.selectbox(
+            "Subcategory",
+            list(sub_opts.keys()),
+            index=list(sub_opts.keys()).index(default_sub_label),
+            key=f"edit_subcat_{selected['product_id']}_{selected_category_id}",
+        )
+        selected_sub_id = sub_opts[sub_label]
+
+        new_name = st.text_input("Name", value=selected["name"], key=f"edit_name_{selected['product_id']}")
+        new_price = st.number_input(
+            "Price",
+            min_value=0.0,
+            value=float(selected["price"]),
+            format="%.2f",
+            key=f"edit_price_{selected['product_id']}",
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Update", key=f"btn_save_prod_{selected['product_id']}"):
+                services.update_product(
+                    selected["product_id"],
+                    new_name,
+                    selected_category_id,
+                    selected_sub_id,
+                    new_price,
+                )
+                st.success("Updated")
+                st.rerun()
+        with col2:
+            if st.button("Delete", key=f"btn_delete_prod_{selected['product_id']}"):
+                services.delete_product(selected["product_id"])
+                st.warning("Deleted")
+                st.rerun()
     else:
         st.info("No products found.")
 
 
 def categories_page():
     st.title("Categories")
-    root_categories = services.list_categories()
+    tree = services.get_category_tree()
 
     with st.form("add_root_category"):
         st.subheader("Add Root Category")
@@ -202,8 +439,8 @@ def categories_page():
 
     with st.form("add_subcategory"):
         st.subheader("Add Subcategory")
-        if root_categories:
-            parent_map = {c["name"]: c["category_id"] for c in root_categories}
+        if tree.nodes:
+            parent_map = {tree.label(c["category_id"]): c["category_id"] for c in tree.walk()}
             parent_label = st.selectbox("Parent category", list(parent_map.keys()))
             parent_id = parent_map[parent_label]
             sub_name = st.text_input("Subcategory name")
@@ -214,31 +451,32 @@ def categories_page():
         else:
             st.info("Add a root category first.")
 
-    all_cats = services.list_all_categories()
     st.subheader("Manage Categories")
-    if all_cats:
+    if tree.nodes:
+        rollups = services.get_category_rollups()
         display = []
-        for cat in all_cats:
+        for cat in tree.walk():
             display.append(
                 {
                     "category_id": cat["category_id"],
-                    "name": cat["name"],
-                    "parent": cat.get("parent_name"),
+                    "name": tree.label(cat["category_id"]),
+                    **rollups[cat["category_id"]],
                 }
             )
         st.dataframe(pd.DataFrame(display))
-        options = {
-            (f"{cat['parent_name']} -> {cat['name']}" if cat.get("parent_name") else cat["name"]): cat
-            for cat in all_cats
-        }
+        options = {tree.label(cat["category_id"]): cat for cat in tree.walk()}
         selected_label = st.selectbox("Select category to edit", list(options.keys()))
         selected = options[selected_label]
 
         new_name = st.text_input(
             "Name", value=selected["name"], key=f"cat_edit_name_{selected['category_id']}"
         )
+        # A category cannot move under itself or one of its descendants.
+        subtree = set(tree.descendants(selected["category_id"]))
         parent_choices = {"(None)": None}
-        parent_choices.update({c["name"]: c["category_id"] for c in root_categories})
+        parent_choices.update(
+            {tree.label(c["category_id"]): c["category_id"] for c in tree.walk() if c["category_id"] not in subtree}
+        )
         current_parent_label = "(None)"
         for name, cid in parent_choices.items():
             if cid == selected.get("parent_category_id"):
@@ -254,7 +492,9 @@ def categories_page():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Update Category", key=f"btn_update_cat_{selected['category_id']}"):
-                services.update_category(selected["category_id"], new_name, new_parent_id)
+                services.update_category(
+                    selected["category_id"], new_name, new_parent_id, clear_parent=new_parent_id is None
+                )
                 st.success("Updated")
                 st.rerun()
         with col2:
@@ -336,135 +576,265 @@ def customers_page():
 
 def purchase_page():
     st.title("Record Purchase")
-    products = services.list_products()
-    sups = services.list_suppliers()
-    if not products or not sups:
+    if not services.search_products(limit=1) or not services.list_suppliers():
         st.warning("Add products and suppliers first.")
         return
-    product_option = st.selectbox(
-        "Product", [f'{m["name"]} (ID {m["product_id"]})' for m in products]
-    )
+    purchase_form()
+
+    st.subheader("Purchase History")
+    purchase_history("purchase_page_history")
+
+
+@fragment
+def purchase_form():
+    sups = services.list_suppliers()
+    product = product_picker("purchase")
     sup_option = st.selectbox(
         "Supplier", [f'{s["name"]} (ID {s["supplier_id"]})' for s in sups]
     )
     quantity = st.number_input("Quantity", min_value=1, value=1)
     purchase_price = st.number_input("Purchase price", min_value=0.0, format="%.2f")
     purchase_date = st.date_input("Purchase date", value=date.today())
-    if st.button("Save Purchase"):
-        product_id = int(product_option.split("ID")[1].strip(") "))
+    if st.button("Save Purchase", disabled=product is None):
+        product_id = product["product_id"]
         sup_id = int(sup_option.split("ID")[1].strip(") "))
         services.add_purchase(product_id, sup_id, int(quantity), None, purchase_date, purchase_price)
         st.success("Purchase recorded and stock updated.")
         st.rerun()
 
-    st.subheader("Purchase History")
-    purchases = services.get_purchase_report()
-    if purchases:
-        df = pd.DataFrame(purchases)
-        st.dataframe(df)
-        if "purchase_price" in df.columns:
-            avg_purchase = (
-                df.groupby("product_name")["purchase_price"]
-                .mean()
-                .reset_index()
-                .rename(columns={"purchase_price": "avg_purchase_price"})
+
+def replenishment_page():
+    st.title("Replenishment")
+    st.caption(
+        "Draft purchase orders for low-stock products, each sent to the supplier with the best recent "
+        "price and shelf life in the last year of purchases."
+    )
+    suggestions = services.get_purchase_suggestions(LOW_STOCK_THRESHOLD)
+    orders = suggestions["orders"]
+    if not orders and not suggestions["unsourced"]:
+        st.success("No products need reordering.")
+        return
+    purchase_date = st.date_input("Purchase date", value=date.today(), key="replenish_date")
+    if orders and st.button(f"Accept All {len(orders)} Orders"):
+        count = services.accept_purchase_orders(orders, purchase_date)
+        st.success(f"Recorded {count} purchases.")
+        st.rerun()
+    for order in orders:
+        with st.expander(f'{order["supplier_name"]}: {len(order["lines"])} products, total {order["total"]:,.2f}'):
+            st.dataframe(pd.DataFrame(order["lines"]), hide_index=True)
+            if st.button("Accept Order", key=f'accept_order_{order["supplier_id"]}'):
+                count = services.accept_purchase_orders([order], purchase_date)
+                st.success(f"Recorded {count} purchases from {order['supplier_name']}.")
+                st.rerun()
+    if suggestions["unsourced"]:
+        st.subheader("No Recent Supplier")
+        st.dataframe(pd.DataFrame(suggestions["unsourced"]), hide_index=True)
+
+
+def purchase_import_page():
+    st.title("Import Purchases")
+    st.caption(
+        "Upload a CSV with columns: "
+        + ", ".join(services.PURCHASE_IMPORT_COLUMNS)
+        + ". Dates use YYYY-MM-DD; missing purchase dates default to today."
+    )
+    uploaded = st.file_uploader("Purchases CSV", type=["csv"])
+    if uploaded is None:
+        return
+    if st.button("Import"):
+        progress = st.progress(0.0, text="Starting import...")
+
+        def on_progress(report):
+            fraction = min(uploaded.tell() / uploaded.size, 1.0) if uploaded.size else 1.0
+            progress.progress(
+                fraction,
+                text=f"{report['rows']} rows read, {report['imported']} imported, {len(report['errors'])} errors",
             )
-            st.subheader("Average Purchase Price by Product")
-            st.dataframe(avg_purchase)
-    else:
-        st.dataframe(pd.DataFrame())
+
+        stream = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+        try:
+            report = services.import_purchases_csv(stream, on_progress=on_progress)
+        except ValueError as exc:
+            st.error(str(exc))
+            return
+        finally:
+            stream.detach()
+        progress.progress(1.0, text="Import finished")
+        st.success(f"Imported {report['imported']} of {report['rows']} rows.")
+        if report["errors"]:
+            st.subheader("Rejected Rows")
+            st.dataframe(pd.DataFrame(report["errors"]))
 
 
 def sales_page():
     st.title("Record Sale")
-    products = services.list_products()
-    customers = services.list_customers()
-    if not products or not customers:
+    if not services.search_products(limit=1) or not services.list_customers():
         st.warning("Add products and customers first.")
         return
-    product_option = st.selectbox(
-        "Product", [f'{m["name"]} (ID {m["product_id"]})' for m in products]
-    )
-    cust_option = st.selectbox(
-        "Customer", [f'{c["name"]} (ID {c["customer_id"]})' for c in customers]
-    )
-    quantity = st.number_input("Quantity", min_value=1, value=1)
-    sale_price = st.number_input("Sale price", min_value=0.0, format="%.2f")
-    sale_date = st.date_input("Sale date", value=date.today())
-    if st.button("Save Sale"):
-        product_id = int(product_option.split("ID")[1].strip(") "))
-        cust_id = int(cust_option.split("ID")[1].strip(") "))
-        try:
-            services.add_sale(product_id, cust_id, int(quantity), sale_date, sale_price)
-            st.success("Sale recorded and stock reduced.")
-            st.rerun()
-        except ValueError as exc:
-            st.error(str(exc))
+    flash = st.session_state.pop("sale_flash", None)
+    if flash:
+        st.success(flash)
+    order_entry()
 
     st.subheader("Sales History")
-    sales = services.get_sales_report()
-    if sales:
-        df = pd.DataFrame(sales)
-        st.dataframe(df)
-        if "sale_price" in df.columns:
-            avg_sales = (
-                df.groupby("product_name")["sale_price"]
-                .mean()
-                .reset_index()
-                .rename(columns={"sale_price": "avg_sale_price"})
+    sales_history("sales_page_history")
+
+
+@fragment
+def order_entry():
+    """Picker and cart; editing the cart reruns only this fragment."""
+    customers = services.list_customers()
+    cart = st.session_state.setdefault("sale_cart", [])
+
+    st.subheader("Add to Order")
+    product = product_picker("sale")
+    quantity = st.number_input("Quantity", min_value=1, value=1)
+    sale_price = st.number_input("Sale price", min_value=0.0, format="%.2f")
+    if st.button("Add to Cart", disabled=product is None):
+        cart.append(
+            {
+                "product_id": product["product_id"],
+                "product_name": product["name"],
+                "quantity": int(quantity),
+                "sale_price": sale_price,
+            }
+        )
+        rerun_fragment()
+
+    st.subheader("Cart")
+    if cart:
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "product": line["product_name"],
+                        "quantity": line["quantity"],
+                        "sale_price": line["sale_price"],
+                    }
+                    for line in cart
+                ]
             )
-            st.subheader("Average Sale Price by Product")
-            st.dataframe(avg_sales)
+        )
+        cust_option = st.selectbox(
+            "Customer", [f'{c["name"]} (ID {c["customer_id"]})' for c in customers]
+        )
+        sale_date = st.date_input("Sale date", value=date.today())
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Place Order"):
+                cust_id = int(cust_option.split("ID")[1].strip(") "))
+                try:
+                    count = services.add_sale_order(cust_id, cart, sale_date)
+                except ValueError as exc:
+                    st.error(str(exc))
+                else:
+                    cart.clear()
+                    # Full rerun so the sales history below shows the new order.
+                    st.session_state["sale_flash"] = f"Order recorded: {count} lines sold and stock reduced."
+                    st.rerun()
+        with col2:
+            if st.button("Clear Cart"):
+                cart.clear()
+                rerun_fragment()
     else:
-        st.dataframe(pd.DataFrame())
+        st.info("Cart is empty.")
+
+
+def current_stock_report():
+    st.dataframe(pd.DataFrame(services.get_current_stock()))
+
+
+def low_stock_report():
+    st.dataframe(pd.DataFrame(services.get_low_stock(LOW_STOCK_THRESHOLD)))
+
+
+REPORTS = {
+    "Current Stock": current_stock_report,
+    "Low Stock": low_stock_report,
+    "Purchases": lambda: purchase_history("reports_purchases"),
+    "Sales": lambda: sales_history("reports_sales"),
+    "Trends": sales_trends,
+    "Margins": margins_report,
+    "Export": export_report_form,
+}
 
 
 def reports_page():
     st.title("Reports")
-    tabs = st.tabs(
-        [
-            "Current Stock",
-            "Low Stock",
-            "Purchases",
-            "Sales",
-        ]
+    # st.tabs renders every tab on each run; a selector runs only the open report.
+    choice = st.segmented_control("Report", list(REPORTS), default="Current Stock", key="report_tab")
+    REPORTS[choice or "Current Stock"]()
+
+
+def admin_page():
+    st.title("Admin")
+    st.subheader("Top Queries by Total Time")
+    top = db.query_stats_snapshot(order_by="total_ms", limit=25)
+    if top:
+        st.dataframe(pd.DataFrame(top), hide_index=True)
+    else:
+        st.info("No queries recorded yet.")
+    if st.button("Reset Query Stats"):
+        db.query_stats.reset()
+        st.rerun()
+
+    st.subheader("Expiry Sweep")
+    st.caption("Archives expired and empty batches and records expired quantities as write-offs.")
+    if st.button("Run Expiry Sweep"):
+        report = services.sweep_stock()
+        st.success(
+            f"Archived {report['expired_batches']} expired batches "
+            f"({report['written_off_units']} units written off) and {report['empty_batches']} empty batches."
+        )
+    write_offs = services.get_stock_write_offs(from_date=date.today().replace(day=1))
+    if write_offs:
+        st.write("Write-offs this month")
+        st.dataframe(pd.DataFrame(write_offs), hide_index=True)
+
+    st.subheader("Reorder Points")
+    st.caption(
+        "Forecasts each product's daily demand from recent sales and sets the stock level at which it "
+        f"shows as low stock. Products without a forecast use the global threshold of {LOW_STOCK_THRESHOLD}."
     )
-    with tabs[0]:
-        st.dataframe(pd.DataFrame(services.get_current_stock()))
-    with tabs[1]:
-        st.dataframe(pd.DataFrame(services.get_low_stock(LOW_STOCK_THRESHOLD)))
-    with tabs[2]:
-        purchases = services.get_purchase_report()
-        if purchases:
-            df = pd.DataFrame(purchases)
-            st.dataframe(df)
-            if "purchase_price" in df.columns:
-                avg_purchase = (
-                    df.groupby("product_name")["purchase_price"]
-                    .mean()
-                    .reset_index()
-                    .rename(columns={"purchase_price": "avg_purchase_price"})
-                )
-                st.subheader("Average Purchase Price by Product")
-                st.dataframe(avg_purchase)
-        else:
-            st.dataframe(pd.DataFrame())
-    with tabs[3]:
-        sales = services.get_sales_report()
-        if sales:
-            df = pd.DataFrame(sales)
-            st.dataframe(df)
-            if "sale_price" in df.columns:
-                avg_sales = (
-                    df.groupby("product_name")["sale_price"]
-                    .mean()
-                    .reset_index()
-                    .rename(columns={"sale_price": "avg_sale_price"})
-                )
-                st.subheader("Average Sale Price by Product")
-                st.dataframe(avg_sales)
-        else:
-            st.dataframe(pd.DataFrame())
+    if st.button("Recompute Reorder Points"):
+        count = services.refresh_reorder_points()
+        st.success(f"Computed reorder points for {count} products.")
+
+    st.subheader("Render Times")
+    st.caption(
+        "Queries, database time and render time per page run and per fragment rerun in this session. "
+        "A fragment rerun repeats only that part of the page."
+    )
+    log = st.session_state.get("render_log")
+    if log:
+        frame = pd.DataFrame(log)
+        summary = frame.groupby(["scope", "trigger"], as_index=False).agg(
+            runs=("queries", "size"),
+            queries=("queries", "mean"),
+            db_ms=("db_ms", "mean"),
+            render_ms=("render_ms", "mean"),
+        )
+        st.dataframe(summary.round(1), hide_index=True)
+    else:
+        st.info("No renders recorded yet.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Connection Pool")
+        st.dataframe(pd.DataFrame([db.pool_stats()]).T.rename(columns={0: "value"}))
+    with col2:
+        st.subheader("Reference Cache")
+        st.dataframe(pd.DataFrame([services.cache_stats()]).T.rename(columns={0: "value"}))
+
+    replicas = db.replica_stats()
+    if replicas:
+        st.subheader("Read Replicas")
+        st.caption(
+            "Reads outside transactions are spread across the replicas. A session that wrote reads from "
+            "the primary for a short while, and reads fall back to the primary when a replica fails."
+        )
+        st.dataframe(pd.DataFrame(replicas.pop("replicas")), hide_index=True)
+        st.dataframe(pd.DataFrame([replicas]).T.rename(columns={0: "value"}))
 
 
 def main():
@@ -483,31 +853,42 @@ def main():
             "Suppliers",
             "Customers",
             "Purchase Entry",
+            "Purchase Import",
+            "Replenishment",
             "Sales Entry",
             "Reports",
+            "Admin",
         ),
     )
     if st.sidebar.button("Logout"):
         st.session_state["auth_user"] = None
         st.experimental_rerun()
 
-    if page == "Dashboard":
-        dashboard_page()
-    elif page == "Categories":
-        categories_page()
-    elif page == "Products":
-        products_page()
-    elif page == "Suppliers":
-        suppliers_page()
-    elif page == "Customers":
-        customers_page()
-    elif page == "Purchase Entry":
-        purchase_page()
-    elif page == "Sales Entry":
-        sales_page()
-    elif page == "Reports":
-        reports_page()
+    with render_scope(f"page: {page}"):
+        if page == "Dashboard":
+            dashboard_page()
+        elif page == "Categories":
+            categories_page()
+        elif page == "Products":
+            products_page()
+        elif page == "Suppliers":
+            suppliers_page()
+        elif page == "Customers":
+            customers_page()
+        elif page == "Purchase Entry":
+            purchase_page()
+        elif page == "Purchase Import":
+            purchase_import_page()
+        elif page == "Replenishment":
+            replenishment_page()
+        elif page == "Sales Entry":
+            sales_page()
+        elif page == "Reports":
+            reports_page()
+        elif page == "Admin":
+            admin_page()
 
 
 if __name__ == "__main__":
-    main()
+    with db_session():
+        main()
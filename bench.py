@@ -0,0 +1,226 @@
+import inspect
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+
+import db
+import services
+from cache import reference_cache
+
+
+class _Rollback(Exception):
+    pass
+
+
+# Functions that write; each run happens in a transaction that is rolled back.
+MUTATING = {
+    "add_category", "update_category", "delete_category",
+    "add_product", "update_product", "delete_product",
+    "add_supplier", "update_supplier", "delete_supplier",
+    "add_customer", "update_customer", "delete_customer",
+    "add_purchase", "write_purchase_batch", "import_purchases_csv",
+    "add_sale", "add_sale_order",
+    "upsert_stock", "lock_stock_totals", "refresh_stock_totals", "rebuild_stock_totals",
+    "lock_stock_batches", "apply_stock_deductions", "deduct_stock", "sweep_stock",
+    "refresh_reorder_points", "accept_purchase_orders",
+}
+
+
+def sample_ids():
+    """Representative ids from the current database for building call arguments."""
+    stocked = db.fetch_one(
+        "SELECT product_id FROM product_stock_totals ORDER BY total_quantity DESC LIMIT 1"
+    )
+    product_id = stocked["product_id"] if stocked else db.fetch_one("SELECT MIN(product_id) AS id FROM products")["id"]
+    batch = db.fetch_one(
+        "SELECT * FROM stock WHERE product_id = %s AND quantity > 0 ORDER BY expiry_date LIMIT 1",
+        (product_id,),
+    )
+    return {
+        "product_id": product_id,
+        "supplier_id": db.fetch_one("SELECT MIN(supplier_id) AS id FROM suppliers WHERE is_deleted = 0")["id"],
+        "customer_id": db.fetch_one("SELECT MIN(customer_id) AS id FROM customers WHERE is_deleted = 0")["id"],
+        "category_id": db.fetch_one(
+            "SELECT MIN(category_id) AS id FROM categories WHERE parent_category_id IS NULL AND is_deleted = 0"
+        )["id"],
+        "batch": batch,
+    }
+
+
+def call_plan(ids):
+    """Map each benchmarked service function to a zero-argument call."""
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    p, s, c, cat = ids["product_id"], ids["supplier_id"], ids["customer_id"], ids["category_id"]
+    purchase_rows = [(p, s, 1, today + timedelta(days=365), today, 1.0)] * 100
+    csv_text = "product_id,supplier_id,quantity\n" + f"{p},{s},1\n" * 100
+
+    return {
+        "list_categories": lambda: services.list_categories(),
+        "list_all_categories": lambda: services.list_all_categories(),
+        "get_category_tree": lambda: services.get_category_tree(),
+        "get_category_rollups": lambda: services.get_category_rollups(from_date=month_ago),
+        "add_category": lambda: services.add_category("bench"),
+        "update_category": lambda: services.update_category(cat, name="bench"),
+        "delete_category": lambda: services.delete_category(cat),
+        "list_products": lambda: services.list_products(),
+        "add_product": lambda: services.add_product("bench", cat, None, 1.0),
+        "update_product": lambda: services.update_product(p, price=1.0),
+        "delete_product": lambda: services.delete_product(p),
+        "get_product": lambda: services.get_product(p),
+        "search_products": lambda: services.search_products("product 1"),
+        "list_suppliers": lambda: services.list_suppliers(),
+        "add_supplier": lambda: services.add_supplier("bench", "bench"),
+        "update_supplier": lambda: services.update_supplier(s, name="bench"),
+        "delete_supplier": lambda: services.delete_supplier(s),
+        "list_customers": lambda: services.list_customers(),
+        "add_customer": lambda: services.add_customer("bench"),
+        "update_customer": lambda: services.update_customer(c, "bench"),
+        "delete_customer": lambda: services.delete_customer(c),
+        "cache_stats": lambda: services.cache_stats(),
+        "validate_user": lambda: services.validate_user("admin", "adminpass"),
+        "add_purchase": lambda: services.add_purchase(p, s, 1),
+        "parse_purchase_row": lambda: services.parse_purchase_row(
+            {"product_id": str(p), "supplier_id": str(s), "quantity": "1"}, {p}, {s}, today
+        ),
+        "write_purchase_batch": lambda: services.write_purchase_batch(purchase_rows),
+        "import_purchases_csv": lambda: services.import_purchases_csv(io.StringIO(csv_text)),
+        "add_sale": lambda: services.add_sale(p, c, 1),
+        "add_sale_order": lambda: services.add_sale_order(c, [{"product_id": p, "quantity": 1}] * 10),
+        "upsert_stock": lambda: services.upsert_stock(p, s, 1, today + timedelta(days=365)),
+        "lock_stock_totals": lambda: services.lock_stock_totals([p]),
+        "refresh_stock_totals": lambda: services.refresh_stock_totals([p]),
+        "rebuild_stock_totals": lambda: services.rebuild_stock_totals(),
+        "verify_stock_totals": lambda: services.verify_stock_totals(),
+        "lock_stock_batches": lambda: services.lock_stock_batches(p, 1),
+        "allocate_fefo": lambda: services.allocate_fefo([ids["batch"]] * 50, 10),
+        "apply_stock_deductions": lambda: services.apply_stock_deductions([(ids["batch"], 1)]),
+        "deduct_stock": lambda: services.deduct_stock(p, 1),
+        "sweep_stock": lambda: services.sweep_stock(),
+        "get_current_stock": lambda: services.get_current_stock(),
+        "iter_current_stock": lambda: sum(len(b) for b in services.iter_current_stock()),
+        "get_low_stock": lambda: services.get_low_stock(5),
+        "refresh_reorder_points": lambda: services.refresh_reorder_points(),
+        "get_purchase_suggestions": lambda: services.get_purchase_suggestions(5),
+        "accept_purchase_orders": lambda: services.accept_purchase_orders(
+            [{"supplier_id": s, "lines": [{"product_id": p, "quantity": 1, "unit_price": 1.0, "shelf_life_days": 365}]}]
+        ),
+        "get_product_stock": lambda: services.get_product_stock(p),
+        "get_dashboard_summary": lambda: services.get_dashboard_summary(5),
+        "get_near_expiry": lambda: services.get_near_expiry(30),
+        "get_expired": lambda: services.get_expired(),
+        "get_stock_write_offs": lambda: services.get_stock_write_offs(from_date=month_ago),
+        "get_sales_report": lambda: services.get_sales_report(limit=50),
+        "iter_sales_report": lambda: sum(len(b) for b in services.iter_sales_report(from_date=month_ago)),
+        "get_purchase_report": lambda: services.get_purchase_report(limit=50),
+        "iter_purchase_report": lambda: sum(len(b) for b in services.iter_purchase_report(from_date=month_ago)),
+        "get_sales_trend": lambda: services.get_sales_trend(),
+        "get_margin_report": lambda: services.get_margin_report(from_date=month_ago, group_by="category", period="month"),
+        "get_inventory_valuation": lambda: services.get_inventory_valuation(),
+        "get_margin_overview": lambda: services.get_margin_overview(from_date=month_ago, group_by="category"),
+        "get_sale_price_summary": lambda: services.get_sale_price_summary(from_date=month_ago),
+        "get_purchase_price_summary": lambda: services.get_purchase_price_summary(from_date=month_ago),
+    }
+
+
+def public_functions():
+    return sorted(
+        name
+        for name, func in inspect.getmembers(services, inspect.isfunction)
+        if func.__module__ == "services" and not name.startswith("_")
+    )
+
+
+def _timed(name, call):
+    reference_cache.clear()
+    started = time.perf_counter()
+    if name in MUTATING:
+        try:
+            with db.transaction():
+                call()
+                raise _Rollback
+        except _Rollback:
+            pass
+    else:
+        call()
+    return (time.perf_counter() - started) * 1000
+
+
+def run(repeat=5, warmup=1, only=None, on_result=None):
+    """
+    Time every public services function against the configured database.
+
+    Reference caches are cleared before each run so timings reflect database
+    cost; writes are rolled back. Returns a results document for ``save``.
+    """
+    plan = call_plan(sample_ids())
+    names = [n for n in public_functions() if not only or n in only]
+    results = {}
+    skipped = []
+    for name in names:
+        call = plan.get(name)
+        if call is None:
+            skipped.append(name)
+            continue
+        try:
+            for _ in range(warmup):
+                _timed(name, call)
+            timings = [_timed(name, call) for _ in range(repeat)]
+        except Exception as exc:
+            results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+        else:
+            timings.sort()
+            results[name] = {
+                "runs": repeat,
+                "min_ms": round(timings[0], 3),
+                "median_ms": round(statistics.median(timings), 3),
+                "mean_ms": round(statistics.fmean(timings), 3),
+                "max_ms": round(timings[-1], 3),
+            }
+        if on_result:
+            on_result(name, results[name])
+    return {"meta": _meta(repeat), "results": results, "skipped": skipped}
+
+
+def _meta(repeat):
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    counts = db.fetch_one(
+        """
+        SELECT (SELECT COUNT(*) FROM products) AS products,
+               (SELECT COUNT(*) FROM stock) AS stock_batches,
+               (SELECT COUNT(*) FROM sales) AS sales,
+               (SELECT COUNT(*) FROM purchases) AS purchases
+        """
+    )
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "rows": counts,
+    }
+
+
+def save(document, path):
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(document, handle, indent=2, default=str)
+
+
+def compare(baseline, current):
+    """Rows of (function, baseline median, current median, ratio) for functions in both runs."""
+    rows = []
+    for name, result in sorted(current["results"].items()):
+        before = baseline["results"].get(name, {})
+        if "median_ms" in result and "median_ms" in before:
+            ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+            rows.append((name, before["median_ms"], result["median_ms"], ratio))
+    return rows
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import db
+
+GENERATION_SQL = "SELECT generation FROM cache_generations WHERE namespace = %s"
+BUMP_GENERATION_SQL = db.upsert_sql(
+    "cache_generations", ("namespace", "generation"), keys=("namespace",), add=("generation",)
+)
+
+
+class QueryCache:
+    """
+    Bounded, TTL-limited cache for reference-data lookups.
+
+    Entries are grouped by namespace (e.g. "products") and service functions that
+    write a table invalidate its namespace. Invalidation also bumps the
+    namespace's row in cache_generations, and every lookup compares that
+    counter with the one its entry was loaded under, so a write made by any
+    process (the app, the API, manage.py) is seen by all of them on their next
+    lookup, at the cost of one primary-key read. A load that raced with an
+    invalidation is not stored, and reads inside a transaction (or under
+    db.explain_plans) bypass the cache so uncommitted rows are never cached.
+    Loads read from the primary, never a read replica.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, maxsize=256, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _get(self, key, shared):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[2] == shared:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self._stats["misses"] += 1
+            return False, None
+
+    def _put(self, key, value, generation, shared):
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value, shared)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def cached(self, namespace):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.ttl <= 0 or db.in_transaction() or db.explaining():
+                    return func(*args, **kwargs)
+                key = (namespace, func.__name__, args, tuple(sorted(kwargs.items())))
+                # From the primary: a lagging replica could refill the cache
+                # with rows older than the invalidation that emptied it.
+                with db.primary_reads():
+                    shared = self._shared_generation(namespace)
+                    hit, value = self._get(key, shared)
+                    if hit:
+                        return value
+                    generation = self._generations.get(namespace, 0)
+                    value = func(*args, **kwargs)
+                self._put(key, value, generation, shared)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _shared_generation(namespace):
+        row = db.fetch_one(GENERATION_SQL, (namespace,))
+        return row["generation"] if row else 0
+
+    def _drop(self, namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [k for k in self._entries if k[0] in namespaces]:
+                del self._entries[key]
+            self._stats["invalidations"] += 1
+
+    def invalidate(self, *namespaces):
+        """
+        Drop the given namespaces now, and again once any open transaction
+        commits, and bump their shared generations for other processes.
+        """
+        db.execute_many(BUMP_GENERATION_SQL, [(namespace, 1) for namespace in sorted(namespaces)])
+        self._drop(namespaces)
+        if db.in_transaction():
+            db.on_commit(lambda: self._drop(namespaces))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+reference_cache = QueryCache(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", 256)),
+    ttl=float(os.getenv("CACHE_TTL", 300)),
+)
@@ -0,0 +1,63 @@
+class CategoryTree:
+    """
+    Parent -> children index over category rows, built once and queried in memory.
+    Handles any nesting depth; rows whose parent is missing are treated as roots.
+    """
+
+    def __init__(self, categories):
+        self.nodes = {c["category_id"]: c for c in categories}
+        self._children = {}
+        for category in sorted(categories, key=lambda c: c["name"]):
+            parent_id = category.get("parent_category_id")
+            if parent_id not in self.nodes:
+                parent_id = None
+            self._children.setdefault(parent_id, []).append(category["category_id"])
+
+    def roots(self):
+        return [self.nodes[i] for i in self._children.get(None, [])]
+
+    def children(self, category_id):
+        return [self.nodes[i] for i in self._children.get(category_id, [])]
+
+    def descendants(self, category_id, include_self=True):
+        """Ids of the subtree under ``category_id`` in depth-first order."""
+        ids = []
+        stack = [category_id]
+        while stack:
+            current = stack.pop()
+            if current != category_id or include_self:
+                ids.append(current)
+            stack.extend(reversed(self._children.get(current, [])))
+        return ids
+
+    def path(self, category_id):
+        """Nodes from the root down to ``category_id``."""
+        path = []
+        seen = set()
+        current = category_id
+        while current in self.nodes and current not in seen:
+            seen.add(current)
+            path.append(self.nodes[current])
+            current = self.nodes[current].get("parent_category_id")
+        return list(reversed(path))
+
+    def label(self, category_id):
+        return " -> ".join(node["name"] for node in self.path(category_id))
+
+    def walk(self):
+        """All nodes, parents before children."""
+        for root in self.roots():
+            for category_id in self.descendants(root["category_id"]):
+                yield self.nodes[category_id]
+
+    def rollup(self, values, fields):
+        """
+        Sum per-category ``values`` ({category_id: {field: number}}) into every
+        ancestor, returning totals for each category including its subtree.
+        """
+        totals = {category_id: {f: 0 for f in fields} for category_id in self.nodes}
+        for category_id, row in values.items():
+            for node in self.path(category_id):
+                for f in fields:
+                    totals[node["category_id"]][f] += row.get(f) or 0
+        return totals
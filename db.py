@@ -1,13 +1,25 @@
+import logging
 import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
 from contextlib import contextmanager
 
 from dotenv import load_dotenv
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errors
+
+from query_stats import QueryStats
+import sqlite_backend
 
 # Load .env if present
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 def load_db_config():
     """
@@ -23,39 +35,787 @@ def load_db_config():
     }
 
 
+BACKENDS = ("mysql", "sqlite")
+
+
+def backend():
+    """DB_BACKEND: ``mysql`` (default) or ``sqlite`` for an embedded database file."""
+    name = os.getenv("DB_BACKEND", "mysql").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DB_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+def load_sqlite_config():
+    """
+    DB_PATH: database file, created on first use (default inventory.db).
+    DB_BUSY_TIMEOUT_MS: how long a writer waits for the write lock.
+    """
+    return {
+        "path": os.getenv("DB_PATH", "inventory.db"),
+        "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000)),
+    }
+
+
+def connect():
+    """Open a new connection to the configured backend."""
+    if backend() == "sqlite":
+        return sqlite_backend.connect(**load_sqlite_config())
+    return mysql.connector.connect(**load_db_config())
+
+
+# Driver errors that leave the current statement or transaction failed.
+DB_ERRORS = (Error, sqlite3.Error)
+# Constraint violations, e.g. a foreign key naming a row that does not exist.
+INTEGRITY_ERRORS = (errors.IntegrityError, sqlite3.IntegrityError)
+
+
+def upsert_sql(table, columns, keys, add=(), replace=()):
+    """
+    INSERT one row of ``columns``; when it clashes with an existing row on the
+    unique ``keys``, add the new values of ``add`` columns to the stored ones
+    and overwrite ``replace`` columns instead.
+    """
+    assignments = []
+    if backend() == "sqlite":
+        assignments += [f"{c} = {c} + excluded.{c}" for c in add]
+        assignments += [f"{c} = excluded.{c}" for c in replace]
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+    else:
+        assignments += [f"{c} = {c} + VALUES({c})" for c in add]
+        assignments += [f"{c} = VALUES({c})" for c in replace]
+        conflict = "ON DUPLICATE KEY UPDATE "
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        + conflict
+        + ", ".join(assignments)
+    )
+
+
+def days_between_sql(later, earlier):
+    """SQL expression for the whole days from date column ``earlier`` to ``later``."""
+    if backend() == "sqlite":
+        return f"CAST(julianday({later}) - julianday({earlier}) AS INTEGER)"
+    return f"DATEDIFF({later}, {earlier})"
+
+
+def load_pool_config():
+    """
+    Load connection pool settings from environment variables.
+    DB_POOL_SIZE: maximum open connections (0 disables pooling).
+    DB_POOL_TIMEOUT: seconds to wait for a free connection before failing.
+    DB_POOL_RECYCLE: seconds after which a connection is closed and reopened.
+    DB_POOL_PING_AFTER: idle seconds after which a connection is pinged on checkout.
+    """
+    return {
+        "size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "recycle": float(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "ping_after": float(os.getenv("DB_POOL_PING_AFTER", 30)),
+    }
+
+
+class PoolTimeout(Error):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections opened by ``connect``.
+
+    Connections are opened lazily up to ``size``. Idle connections older than
+    ``recycle`` seconds are replaced, and connections idle for more than
+    ``ping_after`` seconds are pinged before being handed out so a dropped
+    server connection never reaches a query.
+    """
+
+    def __init__(self, connect, size=5, timeout=30.0, recycle=1800.0, ping_after=30.0):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._born = {}
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "health_check_failures": 0,
+            "connections_discarded": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _create(self):
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        self._born[id(conn)] = time.monotonic()
+        self._count("connections_created")
+        return conn
+
+    def _close(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except DB_ERRORS:
+            pass
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._open < self.size:
+                self._open += 1
+                return True
+        return False
+
+    def _checked(self, conn, idle_since):
+        now = time.monotonic()
+        if now - self._born.get(id(conn), now) > self.recycle:
+            self._close(conn)
+            self._count("connections_recycled")
+            return self._create()
+        if now - idle_since > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except DB_ERRORS:
+                self._close(conn)
+                self._count("health_check_failures")
+                return self._create()
+        return conn
+
+    def acquire(self):
+        try:
+            conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                conn = self._create()
+                self._count("checkouts")
+                return conn
+            started = time.monotonic()
+            try:
+                conn, idle_since = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeout(
+                    f"No database connection available after {self.timeout:.1f}s (pool size {self.size})"
+                )
+            finally:
+                waited = time.monotonic() - started
+                with self._lock:
+                    self._stats["waits"] += 1
+                    self._stats["wait_time"] += waited
+        conn = self._checked(conn, idle_since)
+        self._count("checkouts")
+        return conn
+
+    def release(self, conn):
+        self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._open -= 1
+            self._stats["connections_discarded"] += 1
+
+    def close_idle(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open"] = self._open
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        stats["size"] = self.size
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use (None when disabled)."""
+    global _pool
+    if _pool is None:
+        settings = load_pool_config()
+        if settings["size"] <= 0:
+            return None
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(connect, **settings)
+    return _pool
+
+
+def reset_pool():
+    """Close idle pooled connections and rebuild the pools from current settings."""
+    global _pool, _router
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_idle()
+        _pool = None
+        if _router is not None:
+            _router.close_idle()
+        _router = None
+
+
+def pool_stats():
+    pool = get_pool()
+    return pool.stats() if pool is not None else {}
+
+
 @contextmanager
 def get_connection():
-    conn = None
+    with _pooled_connection(get_pool(), connect) as conn:
+        yield conn
+
+
+@contextmanager
+def _pooled_connection(pool, connect):
+    if pool is None:
+        conn = None
+        try:
+            conn = connect()
+            yield conn
+        finally:
+            if conn:
+                conn.close()
+        return
+
+    conn = pool.acquire()
     try:
-        conn = mysql.connector.connect(**load_db_config())
         yield conn
+    except (errors.InterfaceError, errors.OperationalError):
+        # The connection may be unusable; never hand it to another caller.
+        pool.discard(conn)
+        conn = None
+        raise
     finally:
-        if conn:
-            conn.close()
+        if conn is not None:
+            pool.release(conn)
+
+
+def load_replica_config():
+    """
+    DB_READ_REPLICAS: comma-separated read replicas that fetch_all, fetch_one
+        and iter_batches are spread across, as ``host[:port]`` for MySQL (same
+        user, password and database as the primary) or database file paths
+        for SQLite. Empty (the default) sends every read to the primary.
+    DB_READ_YOUR_WRITES_SECONDS: how long a session that wrote keeps reading
+        from the primary, so it never sees a replica that has not caught up.
+    DB_REPLICA_RETRY_SECONDS: how long a replica that failed is left out.
+    """
+    return {
+        "replicas": [r.strip() for r in os.getenv("DB_READ_REPLICAS", "").split(",") if r.strip()],
+        "pin_seconds": float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5)),
+        "retry_seconds": float(os.getenv("DB_REPLICA_RETRY_SECONDS", 30)),
+    }
+
+
+def replica_connect(address):
+    """Return a function opening a new connection to the replica at ``address``."""
+    if backend() == "sqlite":
+        settings = dict(load_sqlite_config(), path=address)
+        return lambda: sqlite_backend.connect(**settings)
+    host, _, port = address.partition(":")
+    settings = dict(load_db_config(), host=host)
+    if port:
+        settings["port"] = int(port)
+    return lambda: mysql.connector.connect(**settings)
+
+
+# Errors that mean a replica is unreachable or unusable rather than that the
+# statement is wrong; the read is retried on the primary. sqlite3 raises the
+# same OperationalError for a bad statement as for an unreadable file, so
+# SQLite errors also have to match SQLITE_REPLICA_DOWN (see replica_down).
+REPLICA_ERRORS = (errors.InterfaceError, errors.OperationalError, sqlite3.DatabaseError, PoolTimeout)
+SQLITE_REPLICA_DOWN = re.compile(
+    r"unable to open|disk I/O error|database is locked|file is not a database|malformed", re.IGNORECASE
+)
+
+
+def replica_down(exc):
+    """Whether ``exc``, one of REPLICA_ERRORS, means the replica itself failed."""
+    if isinstance(exc, sqlite3.Error):
+        return SQLITE_REPLICA_DOWN.search(str(exc)) is not None
+    return True
+
+
+class ReadRouter:
+    """
+    Chooses where reads outside a transaction run.
+
+    Replicas are taken round-robin, skipping any that failed in the last
+    ``retry_seconds``. A session that committed a write in the last
+    ``pin_seconds`` reads from the primary so it always sees its own writes;
+    other sessions may briefly see replica lag.
+    """
+
+    def __init__(self, replicas, pin_seconds=5.0, retry_seconds=30.0, pool_settings=None):
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self.replicas = []
+        for address in replicas:
+            connect = replica_connect(address)
+            pool = None
+            if pool_settings and pool_settings["size"] > 0:
+                pool = ConnectionPool(connect, **pool_settings)
+            self.replicas.append({"address": address, "connect": connect, "pool": pool})
+        self._turn = 0
+        self._down_until = {}
+        self._pinned_until = {}
+        self._lock = threading.Lock()
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "pinned_reads": 0, "replica_failures": 0}
+
+    def record_write(self, session):
+        now = time.monotonic()
+        with self._lock:
+            self._pinned_until[session] = now + self.pin_seconds
+            if len(self._pinned_until) > 1024:
+                self._pinned_until = {k: t for k, t in self._pinned_until.items() if t > now}
+
+    def choose(self, session):
+        """The replica for the next read, or None to read from the primary."""
+        now = time.monotonic()
+        with self._lock:
+            if self._pinned_until.get(session, 0) > now:
+                self._stats["pinned_reads"] += 1
+                return None
+            for _ in range(len(self.replicas)):
+                replica = self.replicas[self._turn % len(self.replicas)]
+                self._turn += 1
+                if self._down_until.get(replica["address"], 0) <= now:
+                    self._stats["replica_reads"] += 1
+                    return replica
+            self._stats["primary_reads"] += 1
+            return None
+
+    def failed(self, replica, exc):
+        logger.warning("Read replica %s failed, reading from the primary: %s", replica["address"], exc)
+        with self._lock:
+            self._down_until[replica["address"]] = time.monotonic() + self.retry_seconds
+            self._stats["replica_failures"] += 1
+            self._stats["replica_reads"] -= 1
+            self._stats["primary_reads"] += 1
+
+    def connection(self, replica):
+        return _pooled_connection(replica["pool"], replica["connect"])
+
+    def close_idle(self):
+        for replica in self.replicas:
+            if replica["pool"] is not None:
+                replica["pool"].close_idle()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pinned_sessions"] = sum(1 for t in self._pinned_until.values() if t > now)
+            down = {a for a, t in self._down_until.items() if t > now}
+        stats["replicas"] = [
+            {
+                "address": r["address"],
+                "up": r["address"] not in down,
+                **(r["pool"].stats() if r["pool"] is not None else {}),
+            }
+            for r in self.replicas
+        ]
+        return stats
+
+
+_router = None
+
+
+def get_router():
+    """Return the process-wide read router (None when no replicas are configured)."""
+    global _router
+    if _router is None:
+        settings = load_replica_config()
+        if not settings["replicas"]:
+            return None
+        with _pool_lock:
+            if _router is None:
+                _router = ReadRouter(pool_settings=load_pool_config(), **settings)
+    return _router
+
+
+def replica_stats():
+    router = get_router()
+    return router.stats() if router is not None else {}
+
+
+_local = threading.local()
+
+
+@contextmanager
+def session(key):
+    """
+    Attribute the queries in the block to ``key`` (e.g. a UI or API client
+    session) for read-your-writes routing. Without one each thread is its
+    own session.
+    """
+    previous = getattr(_local, "session", None)
+    _local.session = key
+    try:
+        yield
+    finally:
+        _local.session = previous
+
+
+def _session():
+    key = getattr(_local, "session", None)
+    return key if key is not None else ("thread", threading.get_ident())
+
+
+@contextmanager
+def primary_reads():
+    """Send every read in the block to the primary."""
+    _local.primary = getattr(_local, "primary", 0) + 1
+    try:
+        yield
+    finally:
+        _local.primary -= 1
+
+
+def _record_write():
+    router = get_router()
+    if router is not None:
+        router.record_write(_session())
+
+
+def _read_replica():
+    """The replica a read outside a transaction should use, or None for the primary."""
+    router = get_router()
+    if router is None or getattr(_local, "primary", 0):
+        return None
+    return router.choose(_session())
+
+
+def in_transaction():
+    return getattr(_local, "conn", None) is not None
+
+
+def explaining():
+    return getattr(_local, "explain", None) is not None
+
+
+@contextmanager
+def explain_plans():
+    """
+    Within the block, run_query/fetch_* record ``EXPLAIN`` output for each
+    statement instead of executing it, and return empty results. Yields the
+    list of ``{"query": ..., "plan": [...]}`` entries collected.
+    """
+    plans = []
+    _local.explain = plans
+    try:
+        yield plans
+    finally:
+        _local.explain = None
+
+
+def _explain(query, params):
+    prefix = "EXPLAIN QUERY PLAN " if backend() == "sqlite" else "EXPLAIN "
+    if in_transaction():
+        plan, _ = _execute(_local.conn, prefix + query, params, "all")
+    else:
+        with get_connection() as conn:
+            plan, _ = _execute(conn, prefix + query, params, "all")
+            conn.commit()
+    _local.explain.append({"query": query, "plan": plan})
+
+
+def on_commit(callback):
+    """Run ``callback`` after the current transaction commits, or now if there is none."""
+    if in_transaction():
+        _local.on_commit.append(callback)
+    else:
+        callback()
+
+
+@contextmanager
+def transaction(readonly=False):
+    """
+    Run every query issued inside the block on one connection with one commit.
+
+    Nested calls join the outermost transaction. Any exception rolls the whole
+    unit of work back and is re-raised. ``readonly`` starts a READ ONLY
+    transaction so a group of reports shares one consistent snapshot. On
+    SQLite write transactions take the database write lock up front.
+    """
+    if in_transaction():
+        yield _local.conn
+        return
+    with get_connection() as conn:
+        if readonly or backend() == "sqlite":
+            conn.start_transaction(readonly=readonly)
+        _local.conn = conn
+        _local.on_commit = []
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _local.conn = None
+        if not readonly:
+            _record_write()
+        callbacks, _local.on_commit = _local.on_commit, []
+        for callback in callbacks:
+            callback()
+
+
+def load_instrumentation_config():
+    """
+    DB_QUERY_STATS: set to 0 to stop collecting per-statement statistics.
+    DB_SLOW_QUERY_MS: statements slower than this are logged with their parameters.
+    """
+    return {
+        "enabled": os.getenv("DB_QUERY_STATS", "1") != "0",
+        "slow_query_ms": float(os.getenv("DB_SLOW_QUERY_MS", 500)),
+    }
+
+
+query_stats = QueryStats()
+_hooks = []
+_instrumentation = load_instrumentation_config()
+
+
+def add_query_hook(hook):
+    """Call ``hook(query, params, elapsed_ms, rows, caller)`` after every statement."""
+    _hooks.append(hook)
+
+
+def remove_query_hook(hook):
+    _hooks.remove(hook)
+
+
+def _caller():
+    # The first frame outside this module and the decorators wrapping services.
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        if module not in (__name__, "contextlib", "cache"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _record(query, params, elapsed_ms, rows):
+    if not _hooks:
+        return
+    caller = _caller()
+    for hook in list(_hooks):
+        hook(query, params, elapsed_ms, rows, caller)
+
+
+def _log_slow_query(query, params, elapsed_ms, rows, caller):
+    if elapsed_ms < _instrumentation["slow_query_ms"]:
+        return
+    if "password" in query.lower():
+        params = "<redacted>"
+    logger.warning(
+        "Slow query %.1f ms (%s rows) from %s: %s params=%r",
+        elapsed_ms, rows, caller, " ".join(query.split()), params,
+    )
+
+
+if _instrumentation["enabled"]:
+    add_query_hook(query_stats.record)
+add_query_hook(_log_slow_query)
+
+
+def _execute(conn, query, params, fetch):
+    # Buffered so a partially read result never lingers on a pooled connection.
+    cur = conn.cursor(dictionary=True, buffered=True)
+    started = time.perf_counter()
+    try:
+        cur.execute(query, params)
+        result = None
+        if fetch == "one":
+            result = cur.fetchone()
+            rows = 1 if result else 0
+        elif fetch == "all":
+            result = cur.fetchall()
+            rows = len(result)
+        else:
+            rows = cur.rowcount
+        _record(query, params, (time.perf_counter() - started) * 1000, rows)
+        return result, cur.lastrowid
+    finally:
+        cur.close()
+
+
+def _execute_many(conn, query, seq_params):
+    cur = conn.cursor()
+    started = time.perf_counter()
+    try:
+        cur.executemany(query, seq_params)
+        _record(query, seq_params, (time.perf_counter() - started) * 1000, cur.rowcount)
+        return cur.rowcount
+    finally:
+        cur.close()
+
+
+def execute_many(query, seq_params):
+    """Run one statement for every parameter tuple, batched by the driver where it can."""
+    seq_params = list(seq_params)
+    if not seq_params:
+        return 0
+    if explaining():
+        _explain(query, seq_params[0])
+        return 0
+    if in_transaction():
+        return _execute_many(_local.conn, query, seq_params)
+    with get_connection() as conn:
+        try:
+            rowcount = _execute_many(conn, query, seq_params)
+            conn.commit()
+        except DB_ERRORS as exc:
+            conn.rollback()
+            raise exc
+    _record_write()
+    return rowcount
 
 
 def run_query(query, params=None, fetch=None, return_lastrowid=False):
+    """Run a statement on the primary; outside a transaction it commits and counts as a write."""
     params = params or ()
+    if explaining():
+        _explain(query, params)
+        if return_lastrowid:
+            return 0
+        # Empty stand-ins so callers that post-process results keep running.
+        return {} if fetch == "one" else []
+    if in_transaction():
+        result, lastrowid = _execute(_local.conn, query, params, fetch)
+        return lastrowid if return_lastrowid else result
     with get_connection() as conn:
         try:
-            cur = conn.cursor(dictionary=True)
-            cur.execute(query, params)
-            result = None
-            if fetch == "one":
-                result = cur.fetchone()
-            elif fetch == "all":
-                result = cur.fetchall()
-            lastrowid = cur.lastrowid
+            result, lastrowid = _execute(conn, query, params, fetch)
             conn.commit()
-            return lastrowid if return_lastrowid else result
-        except Error as exc:
+        except DB_ERRORS as exc:
             conn.rollback()
             raise exc
+    _record_write()
+    return lastrowid if return_lastrowid else result
+
+
+def _fetch(conn, query, params, fetch):
+    try:
+        result, _ = _execute(conn, query, params, fetch)
+        conn.commit()
+        return result
+    except DB_ERRORS:
+        conn.rollback()
+        raise
+
+
+def _read(query, params, fetch):
+    params = params or ()
+    if explaining() or in_transaction():
+        return run_query(query, params, fetch=fetch)
+    replica = _read_replica()
+    if replica is not None:
+        try:
+            with get_router().connection(replica) as conn:
+                return _fetch(conn, query, params, fetch)
+        except REPLICA_ERRORS as exc:
+            if not replica_down(exc):
+                raise
+            get_router().failed(replica, exc)
+    with get_connection() as conn:
+        return _fetch(conn, query, params, fetch)
+
+
+def iter_batches(query, params=None, batch_size=1000, columns=None):
+    """
+    Yield lists of up to ``batch_size`` rows from an unbuffered cursor so large
+    results never sit in memory at once. Uses its own connection, on a replica
+    when one is configured, so it does not see uncommitted writes of an
+    enclosing transaction. ``columns``, if given, is a list that receives the
+    result's column names once the query runs, even when no rows come back.
+    """
+    params = params or ()
+    if explaining():
+        _explain(query, params)
+        return
+    replica = None if in_transaction() else _read_replica()
+    if replica is not None:
+        streamed = False
+        try:
+            for rows in _stream(get_router().connection(replica), query, params, batch_size, columns):
+                streamed = True
+                yield rows
+            return
+        except REPLICA_ERRORS as exc:
+            # Only a replica that fails before the first batch can be swapped for the primary.
+            if streamed or not replica_down(exc):
+                raise
+            get_router().failed(replica, exc)
+    yield from _stream(get_connection(), query, params, batch_size, columns)
+
+
+def _stream(connection, query, params, batch_size, columns=None):
+    with connection as conn:
+        cur = conn.cursor(dictionary=True)
+        fetch_ms = 0.0
+        total_rows = 0
+        started = time.perf_counter()
+        try:
+            cur.execute(query, params)
+            if columns is not None:
+                columns[:] = cur.column_names
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                total_rows += len(rows)
+                fetch_ms += (time.perf_counter() - started) * 1000
+                yield rows
+                started = time.perf_counter()
+        finally:
+            # Time spent by the consumer between batches is not charged to the query.
+            fetch_ms += (time.perf_counter() - started) * 1000
+            _record(query, params, fetch_ms, total_rows)
+            # Drain anything left by an early exit before the connection is reused.
+            if conn.unread_result:
+                conn.consume_results()
+            cur.close()
+            conn.commit()
+
+
+def analyze_tables(tables):
+    """Refresh optimizer statistics, e.g. after a bulk load changes table sizes by orders of magnitude."""
+    if backend() == "sqlite":
+        for table in tables:
+            run_query(f"ANALYZE {table}")
+    else:
+        run_query(f"ANALYZE TABLE {', '.join(tables)}", fetch="all")
+
+
+def query_stats_snapshot(order_by="total_ms", limit=None):
+    return query_stats.snapshot(order_by=order_by, limit=limit)
 
 
 def fetch_all(query, params=None):
-    return run_query(query, params=params, fetch="all")
+    return _read(query, params, "all")
 
 
 def fetch_one(query, params=None):
-    return run_query(query, params=params, fetch="one")
+    return _read(query, params, "one")
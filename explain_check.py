@@ -0,0 +1,128 @@
+import re
+from datetime import date, timedelta
+
+import db
+import services
+
+
+# (label, call, aliases allowed to full-scan). Allowances are for queries that
+# return or aggregate a whole table by design; anything else scanning is a regression.
+# Plans depend on table sizes, so run this against a realistically sized database.
+REPLAY_TABLES = {"purchases", "sales_daily", "stock_archive", "products"}
+
+
+def _checks():
+    recent = date.today() - timedelta(days=30)
+    batch = {"product_id": 1, "supplier_id": 1, "expiry_date": date.today()}
+    return [
+        ("list_categories", lambda: services.list_categories(), set()),
+        ("list_categories(parent)", lambda: services.list_categories(1), set()),
+        ("list_all_categories", lambda: services.list_all_categories(), {"c"}),
+        ("get_category_tree", lambda: services.get_category_tree(), {"categories"}),
+        ("list_products", lambda: services.list_products(), {"p"}),
+        ("get_product", lambda: services.get_product(1), set()),
+        # Category names are matched against list_all_categories, which the reference cache serves.
+        ("search_products(prefix)", lambda: services.search_products("a"), {"c"}),
+        ("search_products(words)", lambda: services.search_products("product 12"), {"c"}),
+        ("search_products(category)", lambda: services.search_products("category"), {"c"}),
+        ("list_suppliers", lambda: services.list_suppliers(), {"suppliers"}),
+        ("list_customers", lambda: services.list_customers(), {"customers"}),
+        ("lock_stock_totals", lambda: services.lock_stock_totals([1, 2]), set()),
+        ("lock_stock_batches", lambda: services.lock_stock_batches(1, 1), set()),
+        ("apply_stock_deductions", lambda: services.apply_stock_deductions([(batch, 1)]), set()),
+        ("get_current_stock", lambda: services.get_current_stock(), {"s"}),
+        # Each product has its own reorder point, so every stock total is compared.
+        ("get_low_stock", lambda: services.get_low_stock(5), {"t", "m"}),
+        # Picks low-stock products the same way as get_low_stock, then reads their purchases by index.
+        ("get_purchase_suggestions", lambda: services.get_purchase_suggestions(5), {"t", "m"}),
+        ("get_product_stock", lambda: services.get_product_stock(1), set()),
+        ("get_near_expiry", lambda: services.get_near_expiry(30), set()),
+        ("get_expired", lambda: services.get_expired(), set()),
+        # The daily sweep reads all of stock by design; an index on quantity would tax every sale.
+        ("sweep_stock", lambda: services.sweep_stock(), {"stock"}),
+        ("get_stock_write_offs(range)", lambda: services.get_stock_write_offs(from_date=recent), set()),
+        # As get_low_stock, plus entity counts that read every product row.
+        ("get_dashboard_summary", lambda: services.get_dashboard_summary(5), {"t", "m", "products"}),
+        ("get_sales_report(page)", lambda: services.get_sales_report(limit=50), set()),
+        # With a date range SQLite may drive from products (one row each) and read only the range
+        # through idx_sales_product_date / idx_purchases_product_date; no history table is scanned.
+        ("get_sales_report(range)", lambda: services.get_sales_report(limit=50, from_date=recent), {"m"}),
+        ("get_sales_report(customer)", lambda: services.get_sales_report(limit=50, customer_id=1), set()),
+        ("get_purchase_report(page)", lambda: services.get_purchase_report(limit=50), set()),
+        ("get_purchase_report(range)", lambda: services.get_purchase_report(limit=50, from_date=recent), {"m"}),
+        ("get_sale_price_summary(range)", lambda: services.get_sale_price_summary(from_date=recent), set()),
+        ("get_purchase_price_summary(range)", lambda: services.get_purchase_price_summary(from_date=recent), set()),
+        ("get_sales_trend", lambda: services.get_sales_trend(), set()),
+        ("get_sales_trend(product)", lambda: services.get_sales_trend(product_id=1), set()),
+        # The FEFO replay reads the whole history up to its end date by design.
+        ("get_margin_report", lambda: services.get_margin_report(), REPLAY_TABLES),
+        ("get_inventory_valuation", lambda: services.get_inventory_valuation(), REPLAY_TABLES),
+        ("get_margin_overview", lambda: services.get_margin_overview(), REPLAY_TABLES),
+        # Totals for every category: every product and its stock total are read by design.
+        (
+            "get_category_rollups(range)",
+            lambda: services.get_category_rollups(from_date=recent),
+            {"t", "m", "categories"},
+        ),
+    ]
+
+
+# SQLite EXPLAIN QUERY PLAN rows: "SCAN x" reads all of x, "SCAN x USING INDEX ..." and
+# "SEARCH x ..." do not; x scanned after "CO-ROUTINE x"/"MATERIALIZE x" is a derived table.
+SQLITE_SCAN = re.compile(r"^SCAN (\w+)$")
+SQLITE_DERIVED = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+SQLITE_LOOP = re.compile(r"^(?:SCAN|SEARCH) ")
+LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+def scanned_table(row):
+    """Table or alias a plan row reads, for MySQL EXPLAIN and SQLite EXPLAIN QUERY PLAN rows."""
+    if "detail" in row:
+        return row["detail"].split(" ")[1] if " " in row["detail"] else row["detail"]
+    return str(row.get("table"))
+
+
+def limited_walk(plan, query):
+    """
+    The SQLite plan row that walks the driving table in ORDER BY order and
+    stops at the query's LIMIT (e.g. ``ORDER BY sale_id DESC LIMIT 50`` over
+    the rowid), or None. SQLite reports such a walk as a plain "SCAN x". Only
+    unfiltered queries qualify: with a WHERE clause the walk may read far
+    more than LIMIT rows before enough match.
+    """
+    sorts = any(row["detail"] == "USE TEMP B-TREE FOR ORDER BY" for row in plan)
+    if not LIMIT.search(query) or WHERE.search(query) or sorts:
+        return None
+    loops = [row for row in plan if row["parent"] == 0 and SQLITE_LOOP.match(row["detail"])]
+    return loops[0] if loops and SQLITE_SCAN.match(loops[0]["detail"]) else None
+
+
+def full_scans(plan, allowed, query=""):
+    """Return plan rows that read a whole table not listed in ``allowed``."""
+    if plan and "detail" in plan[0]:
+        derived = {m.group(1) for m in (SQLITE_DERIVED.match(row["detail"]) for row in plan) if m}
+        walk = limited_walk(plan, query)
+        scans = [(row, SQLITE_SCAN.match(row["detail"])) for row in plan if row is not walk]
+        return [row for row, m in scans if m and m.group(1) not in derived and m.group(1) not in allowed]
+    return [
+        row
+        for row in plan
+        if row.get("type") == "ALL"
+        and not str(row.get("table", "")).startswith("<")
+        and row.get("table") not in allowed
+    ]
+
+
+def run_checks():
+    """EXPLAIN every registered service query; returns a list of (label, query, offending rows)."""
+    failures = []
+    for label, call, allowed in _checks():
+        with db.explain_plans() as plans:
+            with db.transaction():
+                call()
+        for entry in plans:
+            offending = full_scans(entry["plan"], allowed, entry["query"])
+            if offending:
+                failures.append((label, entry["query"], offending))
+    return failures
@@ -0,0 +1,108 @@
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import services
+
+
+REPORTS = {
+    "sales": services.iter_sales_report,
+    "purchases": services.iter_purchase_report,
+    "stock": services.iter_current_stock,
+}
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def write_csv(batches, fileobj, columns=()):
+    """``columns`` names the header when ``batches`` turns out to be empty."""
+    writer = None
+    count = 0
+    for rows in batches:
+        if writer is None:
+            writer = csv.DictWriter(fileobj, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+        writer.writerows(rows)
+        count += len(rows)
+    if writer is None and columns:
+        csv.DictWriter(fileobj, fieldnames=list(columns)).writeheader()
+    return count
+
+
+def write_jsonl(batches, fileobj):
+    count = 0
+    for rows in batches:
+        fileobj.write("".join(json.dumps(row, default=json_default) + "\n" for row in rows))
+        count += len(rows)
+    return count
+
+
+def _parquet_schema(table):
+    import pyarrow as pa
+
+    fields = []
+    for field in table.schema:
+        if pa.types.is_null(field.type):
+            # A column that is NULL throughout the first batch (e.g. a missing subcategory).
+            field = field.with_type(pa.string())
+        elif pa.types.is_decimal(field.type):
+            field = field.with_type(pa.decimal128(38, field.type.scale))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def write_parquet(batches, fileobj, columns=()):
+    """
+    ``columns`` names the columns of an empty export, which is written as a
+    schema-only file of string columns since no row shows their types.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    count = 0
+    try:
+        for rows in batches:
+            if writer is None:
+                schema = _parquet_schema(pa.Table.from_pylist(rows))
+                writer = pq.ParquetWriter(fileobj, schema)
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+        if writer is None:
+            schema = pa.schema([(name, pa.string()) for name in columns])
+            writer = pq.ParquetWriter(fileobj, schema)
+            writer.write_table(schema.empty_table())
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export_report(report, fmt, path, batch_size=1000, **filters):
+    """
+    Stream ``report`` (a key of REPORTS) to ``path`` as csv, jsonl or parquet,
+    one fetch batch at a time. Returns the number of rows written.
+    """
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report {report!r}; choose from {', '.join(REPORTS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    # Filled in when the query runs, so an empty report still gets its header.
+    columns = []
+    batches = REPORTS[report](batch_size=batch_size, columns=columns, **filters)
+    if fmt == "parquet":
+        with open(path, "wb") as fileobj:
+            return write_parquet(batches, fileobj, columns)
+    with open(path, "w", newline="", encoding="utf-8") as fileobj:
+        if fmt == "csv":
+            return write_csv(batches, fileobj, columns)
+        return write_jsonl(batches, fileobj)
@@ -0,0 +1,122 @@
+import math
+import os
+from datetime import date, timedelta
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from db import execute_many, fetch_all, run_query, transaction
+
+
+REORDER_COLUMNS = (
+    "product_id",
+    "daily_demand",
+    "demand_std",
+    "lead_time_days",
+    "safety_stock",
+    "reorder_point",
+    "order_quantity",
+    "computed_on",
+)
+
+
+def load_forecast_config():
+    """
+    FORECAST_WINDOW_DAYS: days of sales history demand is measured over (default 90).
+    FORECAST_LEAD_TIME_DAYS: days between placing and receiving an order (default 7).
+    FORECAST_SERVICE_LEVEL: chance of not running out during a lead time (default 0.95).
+    FORECAST_COVER_DAYS: days of demand one suggested order covers (default 30).
+    """
+    return {
+        "window_days": int(os.getenv("FORECAST_WINDOW_DAYS", 90)),
+        "lead_time_days": int(os.getenv("FORECAST_LEAD_TIME_DAYS", 7)),
+        "service_level": float(os.getenv("FORECAST_SERVICE_LEVEL", 0.95)),
+        "cover_days": int(os.getenv("FORECAST_COVER_DAYS", 30)),
+    }
+
+
+def reorder_points(products, sale_product, sale_quantity, window_days, lead_time_days, service_level, cover_days):
+    """
+    Demand rate, variability, reorder point and order quantity for every id in
+    the sorted ``products`` array, from one (product, quantity) entry per
+    product and day with sales in the window.
+
+    Days without sales count as zero demand, so per-product sums and sums of
+    squares (``bincount``) give the daily mean and standard deviation without
+    building a product-by-day matrix. The reorder point covers mean demand
+    over the lead time plus safety stock of z * std * sqrt(lead time), with z
+    taken from ``service_level``.
+    """
+    if not 0 < service_level < 1:
+        raise ValueError("service_level must be between 0 and 1")
+    code = np.searchsorted(products, sale_product)
+    known = code < len(products)
+    known[known] = products[code[known]] == sale_product[known]
+    code, quantity = code[known], sale_quantity[known].astype(float)
+
+    total = np.bincount(code, weights=quantity, minlength=len(products))
+    squares = np.bincount(code, weights=quantity * quantity, minlength=len(products))
+    mean = total / window_days
+    variance = (squares - window_days * mean * mean) / max(window_days - 1, 1)
+    std = np.sqrt(np.clip(variance, 0, None))
+
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = np.ceil(z * std * math.sqrt(lead_time_days))
+    return {
+        "product_id": products,
+        "daily_demand": mean.round(4),
+        "demand_std": std.round(4),
+        "lead_time_days": np.full(len(products), lead_time_days),
+        "safety_stock": safety_stock.astype(np.int64),
+        "reorder_point": np.ceil(mean * lead_time_days + safety_stock).astype(np.int64),
+        "order_quantity": np.ceil(mean * cover_days).astype(np.int64),
+    }
+
+
+def compute(as_of=None, **overrides):
+    """
+    Reorder figures for every active product from the ``window_days`` of
+    sales_daily ending at ``as_of`` (default today), as a DataFrame.
+    Settings default to ``load_forecast_config``.
+    """
+    config = load_forecast_config()
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    as_of = as_of or date.today()
+    products = np.array(
+        [row["product_id"] for row in fetch_all("SELECT product_id FROM products WHERE is_deleted = 0")],
+        dtype=np.int64,
+    )
+    products.sort()
+    sales = pd.DataFrame(
+        fetch_all(
+            "SELECT product_id, quantity FROM sales_daily WHERE sale_date > %s AND sale_date <= %s",
+            (as_of - timedelta(days=config["window_days"]), as_of),
+        ),
+        columns=["product_id", "quantity"],
+    )
+    frame = pd.DataFrame(
+        reorder_points(
+            products,
+            sales["product_id"].to_numpy(dtype=np.int64),
+            sales["quantity"].to_numpy(dtype=float),
+            **config,
+        )
+    )
+    frame["computed_on"] = as_of
+    return frame
+
+
+def store(frame, chunk_size=1000):
+    """Replace the reorder_points table with ``frame`` in one transaction."""
+    # Series.tolist() yields plain Python scalars, which both drivers accept.
+    rows = list(zip(*(frame[column].tolist() for column in REORDER_COLUMNS)))
+    insert = (
+        f"INSERT INTO reorder_points ({', '.join(REORDER_COLUMNS)}) "
+        f"VALUES ({', '.join(['%s'] * len(REORDER_COLUMNS))})"
+    )
+    with transaction():
+        run_query("DELETE FROM reorder_points")
+        for start in range(0, len(rows), chunk_size):
+            execute_many(insert, rows[start:start + chunk_size])
+    return len(rows)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+# (weight, method, path template, body template). Reads dominate, as at a till.
+DEFAULT_MIX = [
+    (40, "GET", "/products/{product_id}", None),
+    (30, "GET", "/products/{product_id}/stock", None),
+    (10, "GET", "/reports/sales?limit=50", None),
+    (5, "GET", "/reports/low-stock", None),
+    (10, "POST", "/sales", {"product_id": "{product_id}", "customer_id": "{customer_id}", "quantity": 1}),
+    (5, "POST", "/purchases", {"product_id": "{product_id}", "supplier_id": "{supplier_id}", "quantity": 10}),
+]
+
+
+def _fill(template, ids):
+    if isinstance(template, str):
+        return int(template.format(**ids)) if template.startswith("{") else template.format(**ids)
+    if isinstance(template, dict):
+        return {key: _fill(value, ids) for key, value in template.items()}
+    return template
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection issuing requests one at a time."""
+
+    def __init__(self, host, port, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(payload)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + payload)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "connection" and value.strip().lower() == "close":
+                self.writer = None
+        await self.reader.readexactly(length)
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def wait_until_healthy(url, timeout=15.0, token=None):
+    target = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while True:
+        client = Client(target.hostname, target.port or 80, token)
+        try:
+            if await client.request("GET", "/health") == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            client.close()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"API at {url} did not become healthy within {timeout:.0f}s")
+        await asyncio.sleep(0.2)
+
+
+async def _worker(client, mix, ids, deadline, results):
+    weights = [weight for weight, *_ in mix]
+    while time.monotonic() < deadline:
+        _, method, path, body = random.choices(mix, weights)[0]
+        sample = {key: random.choice(values) for key, values in ids.items()}
+        started = time.perf_counter()
+        try:
+            status = await client.request(method, _fill(path, sample), _fill(body, sample))
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            client.close()
+            status = 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        results.append((f"{method} {path.split('?')[0]}", status, elapsed_ms))
+    client.close()
+
+
+def _percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarise(results, elapsed):
+    """Throughput and latency per endpoint and overall from (endpoint, status, ms) tuples."""
+    by_endpoint = {}
+    for endpoint, status, ms in results:
+        by_endpoint.setdefault(endpoint, []).append((status, ms))
+    by_endpoint["all"] = [(status, ms) for _, status, ms in results]
+    summary = {}
+    for endpoint, samples in sorted(by_endpoint.items()):
+        latencies = sorted(ms for _, ms in samples)
+        statuses = {}
+        for status, _ in samples:
+            statuses[status] = statuses.get(status, 0) + 1
+        summary[endpoint] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 1),
+            "statuses": statuses,
+            "mean_ms": round(statistics.fmean(latencies), 2),
+            "p50_ms": round(_percentile(latencies, 0.50), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "p99_ms": round(_percentile(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+    return summary
+
+
+async def run(url, ids, concurrency=200, duration=30.0, token=None, mix=None):
+    """
+    Drive ``concurrency`` keep-alive connections against the API for
+    ``duration`` seconds and return the summary. ``ids`` maps product_id,
+    customer_id and supplier_id to lists of ids to pick from.
+    """
+    target = urlsplit(url)
+    clients = [Client(target.hostname, target.port or 80, token) for _ in range(concurrency)]
+    results = []
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(_worker(c, mix or DEFAULT_MIX, ids, deadline, results) for c in clients))
+    return summarise(results, time.monotonic() - started)
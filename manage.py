@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+
+import api
+import bench
+import db
+import explain_check
+import exports
+import loadtest
+import migrate
+import rollups
+import seed
+import services
+
+
+def cmd_export(args):
+    filters = {}
+    if args.report != "stock":
+        filters = {"from_date": args.from_date, "to_date": args.to_date}
+    count = exports.export_report(args.report, args.format, args.output, batch_size=args.batch_size, **filters)
+    print(f"Exported {count} {args.report} rows to {args.output}")
+
+
+def cmd_stock_totals(args):
+    if args.action == "rebuild":
+        count = services.rebuild_stock_totals()
+        print(f"Rebuilt stock totals for {count} products")
+        return
+    mismatches = services.verify_stock_totals()
+    for row in mismatches:
+        print(f"product {row['product_id']}: stored {row['stored']} actual {row['actual']}")
+    print(f"{len(mismatches)} mismatched products")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def cmd_migrate(args):
+    if args.status:
+        pending = migrate.pending_migrations()
+        for version, name, _ in pending:
+            print(f"pending {version:03d} {name}")
+        print(f"{len(pending)} pending migrations")
+        return
+    applied = migrate.apply_migrations(
+        dry_run=args.dry_run,
+        on_apply=lambda version, name: print(f"{'would apply' if args.dry_run else 'applying'} {version:03d} {name}"),
+    )
+    print(f"{len(applied)} migrations {'pending' if args.dry_run else 'applied'}")
+
+
+def cmd_init_db(args):
+    if not args.yes:
+        raise SystemExit(f"init-db drops every table in the {db.backend()} database; pass --yes to continue")
+    path = migrate.init_schema()
+    print(f"Created schema from {os.path.basename(path)}")
+
+
+def cmd_sweep_stock(args):
+    report = services.sweep_stock(as_of=args.as_of, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(
+        f"{verb} {report['expired_batches']} expired batches ({report['written_off_units']} units written off) "
+        f"and {report['empty_batches']} empty batches, as of {report['as_of']}"
+    )
+    for product_id, units in sorted(report["written_off"].items(), key=lambda item: -item[1]):
+        print(f"  product {product_id}: {units} units")
+
+
+def cmd_rollups(args):
+    kinds = list(rollups.HISTORY) if args.kind == "all" else [args.kind]
+    for kind in kinds:
+        if args.action == "close":
+            closed = rollups.close_months(
+                kind,
+                through=args.through,
+                rebuild=args.rebuild,
+                on_close=lambda kind, month: print(f"closing {kind} {month:%Y-%m}"),
+            )
+            print(f"{kind}: {len(closed)} months closed")
+        boundary = rollups.boundary(kind)
+        print(f"{kind}: months before {boundary:%Y-%m} are served from rollups" if boundary else f"{kind}: no closed months")
+
+
+def cmd_reorder_points(args):
+    started = time.perf_counter()
+    count = services.refresh_reorder_points(
+        as_of=args.as_of,
+        window_days=args.window_days,
+        lead_time_days=args.lead_time_days,
+        service_level=args.service_level,
+        cover_days=args.cover_days,
+    )
+    print(f"Computed reorder points for {count} products in {time.perf_counter() - started:.2f}s")
+
+
+def cmd_sales_daily(args):
+    days = rollups.backfill_sales_daily(
+        from_date=args.from_date,
+        to_date=args.to_date,
+        on_progress=lambda day, last: print(f"\rthrough {day} of {last}", end="", flush=True),
+    )
+    print()
+    print(f"Rebuilt sales_daily for {days} days")
+
+
+def cmd_explain_check(args):
+    failures = explain_check.run_checks()
+    for label, query, rows in failures:
+        tables = ", ".join(explain_check.scanned_table(row) for row in rows)
+        print(f"FULL SCAN in {label}: {tables}\n    {' '.join(query.split())}")
+    print(f"{len(failures)} queries regressed to full table scans")
+    if failures:
+        raise SystemExit(1)
+
+
+def cmd_seed(args):
+    counts = seed.scaled(args.scale)
+    for key in seed.DEFAULTS:
+        value = getattr(args, key)
+        if value is not None:
+            counts[key] = value
+    written = seed.generate(
+        counts,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        on_progress=lambda step, done, total: print(f"\r{step}: {done}/{total}", end="", flush=True),
+    )
+    print()
+    print("Seeded " + ", ".join(f"{value} {key}" for key, value in written.items()))
+
+
+def cmd_bench(args):
+    document = bench.run(
+        repeat=args.repeat,
+        warmup=args.warmup,
+        only=set(args.only) if args.only else None,
+        on_result=lambda name, result: print(f"{name:32} {result.get('median_ms', result.get('error'))}"),
+    )
+    bench.save(document, args.output)
+    if document["skipped"]:
+        print("No call registered for: " + ", ".join(document["skipped"]))
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        print(f"{'function':32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for name, before, after, ratio in bench.compare(baseline, document):
+            print(f"{name:32} {before:10.2f} {after:10.2f} {ratio:7.2f}")
+
+
+def cmd_serve_api(args):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    api.run(host=args.host, port=args.port, workers=args.workers)
+
+
+def cmd_loadtest(args):
+    ids = {
+        "product_id": [p["product_id"] for p in services.list_products()][: args.sample],
+        "customer_id": [c["customer_id"] for c in services.list_customers()][: args.sample],
+        "supplier_id": [s["supplier_id"] for s in services.list_suppliers()][: args.sample],
+    }
+    server = None
+    url = args.url
+    token = os.getenv("API_TOKEN")
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen([sys.executable, __file__, "serve-api", "--port", str(args.port)])
+    try:
+        asyncio.run(loadtest.wait_until_healthy(url, token=token))
+        summary = asyncio.run(loadtest.run(url, ids, concurrency=args.concurrency, duration=args.duration, token=token))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(f"{'endpoint':32} {'requests':>8} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  statuses")
+    for endpoint, row in summary.items():
+        print(
+            f"{endpoint:32} {row['requests']:8} {row['rps']:8} {row['p50_ms']:8} {row['p95_ms']:8} "
+            f"{row['p99_ms']:8}  {row['statuses']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(summary, handle, indent=2)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Medicine inventory maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Stream a report to a CSV, JSON-lines or Parquet file")
+    export.add_argument("report", choices=sorted(exports.REPORTS))
+    export.add_argument("output")
+    export.add_argument("--format", choices=exports.FORMATS, default="csv")
+    export.add_argument("--from-date", type=date.fromisoformat)
+    export.add_argument("--to-date", type=date.fromisoformat)
+    export.add_argument("--batch-size", type=int, default=1000)
+    export.set_defaults(func=cmd_export)
+
+    totals = sub.add_parser("stock-totals", help="Rebuild or verify the product_stock_totals table")
+    totals.add_argument("action", choices=["rebuild", "verify"])
+    totals.set_defaults(func=cmd_stock_totals)
+
+    init = sub.add_parser("init-db", help="Create a fresh database from the backend's schema file")
+    init.add_argument("--yes", action="store_true", help="Confirm dropping existing tables")
+    init.set_defaults(func=cmd_init_db)
+
+    mig = sub.add_parser("migrate", help="Apply pending schema migrations for the configured backend")
+    mig.add_argument("--status", action="store_true", help="List pending migrations only")
+    mig.add_argument("--dry-run", action="store_true", help="Show what would be applied")
+    mig.set_defaults(func=cmd_migrate)
+
+    sweep = sub.add_parser("sweep-stock", help="Archive expired and empty batches; schedule daily")
+    sweep.add_argument("--as-of", type=date.fromisoformat, help="Treat batches expiring before this date as expired")
+    sweep.add_argument("--chunk-size", type=int, default=1000)
+    sweep.add_argument("--dry-run", action="store_true", help="Report what would be archived")
+    sweep.set_defaults(func=cmd_sweep_stock)
+
+    roll = sub.add_parser("rollups", help="Build monthly sales/purchases rollups for closed months")
+    roll.add_argument("action", choices=("close", "status"))
+    roll.add_argument("--kind", choices=("all",) + tuple(rollups.HISTORY), default="all")
+    roll.add_argument("--through", type=date.fromisoformat, help="Close months before this date (default: today)")
+    roll.add_argument("--rebuild", action="store_true", help="Recompute months that are already closed")
+    roll.set_defaults(func=cmd_rollups)
+
+    reorder = sub.add_parser("reorder-points", help="Recompute per-product demand forecasts and reorder points")
+    reorder.add_argument("action", choices=("refresh",))
+    reorder.add_argument("--as-of", type=date.fromisoformat, help="Last day of sales history to use (default today)")
+    reorder.add_argument("--window-days", type=int, help="Days of history demand is measured over")
+    reorder.add_argument("--lead-time-days", type=int, help="Days between ordering and receiving stock")
+    reorder.add_argument("--service-level", type=float, help="Target chance of not running out, e.g. 0.95")
+    reorder.add_argument("--cover-days", type=int, help="Days of demand a suggested order covers")
+    reorder.set_defaults(func=cmd_reorder_points)
+
+    daily = sub.add_parser("sales-daily", help="Rebuild the daily sales aggregates from the sales table")
+    daily.add_argument("action", choices=("backfill",))
+    daily.add_argument("--from-date", type=date.fromisoformat)
+    daily.add_argument("--to-date", type=date.fromisoformat)
+    daily.set_defaults(func=cmd_sales_daily)
+
+    explain = sub.add_parser("explain-check", help="Fail if any service query plans a full table scan")
+    explain.set_defaults(func=cmd_explain_check)
+
+    gen = sub.add_parser("seed", help="Append a seeded synthetic dataset for benchmarks")
+    gen.add_argument("--scale", type=float, default=1.0, help="Multiplier on the default volumes")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--chunk-size", type=int, default=10_000)
+    for key in seed.DEFAULTS:
+        gen.add_argument(f"--{key.replace('_', '-')}", dest=key, type=int)
+    gen.set_defaults(func=cmd_seed)
+
+    bench_cmd = sub.add_parser("bench", help="Time every public services function")
+    bench_cmd.add_argument("--repeat", type=int, default=5)
+    bench_cmd.add_argument("--warmup", type=int, default=1)
+    bench_cmd.add_argument("--only", nargs="*", help="Benchmark only these functions")
+    bench_cmd.add_argument("--output", default="bench_results.json")
+    bench_cmd.add_argument("--compare", help="Earlier results file to compare against")
+    bench_cmd.set_defaults(func=cmd_bench)
+
+    serve = sub.add_parser("serve-api", help="Run the JSON API for POS terminals")
+    serve.add_argument("--host")
+    serve.add_argument("--port", type=int)
+    serve.add_argument("--workers", type=int, help="Threads running service calls")
+    serve.set_defaults(func=cmd_serve_api)
+
+    load = sub.add_parser("loadtest", help="Drive concurrent keep-alive clients against the API")
+    load.add_argument("--url", help="Running API to target; by default one is started on --port")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--duration", type=float, default=30.0)
+    load.add_argument("--sample", type=int, default=1000, help="Ids of each kind to pick requests from")
+    load.add_argument("--output", help="Write the summary as JSON")
+    load.set_defaults(func=cmd_loadtest)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
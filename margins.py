@@ -0,0 +1,245 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from db import fetch_all
+
+
+# Cost layers: one per distinct purchase price and batch. Purchases recorded
+# before purchases.expiry_date existed sort as if they expired on the purchase
+# date, the same default add_purchase applies.
+LAYERS_SQL = """
+    SELECT product_id,
+           COALESCE(expiry_date, purchase_date) AS expiry_date,
+           purchase_date,
+           purchase_price,
+           SUM(quantity) AS quantity
+    FROM purchases
+    WHERE purchase_date <= %s
+    GROUP BY product_id, COALESCE(expiry_date, purchase_date), purchase_date, purchase_price
+"""
+# Issues: units leaving stock. Sales come from the daily aggregates (units sold
+# on one day are interchangeable for costing) and expired write-offs from the
+# sweep archive.
+SALES_SQL = """
+    SELECT product_id, sale_date AS issue_date, quantity, revenue
+    FROM sales_daily
+    WHERE sale_date <= %s
+"""
+WRITE_OFFS_SQL = """
+    SELECT product_id, archived_on AS issue_date, SUM(quantity) AS quantity
+    FROM stock_archive
+    WHERE reason = 'expired' AND archived_on <= %s
+    GROUP BY product_id, archived_on
+"""
+WRITE_OFF = 0
+SALE = 1
+
+
+def fefo_costs(layer_product, layer_quantity, layer_price, layer_arrival, issue_product, issue_quantity, issue_date):
+    """
+    Cost issues against purchase layers, per product, without a row loop.
+
+    Layers must be sorted by product and then FEFO order, issues by product and
+    then date. Between two purchase dates of a product the layers on hand are
+    fixed, so the issues of that stretch (an epoch) take consecutive units
+    from the remaining on-hand units in FEFO order: the cost of the first n of
+    them is a piecewise-linear function of n, found by ``searchsorted`` over
+    their cumulative quantities, and an issue costs the difference between
+    its end and start positions. The k-th epoch of every product is costed in
+    one pass, so the loop runs once per purchase date of the busiest product,
+    not once per issue. Units issued beyond what a product had on hand are
+    left uncosted.
+
+    Returns ``(issue_cost, issue_uncosted, products, remaining_units, remaining_value)``.
+    """
+    left = np.array(layer_quantity, dtype=np.int64)
+    layer_price = np.asarray(layer_price, dtype=float)
+    layer_arrival = _days(layer_arrival)
+    issue_quantity = np.asarray(issue_quantity, dtype=np.int64)
+    issue_date = _days(issue_date)
+    products = np.union1d(layer_product, issue_product).astype(np.int64)
+    layer_code = np.searchsorted(products, layer_product)
+    issue_code = np.searchsorted(products, issue_product)
+    layer_bounds = np.searchsorted(layer_code, np.arange(len(products) + 1))
+
+    # Epochs are the distinct (product, purchase date) pairs; each issue
+    # belongs to the latest epoch of its product on or before its date.
+    first_day = min(layer_arrival.min(initial=0), issue_date.min(initial=0))
+    span = max(layer_arrival.max(initial=0), issue_date.max(initial=0)) - first_day + 1
+    epochs = np.unique(layer_code * span + layer_arrival - first_day)
+    epoch_code, epoch_day = np.divmod(epochs, span)
+    epoch = np.searchsorted(epochs, issue_code * span + issue_date - first_day, side="right") - 1
+    costed = epoch >= 0
+    costed[costed] = epoch_code[epoch[costed]] == issue_code[costed]
+
+    issues = np.flatnonzero(costed)
+    issue_epoch = epoch[issues]
+    demand_end = np.cumsum(issue_quantity[issues])
+    if len(issues):
+        first = np.flatnonzero(np.r_[True, issue_epoch[1:] != issue_epoch[:-1]])
+        runs = np.diff(np.r_[first, len(issues)])
+        demand_end -= np.repeat(demand_end[first] - issue_quantity[issues[first]], runs)
+    demand_start = demand_end - issue_quantity[issues]
+    used, used_start, used_count = np.unique(issue_epoch, return_index=True, return_counts=True)
+    product_runs = np.flatnonzero(np.r_[True, epoch_code[used[1:]] != epoch_code[used[:-1]]])
+    rank = np.arange(len(used)) - np.repeat(product_runs, np.diff(np.r_[product_runs, len(used)]))
+
+    issue_cost = np.zeros(len(issue_quantity))
+    issue_uncosted = issue_quantity.copy()
+    for k in range(rank.max(initial=-1) + 1):
+        current = rank == k
+        batch = used[current]
+        code = epoch_code[batch]
+        # Each product's layers, holding what is left of them if they had
+        # arrived by the epoch's purchase date and nothing otherwise.
+        counts = layer_bounds[code + 1] - layer_bounds[code]
+        ends = np.cumsum(counts)
+        layers = _ranges(layer_bounds[code], counts)
+        arrived = layer_arrival[layers] <= np.repeat(epoch_day[batch] + first_day, counts)
+        on_hand = np.where(arrived, left[layers], 0)
+        price = layer_price[layers]
+        on_hand_end = np.cumsum(on_hand)
+        value_end = np.cumsum(on_hand * price)
+        base = np.r_[0, on_hand_end][ends - counts]
+        total = np.r_[0, on_hand_end][ends] - base
+
+        starts = used_start[current]
+        sizes = used_count[current]
+        rows = _ranges(starts, sizes)
+        owner = np.repeat(np.arange(len(batch)), sizes)
+        start = base[owner] + np.minimum(demand_start[rows], total[owner])
+        end = base[owner] + np.minimum(demand_end[rows], total[owner])
+        # Cost of the first n units on hand is piecewise linear in n.
+        at = np.minimum(np.searchsorted(on_hand_end, np.r_[start, end], side="left"), len(layers) - 1)
+        cost = value_end[at] - (on_hand_end[at] - np.r_[start, end]) * price[at]
+        issue_cost[issues[rows]] = cost[len(rows):] - cost[:len(rows)]
+        issue_uncosted[issues[rows]] -= end - start
+
+        # Take what the epoch issued off the front of each product's units.
+        taken = np.repeat(np.minimum(demand_end[starts + sizes - 1], total), counts)
+        left[layers] -= np.clip(taken - (on_hand_end - on_hand - np.repeat(base, counts)), 0, on_hand)
+
+    remaining_units = np.bincount(layer_code, weights=left, minlength=len(products)).astype(np.int64)
+    remaining_value = np.bincount(layer_code, weights=left * layer_price, minlength=len(products))
+    return issue_cost, issue_uncosted, products, remaining_units, remaining_value
+
+
+def _days(dates):
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def _ranges(starts, counts):
+    """Indices ``starts[i]`` .. ``starts[i] + counts[i] - 1`` for every i, concatenated."""
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) + np.repeat(starts - offsets, counts)
+
+
+def _frame(rows, columns):
+    frame = pd.DataFrame(rows, columns=columns)
+    for column in columns:
+        if column.endswith("_date"):
+            frame[column] = pd.to_datetime(frame[column])
+        elif column in ("purchase_price", "revenue"):
+            frame[column] = frame[column].astype(float)
+        elif column == "quantity":
+            # MySQL returns SUM over an INT column as DECIMAL.
+            frame[column] = frame[column].astype("int64")
+    return frame
+
+
+def replay(to_date=None):
+    """
+    Replay all purchases, sales and expired write-offs up to ``to_date``
+    (default today) in FEFO order.
+
+    Each issue is costed against the earliest-expiring units received on or
+    before its date, so later purchases never change the cost of earlier
+    periods. Returns ``(issues, stock)`` DataFrames; issues has product_id,
+    issue_date, kind, quantity, revenue, cost and uncosted_units per product
+    and day, stock has product_id, units and value of what remains.
+    """
+    to_date = to_date or date.today()
+    layers = _frame(
+        fetch_all(LAYERS_SQL, (to_date,)),
+        ["product_id", "expiry_date", "purchase_date", "purchase_price", "quantity"],
+    ).sort_values(["product_id", "expiry_date", "purchase_date"], kind="stable")
+    sales = _frame(fetch_all(SALES_SQL, (to_date,)), ["product_id", "issue_date", "quantity", "revenue"])
+    write_offs = _frame(fetch_all(WRITE_OFFS_SQL, (to_date,)), ["product_id", "issue_date", "quantity"])
+    # A sweep runs before the day's sales, so same-day write-offs go first.
+    issues = pd.concat(
+        [write_offs.assign(kind=WRITE_OFF, revenue=0.0), sales.assign(kind=SALE)],
+        ignore_index=True,
+    ).sort_values(["product_id", "issue_date", "kind"], kind="stable", ignore_index=True)
+
+    cost, uncosted, products, units, value = fefo_costs(
+        layers["product_id"].to_numpy(),
+        layers["quantity"].to_numpy(),
+        layers["purchase_price"].to_numpy(),
+        layers["purchase_date"].to_numpy(),
+        issues["product_id"].to_numpy(),
+        issues["quantity"].to_numpy(),
+        issues["issue_date"].to_numpy(),
+    )
+    issues["cost"] = cost
+    issues["uncosted_units"] = uncosted
+    stock = pd.DataFrame({"product_id": products, "units": units, "value": value})
+    return issues, stock
+
+
+PERIODS = {"day": "D", "month": "M", "year": "Y"}
+
+
+def margin_table(issues, from_date=None, period=None):
+    """
+    Units, revenue, COGS and write-off cost per product (and per ``period`` of
+    ``PERIODS`` when given) for issues dated ``from_date`` onwards.
+    """
+    if from_date is not None:
+        issues = issues[issues["issue_date"] >= pd.Timestamp(from_date)]
+    sold = issues["kind"] == SALE
+    frame = pd.DataFrame(
+        {
+            "product_id": issues["product_id"],
+            "units": issues["quantity"].where(sold, 0),
+            "revenue": issues["revenue"],
+            "cogs": issues["cost"].where(sold, 0.0),
+            "written_off_units": issues["quantity"].where(~sold, 0),
+            "write_off_cost": issues["cost"].where(~sold, 0.0),
+            "uncosted_units": issues["uncosted_units"],
+        }
+    )
+    keys = ["product_id"]
+    if period:
+        frame.insert(0, "period", issues["issue_date"].dt.to_period(PERIODS[period]).dt.start_time.dt.date)
+        keys.insert(0, "period")
+    return frame.groupby(keys, as_index=False).sum()
+
+
+def add_margins(frame):
+    """Add gross_margin and margin_pct columns to a table with revenue and cogs."""
+    frame["gross_margin"] = frame["revenue"] - frame["cogs"]
+    revenue = frame["revenue"].where(frame["revenue"] != 0)
+    frame["margin_pct"] = (frame["gross_margin"] / revenue * 100).round(1)
+    return frame.round({"revenue": 2, "cogs": 2, "gross_margin": 2, "write_off_cost": 2, "value": 2})
+
+
+def by_category(frame, tree, products, fields):
+    """
+    Sum a per-product table into every category of ``tree`` including its
+    subcategories, keeping any period column. ``products`` maps product_id to
+    the product's most specific category_id.
+    """
+    frame = frame.assign(category_id=frame["product_id"].map(products))
+    keys = ["period"] if "period" in frame else []
+    groups = frame.groupby(keys) if keys else [((), frame)]
+    rows = []
+    for key, group in groups:
+        values = group.groupby("category_id")[list(fields)].sum().to_dict("index")
+        for category_id, totals in tree.rollup(values, fields).items():
+            if any(totals.values()):
+                rows.append(
+                    {**dict(zip(keys, key)), "category_id": category_id, "category_name": tree.label(category_id), **totals}
+                )
+    return pd.DataFrame(rows, columns=keys + ["category_id", "category_name", *fields])
@@ -0,0 +1,113 @@
+import os
+import re
+
+import db
+from db import fetch_all, run_query, transaction
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+TRIGGER_START = re.compile(r"\s*CREATE\s+TRIGGER\b", re.IGNORECASE)
+TRIGGER_END = re.compile(r"\bEND\s*$", re.IGNORECASE)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILES = {"mysql": "schema.sql", "sqlite": "schema_sqlite.sql"}
+
+
+def migrations_dir():
+    """migrations/ for MySQL, migrations/<backend>/ for the others."""
+    if db.backend() == "mysql":
+        return MIGRATIONS_DIR
+    return os.path.join(MIGRATIONS_DIR, db.backend())
+
+
+def load_migrations(directory=None):
+    """Return (version, name, path) for every NNN_name.sql file, in version order."""
+    directory = directory or migrations_dir()
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """
+    Split a migration file into statements on ``;``. Full-line ``--`` comments
+    are dropped; statements must not contain semicolons inside string literals.
+    A ``CREATE TRIGGER`` statement runs on to the ``END`` closing its body.
+    """
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements = []
+    pending = ""
+    for piece in "\n".join(lines).split(";"):
+        pending = f"{pending};{piece}" if pending else piece
+        if TRIGGER_START.match(pending) and not TRIGGER_END.search(pending):
+            continue
+        statements.append(pending.strip())
+        pending = ""
+    # A trailing comment after the last ``;`` leaves a fragment with no SQL in it.
+    return [s for s in statements if s and not all(line.strip().startswith("--") for line in s.splitlines())]
+
+
+def ensure_migrations_table():
+    run_query(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def applied_versions():
+    ensure_migrations_table()
+    return {row["version"] for row in fetch_all("SELECT version FROM schema_migrations")}
+
+
+def pending_migrations(directory=None):
+    applied = applied_versions()
+    return [m for m in load_migrations(directory) if m[0] not in applied]
+
+
+def apply_migrations(directory=None, dry_run=False, on_apply=None):
+    """
+    Apply pending migrations in order and record each in schema_migrations.
+
+    Each migration runs in one transaction. SQLite rolls a failed migration
+    back as a unit; MySQL commits DDL implicitly, so there a migration that
+    fails part-way stays pending and must be fixed up before re-running.
+    Returns the list of (version, name) applied.
+    """
+    applied = []
+    for version, name, path in pending_migrations(directory):
+        if on_apply:
+            on_apply(version, name)
+        if not dry_run:
+            with open(path, encoding="utf-8") as handle:
+                statements = split_statements(handle.read())
+            with transaction():
+                for statement in statements:
+                    run_query(statement)
+                run_query(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name),
+                )
+        applied.append((version, name))
+    return applied
+
+
+def schema_file():
+    return os.path.join(ROOT_DIR, SCHEMA_FILES[db.backend()])
+
+
+def init_schema(path=None):
+    """Create every table from the backend's schema file, dropping existing ones first."""
+    path = path or schema_file()
+    with open(path, encoding="utf-8") as handle:
+        statements = split_statements(handle.read())
+    for statement in statements:
+        run_query(statement)
+    return path
@@ -0,0 +1,34 @@
+-- Indexes for the filters and orderings used in services.py.
+
+-- Soft-delete filters on reference tables
+CREATE INDEX idx_products_deleted_name ON products(is_deleted, name);
+CREATE INDEX idx_suppliers_deleted ON suppliers(is_deleted);
+CREATE INDEX idx_customers_deleted ON customers(is_deleted);
+CREATE INDEX idx_categories_parent_deleted ON categories(parent_category_id, is_deleted);
+
+-- FEFO allocation locks one product's batches in (expiry, supplier) order, a page at a time
+CREATE INDEX idx_stock_fefo ON stock(product_id, expiry_date, supplier_id, quantity);
+
+-- Date-range report filters; InnoDB appends the primary key, so sale_id/purchase_id order is covered
+CREATE INDEX idx_sales_date ON sales(sale_date);
+CREATE INDEX idx_sales_product_date ON sales(product_id, sale_date);
+CREATE INDEX idx_purchases_date ON purchases(purchase_date);
+CREATE INDEX idx_purchases_product_date ON purchases(product_id, purchase_date);
+
+-- Per-product stock summary, for databases created before it was added to schema.sql
+CREATE TABLE IF NOT EXISTS product_stock_totals (
+    product_id INT NOT NULL PRIMARY KEY,
+    total_quantity INT NOT NULL DEFAULT 0,
+    batch_count INT NOT NULL DEFAULT 0,
+    earliest_expiry DATE NULL,
+    INDEX idx_stock_totals_quantity (total_quantity),
+    CONSTRAINT fk_stock_totals_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+
+REPLACE INTO product_stock_totals (product_id, total_quantity, batch_count, earliest_expiry)
+SELECT product_id,
+       SUM(quantity),
+       COUNT(CASE WHEN quantity > 0 THEN 1 END),
+       MIN(CASE WHEN quantity > 0 THEN expiry_date END)
+FROM stock
+GROUP BY product_id;
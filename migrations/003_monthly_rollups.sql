@@ -0,0 +1,41 @@
+-- Monthly rollups of sales and purchases. Run `python manage.py rollups close` afterwards
+-- to build the closed months; until then reports read the raw rows as before.
+
+CREATE TABLE sales_monthly (
+    month DATE NOT NULL,
+    product_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    quantity INT NOT NULL,
+    amount DECIMAL(14,2) NOT NULL,
+    price_total DECIMAL(14,2) NOT NULL,
+    line_count INT NOT NULL,
+    PRIMARY KEY (month, product_id, customer_id),
+    CONSTRAINT fk_sales_monthly_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_sales_monthly_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON UPDATE CASCADE
+);
+
+CREATE TABLE purchases_monthly (
+    month DATE NOT NULL,
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    quantity INT NOT NULL,
+    amount DECIMAL(14,2) NOT NULL,
+    price_total DECIMAL(14,2) NOT NULL,
+    line_count INT NOT NULL,
+    PRIMARY KEY (month, product_id, supplier_id),
+    CONSTRAINT fk_purchases_monthly_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_purchases_monthly_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+-- Months whose rollup is complete; reports read those months from the rollup tables
+CREATE TABLE rollup_months (
+    kind VARCHAR(16) NOT NULL,
+    month DATE NOT NULL,
+    closed_at DATETIME NOT NULL,
+    PRIMARY KEY (kind, month)
+);
+
+CREATE INDEX idx_sales_monthly_product ON sales_monthly(product_id, month);
+CREATE INDEX idx_sales_monthly_customer ON sales_monthly(customer_id, month);
+CREATE INDEX idx_purchases_monthly_product ON purchases_monthly(product_id, month);
+CREATE INDEX idx_purchases_monthly_supplier ON purchases_monthly(supplier_id, month);
@@ -0,0 +1,4 @@
+-- N-gram full-text index over product names for services.search_products, so
+-- substring matches do not scan the catalogue.
+
+CREATE FULLTEXT INDEX ft_products_name ON products(name) WITH PARSER ngram;
@@ -0,0 +1,29 @@
+-- SQLite counterpart of migrations/001_hot_path_indexes.sql. schema_sqlite.sql already
+-- includes everything here; the file keeps version numbers aligned across backends.
+
+CREATE INDEX IF NOT EXISTS idx_products_deleted_name ON products(is_deleted, name);
+CREATE INDEX IF NOT EXISTS idx_suppliers_deleted ON suppliers(is_deleted);
+CREATE INDEX IF NOT EXISTS idx_customers_deleted ON customers(is_deleted);
+CREATE INDEX IF NOT EXISTS idx_categories_parent_deleted ON categories(parent_category_id, is_deleted);
+CREATE INDEX IF NOT EXISTS idx_stock_fefo ON stock(product_id, expiry_date, supplier_id, quantity);
+CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(sale_date);
+CREATE INDEX IF NOT EXISTS idx_sales_product_date ON sales(product_id, sale_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases(purchase_date);
+CREATE INDEX IF NOT EXISTS idx_purchases_product_date ON purchases(product_id, purchase_date);
+
+CREATE TABLE IF NOT EXISTS product_stock_totals (
+    product_id INT NOT NULL PRIMARY KEY,
+    total_quantity INT NOT NULL DEFAULT 0,
+    batch_count INT NOT NULL DEFAULT 0,
+    earliest_expiry DATE NULL,
+    CONSTRAINT fk_stock_totals_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_stock_totals_quantity ON product_stock_totals(total_quantity);
+
+REPLACE INTO product_stock_totals (product_id, total_quantity, batch_count, earliest_expiry)
+SELECT product_id,
+       SUM(quantity),
+       COUNT(CASE WHEN quantity > 0 THEN 1 END),
+       MIN(CASE WHEN quantity > 0 THEN expiry_date END)
+FROM stock
+GROUP BY product_id;
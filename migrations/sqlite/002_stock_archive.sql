@@ -0,0 +1,16 @@
+-- Archive of expired and empty batches written by the expiry sweep.
+
+CREATE TABLE stock_archive (
+    archive_id INTEGER PRIMARY KEY,
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    expiry_date DATE NOT NULL,
+    quantity INT NOT NULL,
+    reason VARCHAR(16) NOT NULL,
+    archived_on DATE NOT NULL,
+    CONSTRAINT fk_stock_archive_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_stock_archive_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+CREATE INDEX idx_stock_archive_reason_date ON stock_archive(reason, archived_on);
+CREATE INDEX idx_stock_archive_product ON stock_archive(product_id);
@@ -0,0 +1,19 @@
+-- Daily per-product sales aggregates for trend charts, populated from the existing sales.
+-- `python manage.py sales-daily backfill` rebuilds them if they ever drift.
+
+CREATE TABLE sales_daily (
+    sale_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL,
+    sale_count INT NOT NULL,
+    PRIMARY KEY (sale_date, product_id),
+    CONSTRAINT fk_sales_daily_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+
+CREATE INDEX idx_sales_daily_product ON sales_daily(product_id, sale_date);
+
+INSERT INTO sales_daily (sale_date, product_id, quantity, revenue, sale_count)
+SELECT sale_date, product_id, SUM(quantity), SUM(quantity * sale_price), COUNT(*)
+FROM sales
+GROUP BY sale_date, product_id;
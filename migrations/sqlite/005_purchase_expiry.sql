@@ -0,0 +1,5 @@
+-- Record the expiry date of the batch each purchase created, so the margin
+-- engine can replay purchases in FEFO order. Earlier rows stay NULL and are
+-- costed as if they expired on their purchase date.
+
+ALTER TABLE purchases ADD COLUMN expiry_date DATE NULL;
@@ -0,0 +1,15 @@
+-- Per-product demand forecasts and reorder points, written by
+-- `python manage.py reorder-points refresh`. Products without a row fall back
+-- to the global low-stock threshold until the first refresh.
+
+CREATE TABLE reorder_points (
+    product_id INT NOT NULL PRIMARY KEY,
+    daily_demand DECIMAL(12,4) NOT NULL,
+    demand_std DECIMAL(12,4) NOT NULL,
+    lead_time_days INT NOT NULL,
+    safety_stock INT NOT NULL,
+    reorder_point INT NOT NULL,
+    order_quantity INT NOT NULL,
+    computed_on DATE NOT NULL,
+    CONSTRAINT fk_reorder_points_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
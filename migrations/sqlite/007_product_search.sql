@@ -0,0 +1,19 @@
+-- Trigram full-text index over product names for services.search_products,
+-- kept in step with products by triggers and filled from the existing rows.
+
+CREATE VIRTUAL TABLE products_fts USING fts5(name, content='products', content_rowid='product_id', tokenize='trigram');
+
+CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, name) VALUES (new.product_id, new.name);
+END;
+
+CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.product_id, old.name);
+END;
+
+CREATE TRIGGER products_fts_update AFTER UPDATE OF name ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.product_id, old.name);
+    INSERT INTO products_fts (rowid, name) VALUES (new.product_id, new.name);
+END;
+
+INSERT INTO products_fts (products_fts) VALUES ('rebuild');
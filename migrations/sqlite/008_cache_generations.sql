@@ -0,0 +1,7 @@
+-- One counter per reference-cache namespace, bumped by every write that
+-- invalidates it, so processes other than the writer drop their cached copies.
+
+CREATE TABLE cache_generations (
+    namespace VARCHAR(32) NOT NULL PRIMARY KEY,
+    generation BIGINT NOT NULL
+);
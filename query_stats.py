@@ -0,0 +1,93 @@
+import bisect
+import re
+import threading
+from functools import lru_cache
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_PLACEHOLDER_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_REPEATED_TUPLES = re.compile(r"\(%s, \.\.\.\)(?:\s*,\s*\(%s, \.\.\.\))+")
+_REPEATED_WHEN = re.compile(r"(WHEN [^W]*? THEN %s)(?:\s+WHEN [^W]*? THEN %s)+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(query):
+    """Collapse whitespace and variable-length placeholder lists so one statement shape is one key."""
+    statement = " ".join(query.split())
+    statement = _PLACEHOLDER_LIST.sub("(%s, ...)", statement)
+    statement = _REPEATED_TUPLES.sub("(%s, ...), ...", statement)
+    statement = _REPEATED_WHEN.sub(r"\1 ...", statement)
+    return statement
+
+
+def _percentile(buckets, count, fraction):
+    if not count:
+        return 0.0
+    target = fraction * count
+    seen = 0
+    for index, bucket_count in enumerate(buckets):
+        seen += bucket_count
+        if seen >= target:
+            return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else float("inf")
+    return float("inf")
+
+
+class QueryStats:
+    """Per-statement call counts, latency histograms, row counts and calling functions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, query, params, elapsed_ms, rows, caller):
+        statement = normalize_statement(query)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+        with self._lock:
+            entry = self._entries.get(statement)
+            if entry is None:
+                entry = self._entries[statement] = {
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                    "callers": {},
+                }
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows or 0
+            entry["buckets"][bucket] += 1
+            entry["callers"][caller] = entry["callers"].get(caller, 0) + 1
+
+    def snapshot(self, order_by="total_ms", limit=None):
+        """Rows per statement, sorted descending by ``order_by``; percentiles are bucket upper bounds."""
+        with self._lock:
+            entries = {s: dict(e, buckets=list(e["buckets"]), callers=dict(e["callers"])) for s, e in self._entries.items()}
+        rows = []
+        for statement, entry in entries.items():
+            calls = entry["calls"]
+            rows.append(
+                {
+                    "statement": statement,
+                    "calls": calls,
+                    "total_ms": round(entry["total_ms"], 2),
+                    "mean_ms": round(entry["total_ms"] / calls, 2),
+                    "p50_ms": _percentile(entry["buckets"], calls, 0.50),
+                    "p95_ms": _percentile(entry["buckets"], calls, 0.95),
+                    "p99_ms": _percentile(entry["buckets"], calls, 0.99),
+                    "max_ms": round(entry["max_ms"], 2),
+                    "rows": entry["rows"],
+                    "callers": ", ".join(
+                        f"{name} ({count})" for name, count in sorted(entry["callers"].items(), key=lambda c: -c[1])
+                    ),
+                }
+            )
+        rows.sort(key=lambda r: r[order_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
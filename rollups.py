@@ -0,0 +1,266 @@
+from datetime import date, datetime, timedelta
+
+from cache import reference_cache
+from db import execute_many, fetch_one, run_query, transaction, upsert_sql
+
+
+# Monthly per-product/party rollups of the sales and purchases history. Every
+# month before a kind's boundary is closed: its figures live in the rollup
+# table and reports read them from there instead of re-aggregating raw rows.
+HISTORY = {
+    "sales": {
+        "table": "sales",
+        "date": "sale_date",
+        "party": "customer_id",
+        "price": "sale_price",
+        "rollup": "sales_monthly",
+    },
+    "purchases": {
+        "table": "purchases",
+        "date": "purchase_date",
+        "party": "supplier_id",
+        "price": "purchase_price",
+        "rollup": "purchases_monthly",
+    },
+}
+FACT_COLUMNS = ("quantity", "amount", "price_total", "line_count")
+SALES_DAILY_UPSERT_SQL = upsert_sql(
+    "sales_daily",
+    ("sale_date", "product_id", "quantity", "revenue", "sale_count"),
+    keys=("sale_date", "product_id"),
+    add=("quantity", "revenue", "sale_count"),
+)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def read_boundary(kind, lock=False):
+    """
+    First day after the last closed month of ``kind``, or None if none is
+    closed, read from the database. ``lock`` takes a shared lock on the
+    kind's rollup_months rows, so a month closed by another process either
+    commits first and is seen, or waits for this transaction to commit.
+    """
+    query = "SELECT MAX(month) AS month FROM rollup_months WHERE kind = %s"
+    row = fetch_one(query + " FOR SHARE" if lock else query, (kind,))
+    return next_month(row["month"]) if row and row["month"] else None
+
+
+@reference_cache.cached("rollups")
+def boundary(kind):
+    """
+    Cached read_boundary for reports; writers use read_boundary. A stale
+    value only makes a report read raw rows for a month closed since.
+    """
+    return read_boundary(kind)
+
+
+def close_month(kind, month):
+    """(Re)build one month's rollup from the raw rows and mark it closed."""
+    spec = HISTORY[kind]
+    month = month_start(month)
+    with transaction():
+        run_query(f"DELETE FROM {spec['rollup']} WHERE month = %s", (month,))
+        run_query(
+            f"""
+            INSERT INTO {spec['rollup']} (month, product_id, {spec['party']}, {', '.join(FACT_COLUMNS)})
+            SELECT %s, product_id, {spec['party']},
+                   SUM(quantity), SUM(quantity * {spec['price']}), SUM({spec['price']}), COUNT(*)
+            FROM {spec['table']}
+            WHERE {spec['date']} >= %s AND {spec['date']} < %s
+            GROUP BY product_id, {spec['party']}
+            """,
+            (month, month, next_month(month)),
+        )
+        # Marked closed last: writers read the boundary under a shared lock,
+        # so they wait for this commit and then fold their late rows in.
+        run_query(
+            upsert_sql("rollup_months", ("kind", "month", "closed_at"), keys=("kind", "month"), replace=("closed_at",)),
+            (kind, month, datetime.now().replace(microsecond=0)),
+        )
+        reference_cache.invalidate("rollups")
+
+
+def close_months(kind, through=None, rebuild=False, on_close=None):
+    """
+    Close every month of ``kind`` before ``through`` (default: the current
+    month, which is never closed). Months are closed oldest first from the
+    first month with data, so the closed months always form an unbroken run;
+    ``rebuild`` recomputes months that are already closed. Returns the months closed.
+    """
+    spec = HISTORY[kind]
+    limit = month_start(min(through or date.today(), date.today()))
+    first = fetch_one(f"SELECT MIN({spec['date']}) AS first_date FROM {spec['table']}")["first_date"]
+    if first is None:
+        return []
+    current = read_boundary(kind)
+    month = month_start(first) if rebuild or current is None else current
+    closed = []
+    while month < limit:
+        if on_close:
+            on_close(kind, month)
+        close_month(kind, month)
+        closed.append(month)
+        month = next_month(month)
+    return closed
+
+
+def record_backdated(kind, rows):
+    """
+    Fold (product_id, party_id, quantity, day, price) rows dated in closed
+    months into the rollup, so closed months stay exact when a sale or
+    purchase is entered late. Call in the transaction that inserts the rows.
+
+    The boundary is a locking read. ``manage.py rollups close`` runs in
+    another process, and a plain read would see this transaction's
+    REPEATABLE READ snapshot, missing a month closed while the rows were
+    being inserted and leaving them out of its rollup.
+    """
+    this_month = month_start(date.today())
+    late = [row for row in rows if row[3] < this_month]
+    if not late:
+        return 0
+    limit = read_boundary(kind, lock=True)
+    merged = {}
+    for product_id, party_id, quantity, day, price in late:
+        if limit is None or day >= limit:
+            continue
+        key = (month_start(day), product_id, party_id)
+        totals = merged.setdefault(key, [0, 0, 0, 0])
+        totals[0] += quantity
+        totals[1] += quantity * price
+        totals[2] += price
+        totals[3] += 1
+    if not merged:
+        return 0
+    spec = HISTORY[kind]
+    execute_many(
+        upsert_sql(
+            spec["rollup"],
+            ("month", "product_id", spec["party"]) + FACT_COLUMNS,
+            keys=("month", "product_id", spec["party"]),
+            add=FACT_COLUMNS,
+        ),
+        [key + tuple(totals) for key, totals in merged.items()],
+    )
+    return len(merged)
+
+
+def record_sales(rows):
+    """
+    Fold newly inserted (product_id, customer_id, quantity, day, price) sale
+    rows into sales_daily and, for late entries, the closed monthly rollups.
+    Call in the transaction that inserts the rows.
+    """
+    merged = {}
+    for product_id, _, quantity, day, price in rows:
+        totals = merged.setdefault((day, product_id), [0, 0, 0])
+        totals[0] += quantity
+        totals[1] += quantity * price
+        totals[2] += 1
+    # Sorted so concurrent orders touch the aggregate rows in the same order.
+    execute_many(SALES_DAILY_UPSERT_SQL, [key + tuple(totals) for key, totals in sorted(merged.items())])
+    record_backdated("sales", rows)
+
+
+def backfill_sales_daily(from_date=None, to_date=None, days_per_chunk=31, on_progress=None):
+    """
+    Rebuild sales_daily from the sales rows between ``from_date`` and
+    ``to_date`` (default: the whole history), one transaction per chunk of
+    days. Safe to re-run; returns the number of days covered.
+    """
+    bounds = fetch_one("SELECT MIN(sale_date) AS first_date, MAX(sale_date) AS last_date FROM sales")
+    from_date = from_date or bounds["first_date"]
+    to_date = to_date or bounds["last_date"]
+    if from_date is None or to_date is None:
+        return 0
+    day = from_date
+    while day <= to_date:
+        end = min(day + timedelta(days=days_per_chunk), to_date + timedelta(days=1))
+        with transaction():
+            run_query("DELETE FROM sales_daily WHERE sale_date >= %s AND sale_date < %s", (day, end))
+            run_query(
+                """
+                INSERT INTO sales_daily (sale_date, product_id, quantity, revenue, sale_count)
+                SELECT sale_date, product_id, SUM(quantity), SUM(quantity * sale_price), COUNT(*)
+                FROM sales
+                WHERE sale_date >= %s AND sale_date < %s
+                GROUP BY sale_date, product_id
+                """,
+                (day, end),
+            )
+        if on_progress:
+            on_progress(end - timedelta(days=1), to_date)
+        day = end
+    return (to_date - from_date).days + 1
+
+
+def facts(kind, from_date=None, to_date=None, equals=None):
+    """
+    SQL and params for a derived table of (product_id, party, quantity,
+    amount, price_total, line_count) rows covering ``from_date``..``to_date``.
+
+    Whole closed months inside the range are read from the rollup; the open
+    months and any partial month at either end come from the raw rows, so the
+    cost of a report tracks the number of products and parties, not the
+    length of the history. Callers aggregate the rows with SUM.
+    """
+    spec = HISTORY[kind]
+    equals = {column: value for column, value in (equals or {}).items() if value is not None}
+    limit = boundary(kind)
+    roll_from = None
+    roll_to = limit
+    if limit is not None and from_date is not None:
+        roll_from = from_date if from_date.day == 1 else next_month(from_date)
+    if limit is not None and to_date is not None:
+        roll_to = min(limit, month_start(to_date + timedelta(days=1)))
+    use_rollup = limit is not None and (roll_from is None or roll_from < roll_to)
+
+    parts = []
+    params = []
+
+    def add_part(select, source, ranges):
+        conditions = []
+        for column, op, value in ranges:
+            conditions.append(f"{column} {op} %s")
+            params.append(value)
+        for column, value in equals.items():
+            conditions.append(f"{column} = %s")
+            params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        parts.append(f"SELECT {select} FROM {source} {where}")
+
+    raw_select = (
+        f"product_id, {spec['party']}, quantity, quantity * {spec['price']} AS amount, "
+        f"{spec['price']} AS price_total, 1 AS line_count"
+    )
+    if not use_rollup:
+        ranges = []
+        if from_date is not None:
+            ranges.append((spec["date"], ">=", from_date))
+        if to_date is not None:
+            ranges.append((spec["date"], "<=", to_date))
+        add_part(raw_select, spec["table"], ranges)
+    else:
+        rollup_ranges = [("month", "<", roll_to)]
+        if roll_from is not None:
+            rollup_ranges.insert(0, ("month", ">=", roll_from))
+            if from_date < roll_from:
+                add_part(raw_select, spec["table"], [(spec["date"], ">=", from_date), (spec["date"], "<", roll_from)])
+        add_part(
+            f"product_id, {spec['party']}, {', '.join(FACT_COLUMNS)}",
+            spec["rollup"],
+            rollup_ranges,
+        )
+        if to_date is None or roll_to <= to_date:
+            ranges = [(spec["date"], ">=", roll_to)]
+            if to_date is not None:
+                ranges.append((spec["date"], "<=", to_date))
+            add_part(raw_select, spec["table"], ranges)
+    return "\nUNION ALL\n".join(parts), params
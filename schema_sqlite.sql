@@ -0,0 +1,327 @@
+-- Medical Inventory Management System Schema (SQLite backend, DB_BACKEND=sqlite)
+-- Fresh installs only: this script drops every table. Upgrade live databases with
+-- `python manage.py migrate`, which applies the numbered files in migrations/sqlite/.
+-- Keep in step with schema.sql.
+-- Drop tables in FK-safe order
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS cache_generations;
+DROP TABLE IF EXISTS product_stock_totals;
+DROP TABLE IF EXISTS stock_archive;
+DROP TABLE IF EXISTS rollup_months;
+DROP TABLE IF EXISTS sales_monthly;
+DROP TABLE IF EXISTS purchases_monthly;
+DROP TABLE IF EXISTS reorder_points;
+DROP TABLE IF EXISTS sales_daily;
+DROP TABLE IF EXISTS stock;
+DROP TABLE IF EXISTS sales;
+DROP TABLE IF EXISTS purchases;
+DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS customers;
+DROP TABLE IF EXISTS suppliers;
+DROP TABLE IF EXISTS products_fts;
+DROP TABLE IF EXISTS products;
+DROP TABLE IF EXISTS categories;
+
+-- Create base entities
+CREATE TABLE categories (
+    category_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    parent_category_id INT NULL,
+    is_deleted TINYINT(1) NOT NULL DEFAULT 0,
+    CONSTRAINT fk_categories_parent FOREIGN KEY (parent_category_id) REFERENCES categories(category_id) ON UPDATE CASCADE
+);
+
+CREATE TABLE products (
+    product_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    category_id INT NOT NULL,
+    subcategory_id INT NULL,
+    price DECIMAL(10,2) NOT NULL,
+    is_deleted TINYINT(1) NOT NULL DEFAULT 0,
+    CONSTRAINT fk_products_category FOREIGN KEY (category_id) REFERENCES categories(category_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_products_subcategory FOREIGN KEY (subcategory_id) REFERENCES categories(category_id) ON UPDATE CASCADE
+);
+
+CREATE TABLE suppliers (
+    supplier_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    contact_info VARCHAR(255) NOT NULL,
+    is_deleted TINYINT(1) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE customers (
+    customer_id INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    is_deleted TINYINT(1) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE purchases (
+    purchase_id INTEGER PRIMARY KEY,
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    quantity INT NOT NULL,
+    purchase_date DATE NOT NULL DEFAULT (CURRENT_DATE),
+    expiry_date DATE NULL,
+    purchase_price DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    CONSTRAINT fk_purchases_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_purchases_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+CREATE TABLE sales (
+    sale_id INTEGER PRIMARY KEY,
+    product_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    quantity INT NOT NULL,
+    sale_date DATE NOT NULL DEFAULT (CURRENT_DATE),
+    sale_price DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    CONSTRAINT fk_sales_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_sales_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON UPDATE CASCADE
+);
+
+-- Stock associative entity links products and suppliers; one stock row per batch
+CREATE TABLE stock (
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    quantity INT NOT NULL,
+    expiry_date DATE NOT NULL,
+    PRIMARY KEY (product_id, supplier_id, expiry_date),
+    CONSTRAINT fk_stock_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_stock_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+-- Batches moved out of stock by services.sweep_stock; quantity is the amount written off
+CREATE TABLE stock_archive (
+    archive_id INTEGER PRIMARY KEY,
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    expiry_date DATE NOT NULL,
+    quantity INT NOT NULL,
+    reason VARCHAR(16) NOT NULL,
+    archived_on DATE NOT NULL,
+    CONSTRAINT fk_stock_archive_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_stock_archive_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+-- Monthly per-product/party rollups of closed months, maintained by rollups.py
+CREATE TABLE sales_monthly (
+    month DATE NOT NULL,
+    product_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    quantity INT NOT NULL,
+    amount DECIMAL(14,2) NOT NULL,
+    price_total DECIMAL(14,2) NOT NULL,
+    line_count INT NOT NULL,
+    PRIMARY KEY (month, product_id, customer_id),
+    CONSTRAINT fk_sales_monthly_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_sales_monthly_customer FOREIGN KEY (customer_id) REFERENCES customers(customer_id) ON UPDATE CASCADE
+);
+
+CREATE TABLE purchases_monthly (
+    month DATE NOT NULL,
+    product_id INT NOT NULL,
+    supplier_id INT NOT NULL,
+    quantity INT NOT NULL,
+    amount DECIMAL(14,2) NOT NULL,
+    price_total DECIMAL(14,2) NOT NULL,
+    line_count INT NOT NULL,
+    PRIMARY KEY (month, product_id, supplier_id),
+    CONSTRAINT fk_purchases_monthly_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE,
+    CONSTRAINT fk_purchases_monthly_supplier FOREIGN KEY (supplier_id) REFERENCES suppliers(supplier_id) ON UPDATE CASCADE
+);
+
+-- Per-product daily sales totals, maintained by add_sale/add_sale_order (rollups.record_sales)
+CREATE TABLE sales_daily (
+    sale_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    revenue DECIMAL(14,2) NOT NULL,
+    sale_count INT NOT NULL,
+    PRIMARY KEY (sale_date, product_id),
+    CONSTRAINT fk_sales_daily_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+
+-- Per-product demand forecast and reorder point, replaced by `manage.py reorder-points refresh`
+CREATE TABLE reorder_points (
+    product_id INT NOT NULL PRIMARY KEY,
+    daily_demand DECIMAL(12,4) NOT NULL,
+    demand_std DECIMAL(12,4) NOT NULL,
+    lead_time_days INT NOT NULL,
+    safety_stock INT NOT NULL,
+    reorder_point INT NOT NULL,
+    order_quantity INT NOT NULL,
+    computed_on DATE NOT NULL,
+    CONSTRAINT fk_reorder_points_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+
+-- Months whose rollup is complete; reports read those months from the rollup tables
+CREATE TABLE rollup_months (
+    kind VARCHAR(16) NOT NULL,
+    month DATE NOT NULL,
+    closed_at DATETIME NOT NULL,
+    PRIMARY KEY (kind, month)
+);
+
+-- One counter per reference-cache namespace, bumped by every write that invalidates it
+CREATE TABLE cache_generations (
+    namespace VARCHAR(32) NOT NULL PRIMARY KEY,
+    generation BIGINT NOT NULL
+);
+
+-- Per-product stock summary maintained by services.refresh_stock_totals
+CREATE TABLE product_stock_totals (
+    product_id INT NOT NULL PRIMARY KEY,
+    total_quantity INT NOT NULL DEFAULT 0,
+    batch_count INT NOT NULL DEFAULT 0,
+    earliest_expiry DATE NULL,
+    CONSTRAINT fk_stock_totals_product FOREIGN KEY (product_id) REFERENCES products(product_id) ON UPDATE CASCADE
+);
+
+CREATE INDEX idx_stock_totals_quantity ON product_stock_totals(total_quantity);
+
+-- Helpful indexes for lookups
+CREATE INDEX idx_purchases_product ON purchases(product_id);
+CREATE INDEX idx_purchases_supplier ON purchases(supplier_id);
+CREATE INDEX idx_sales_product ON sales(product_id);
+CREATE INDEX idx_sales_customer ON sales(customer_id);
+CREATE INDEX idx_stock_expiry ON stock(expiry_date);
+CREATE INDEX idx_products_category ON products(category_id);
+CREATE INDEX idx_products_subcategory ON products(subcategory_id);
+
+-- Hot-path indexes (migration 001)
+CREATE INDEX idx_products_deleted_name ON products(is_deleted, name);
+CREATE INDEX idx_suppliers_deleted ON suppliers(is_deleted);
+CREATE INDEX idx_customers_deleted ON customers(is_deleted);
+CREATE INDEX idx_categories_parent_deleted ON categories(parent_category_id, is_deleted);
+CREATE INDEX idx_stock_fefo ON stock(product_id, expiry_date, supplier_id, quantity);
+CREATE INDEX idx_sales_date ON sales(sale_date);
+CREATE INDEX idx_sales_product_date ON sales(product_id, sale_date);
+CREATE INDEX idx_purchases_date ON purchases(purchase_date);
+CREATE INDEX idx_purchases_product_date ON purchases(product_id, purchase_date);
+
+-- Stock archive (migration 002)
+CREATE INDEX idx_stock_archive_reason_date ON stock_archive(reason, archived_on);
+CREATE INDEX idx_stock_archive_product ON stock_archive(product_id);
+
+-- Monthly rollups (migration 003)
+CREATE INDEX idx_sales_monthly_product ON sales_monthly(product_id, month);
+CREATE INDEX idx_sales_monthly_customer ON sales_monthly(customer_id, month);
+CREATE INDEX idx_purchases_monthly_product ON purchases_monthly(product_id, month);
+CREATE INDEX idx_purchases_monthly_supplier ON purchases_monthly(supplier_id, month);
+
+-- Daily sales aggregates (migration 004)
+CREATE INDEX idx_sales_daily_product ON sales_daily(product_id, sale_date);
+
+-- Product search (migration 007)
+CREATE VIRTUAL TABLE products_fts USING fts5(name, content='products', content_rowid='product_id', tokenize='trigram');
+
+CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, name) VALUES (new.product_id, new.name);
+END;
+
+CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.product_id, old.name);
+END;
+
+CREATE TRIGGER products_fts_update AFTER UPDATE OF name ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', old.product_id, old.name);
+    INSERT INTO products_fts (rowid, name) VALUES (new.product_id, new.name);
+END;
+
+-- Migrations already reflected in this script
+CREATE TABLE schema_migrations (
+    version INT NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version, name) VALUES
+(1, 'hot_path_indexes'),
+(2, 'stock_archive'),
+(3, 'monthly_rollups'),
+(4, 'sales_daily'),
+(5, 'purchase_expiry'),
+(6, 'reorder_points'),
+(7, 'product_search'),
+(8, 'cache_generations');
+
+-- Sample data
+-- Categories and subcategories
+INSERT INTO categories (name, parent_category_id) VALUES
+('Furniture', NULL),        -- 1
+('Lighting', NULL),         -- 2
+('Textiles', NULL),         -- 3
+('Decor', NULL),            -- 4
+('Tables', 1),              -- 5 sub of Furniture
+('Seating', 1),             -- 6 sub of Furniture
+('Table Lamps', 2),         -- 7 sub of Lighting
+('Wall Lights', 2),         -- 8 sub of Lighting
+('Rugs', 3),                -- 9 sub of Textiles
+('Pillows', 3),             -- 10 sub of Textiles
+('Wall Art', 4),            -- 11 sub of Decor
+('Vases', 4);               -- 12 sub of Decor
+
+INSERT INTO products (name, category_id, subcategory_id, price) VALUES
+('Oak Coffee Table', 1, 5, 220.00),
+('Velvet Accent Chair', 1, 6, 350.00),
+('Ceramic Table Lamp', 2, 7, 120.00),
+('Handwoven Jute Rug', 3, 9, 180.00),
+('Abstract Canvas Art', 4, 11, 95.00);
+
+INSERT INTO suppliers (name, contact_info) VALUES
+('HealthSource Pharma', 'healthsource@example.com | +1-555-1122'),
+('Medico Supplies', 'medico@example.com | +1-555-3344'),
+('WellCare Distributors', 'wellcare@example.com | +1-555-5566');
+
+INSERT INTO customers (name) VALUES
+('City Clinic'),
+('Sunrise Hospital'),
+('Community Health Center');
+
+INSERT INTO users (username, password) VALUES
+('admin', 'adminpass'),
+('pharmacist', 'pharmacistpass');
+
+-- Purchases representing incoming stock batches
+INSERT INTO purchases (product_id, supplier_id, quantity, purchase_date, expiry_date, purchase_price) VALUES
+(1, 1, 20, '2024-01-10', '2025-12-31', 180.00),   -- Oak Coffee Table stock
+(2, 2, 15, '2024-02-05', '2024-07-15', 250.00),   -- Velvet Accent Chair stock
+(3, 2, 25, '2023-09-15', '2023-12-31', 80.00),    -- Ceramic Table Lamp stock
+(4, 3, 30, '2024-01-28', '2024-03-01', 140.00),   -- Handwoven Jute Rug stock
+(5, 1, 40, '2024-03-02', '2026-05-20', 60.00);    -- Abstract Canvas Art stock
+
+-- Stock entries (one expired, one near-expiry, one low stock)
+INSERT INTO stock (product_id, supplier_id, quantity, expiry_date) VALUES
+(1, 1, 18, '2025-12-31'),          -- Oak Coffee Table, quantity after sale deduction
+(2, 2, 12, '2024-07-15'),          -- Velvet Accent Chair near expiry placeholder date
+(3, 2, 5,  '2023-12-31'),          -- Ceramic Table Lamp expired placeholder date
+(4, 3, 4,  '2024-03-01'),          -- Handwoven Jute Rug low stock
+(5, 1, 35, '2026-05-20');          -- Abstract Canvas Art ample stock
+
+INSERT INTO product_stock_totals (product_id, total_quantity, batch_count, earliest_expiry)
+SELECT product_id,
+       SUM(quantity),
+       COUNT(CASE WHEN quantity > 0 THEN 1 END),
+       MIN(CASE WHEN quantity > 0 THEN expiry_date END)
+FROM stock
+GROUP BY product_id;
+
+-- Sales referencing products and customers
+INSERT INTO sales (product_id, customer_id, quantity, sale_date, sale_price) VALUES
+(1, 1, 2, '2024-02-20', 220.00),  -- Oak Coffee Table sold 2, leaves 18 in stock
+(2, 2, 3, '2024-03-01', 350.00),  -- Velvet Accent Chair sold 3, leaves 12 in stock
+(4, 3, 1, '2024-03-05', 180.00);  -- Handwoven Jute Rug sold 1, leaves 4 in stock
+
+INSERT INTO sales_daily (sale_date, product_id, quantity, revenue, sale_count)
+SELECT sale_date, product_id, SUM(quantity), SUM(quantity * sale_price), COUNT(*)
+FROM sales
+GROUP BY sale_date, product_id;
+
+-- Reflect stock deduction from the Paracetamol sale (already applied above)
+-- For transparency, the initial purchase batch was 100 units, reduced by 5 sold to City Clinic
+-- UPDATE stock SET quantity = quantity - 5 WHERE product_id = 1 AND supplier_id = 1 AND expiry_date = '2025-12-31';
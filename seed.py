@@ -0,0 +1,162 @@
+from datetime import date
+
+import numpy as np
+
+import rollups
+import services
+from db import analyze_tables, execute_many, fetch_all, transaction
+
+
+DEFAULTS = {
+    "root_categories": 40,
+    "subcategories_per_root": 5,
+    "products": 50_000,
+    "suppliers": 200,
+    "customers": 5_000,
+    "batches": 1_000_000,
+    "sales": 10_000_000,
+}
+
+
+def scaled(scale):
+    """DEFAULTS with row volumes multiplied by ``scale``; the category shape is kept."""
+    counts = dict(DEFAULTS)
+    for key in ("products", "suppliers", "customers", "batches", "sales"):
+        counts[key] = max(1, int(DEFAULTS[key] * scale))
+    return counts
+
+
+def _days(base, offsets):
+    """Python dates for integer day offsets from ``base``."""
+    return (np.datetime64(base) + offsets.astype("timedelta64[D]")).astype(object)
+
+
+def _write(query, rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        with transaction():
+            execute_many(query, rows[start:start + chunk_size])
+
+
+def _ids_by_name(table, id_column, prefix):
+    rows = fetch_all(f"SELECT {id_column}, name FROM {table} WHERE name LIKE %s", (prefix + "%",))
+    return {row["name"]: row[id_column] for row in rows}
+
+
+def popularity(n, skew=1.1):
+    """Zipf-like weights: item k (0-based) gets weight 1 / (k + 1) ** skew."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def generate(counts, seed=42, chunk_size=10_000, history_days=3 * 365, on_progress=None):
+    """
+    Append a synthetic dataset of the given ``counts`` to the configured database.
+
+    Sales follow Zipf-skewed product popularity. Rows are generated with NumPy
+    one chunk at a time and written with batched inserts, so memory stays flat
+    at any volume. Point DB_NAME at a scratch database first. Returns the
+    counts written.
+    """
+    rng = np.random.default_rng(seed)
+    tag = f"Seed{seed}"
+    today = date.today()
+    report = on_progress or (lambda step, done, total: None)
+
+    # Reference data
+    roots = [(f"{tag} Category {i}", None) for i in range(counts["root_categories"])]
+    _write("INSERT INTO categories (name, parent_category_id) VALUES (%s, %s)", roots, chunk_size)
+    root_ids = _ids_by_name("categories", "category_id", f"{tag} Category ")
+    subs = [
+        (f"{tag} Sub {i}-{j}", root_ids[f"{tag} Category {i}"])
+        for i in range(counts["root_categories"])
+        for j in range(counts["subcategories_per_root"])
+    ]
+    _write("INSERT INTO categories (name, parent_category_id) VALUES (%s, %s)", subs, chunk_size)
+    sub_ids = _ids_by_name("categories", "category_id", f"{tag} Sub ")
+    report("categories", len(roots) + len(subs), len(roots) + len(subs))
+
+    suppliers = [(f"{tag} Supplier {i}", f"supplier{i}@example.com") for i in range(counts["suppliers"])]
+    _write("INSERT INTO suppliers (name, contact_info) VALUES (%s, %s)", suppliers, chunk_size)
+    supplier_ids = np.array(list(_ids_by_name("suppliers", "supplier_id", f"{tag} Supplier ").values()))
+    customers = [(f"{tag} Customer {i}",) for i in range(counts["customers"])]
+    _write("INSERT INTO customers (name) VALUES (%s)", customers, chunk_size)
+    customer_ids = np.array(list(_ids_by_name("customers", "customer_id", f"{tag} Customer ").values()))
+    report("parties", len(suppliers) + len(customers), len(suppliers) + len(customers))
+
+    n_products = counts["products"]
+    root_pick = rng.integers(0, counts["root_categories"], n_products)
+    sub_pick = rng.integers(0, counts["subcategories_per_root"], n_products)
+    prices = np.round(rng.lognormal(mean=3.0, sigma=1.0, size=n_products), 2)
+    products = [
+        (f"{tag} Product {k}", root_ids[f"{tag} Category {i}"], sub_ids[f"{tag} Sub {i}-{j}"], float(price))
+        for k, (i, j, price) in enumerate(zip(root_pick.tolist(), sub_pick.tolist(), prices))
+    ]
+    _write("INSERT INTO products (name, category_id, subcategory_id, price) VALUES (%s, %s, %s, %s)", products, chunk_size)
+    report("products", n_products, n_products)
+    by_name = _ids_by_name("products", "product_id", f"{tag} Product ")
+    product_ids = np.array([by_name[f"{tag} Product {k}"] for k in range(n_products)])
+    weights = popularity(n_products)
+
+    # Stock batches and the purchases that created them. Popular products get more
+    # batches; batch j of a product expires 30 * j days after its first batch, which
+    # keeps (product, supplier, expiry) unique.
+    n_batches = counts["batches"]
+    per_product = rng.multinomial(n_batches - n_products, weights) + 1 if n_batches > n_products else np.ones(n_products, int)
+    product_index = np.repeat(np.arange(n_products), per_product)
+    batch_index = np.arange(len(product_index)) - np.repeat(np.cumsum(per_product) - per_product, per_product)
+    for start in range(0, len(product_index), chunk_size):
+        idx = product_index[start:start + chunk_size]
+        j = batch_index[start:start + chunk_size]
+        size = len(idx)
+        expiry_offsets = -365 + 30 * j + idx % 30
+        shelf_life = rng.integers(180, 720, size)
+        received = rng.integers(20, 500, size)
+        remaining = np.where(rng.random(size) < 0.1, 0, rng.integers(0, received + 1))
+        expiry = _days(today, expiry_offsets)
+        purchased = _days(today, expiry_offsets - shelf_life)
+        pids = product_ids[idx].tolist()
+        sids = supplier_ids[(idx + j) % len(supplier_ids)].tolist()
+        costs = np.round(prices[idx] * rng.uniform(0.5, 0.8, size), 2).tolist()
+        with transaction():
+            execute_many(
+                services.PURCHASE_INSERT_SQL,
+                list(zip(pids, sids, received.tolist(), purchased, expiry, costs)),
+            )
+            execute_many(
+                "INSERT INTO stock (product_id, supplier_id, quantity, expiry_date) VALUES (%s, %s, %s, %s)",
+                list(zip(pids, sids, remaining.tolist(), expiry)),
+            )
+        report("batches", start + size, len(product_index))
+
+    # Sales history, skewed towards popular products and a core of regular customers.
+    n_sales = counts["sales"]
+    customer_weights = popularity(len(customer_ids), skew=0.8)
+    for start in range(0, n_sales, chunk_size):
+        size = min(chunk_size, n_sales - start)
+        idx = rng.choice(n_products, size=size, p=weights)
+        cust = customer_ids[rng.choice(len(customer_ids), size=size, p=customer_weights)]
+        quantity = rng.integers(1, 6, size)
+        sold = _days(today, -rng.integers(0, history_days, size))
+        price = np.round(prices[idx] * rng.uniform(0.9, 1.1, size), 2)
+        with transaction():
+            execute_many(
+                services.SALE_INSERT_SQL,
+                list(zip(product_ids[idx].tolist(), cust.tolist(), quantity.tolist(), sold, price.tolist())),
+            )
+        report("sales", start + size, n_sales)
+
+    services.rebuild_stock_totals()
+    # Sales were bulk-inserted around add_sale, so build their daily aggregates in one pass.
+    rollups.backfill_sales_daily()
+    services.refresh_reorder_points()
+    analyze_tables(
+        ["categories", "products", "suppliers", "customers", "purchases", "sales", "sales_daily", "stock", "product_stock_totals", "reorder_points"]
+    )
+    return {
+        "categories": len(roots) + len(subs),
+        "products": n_products,
+        "suppliers": len(suppliers),
+        "customers": len(customers),
+        "batches": int(len(product_index)),
+        "sales": n_sales,
+    }
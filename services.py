@@ -1,9 +1,16 @@
+import csv
 from datetime import date, timedelta
 
-from db import fetch_all, fetch_one, run_query
+import forecast
+import margins
+import rollups
+from cache import reference_cache
+from category_tree import CategoryTree
+from db import backend, days_between_sql, execute_many, fetch_all, fetch_one, iter_batches, run_query, transaction, upsert_sql
 
 
 # CATEGORIES
+@reference_cache.cached("categories")
 def list_categories(parent_id=None):
     if parent_id is None:
         return fetch_all("SELECT * FROM categories WHERE parent_category_id IS NULL AND is_deleted = 0")
@@ -13,6 +20,7 @@ def list_categories(parent_id=None):
     )
 
 
+@reference_cache.cached("categories")
 def list_all_categories():
     return fetch_all(
         """
@@ -25,39 +33,94 @@ def list_all_categories():
     )
 
 
+@reference_cache.cached("categories")
+def get_category_tree():
+    return CategoryTree(
+        fetch_all("SELECT category_id, name, parent_category_id FROM categories WHERE is_deleted = 0")
+    )
+
+
+def get_category_rollups(from_date=None, to_date=None):
+    """
+    Stock and sales totals for every category including all of its descendants.
+
+    Products are attributed to their most specific category (subcategory when
+    set); two grouped queries fetch the per-category figures and the tree sums
+    them upwards in memory, so the cost does not grow with tree depth.
+    """
+    tree = get_category_tree()
+    values = {}
+    for row in fetch_all(
+        """
+        SELECT COALESCE(m.subcategory_id, m.category_id) AS category_id,
+               SUM(t.total_quantity) AS stock_quantity
+        FROM product_stock_totals t
+        JOIN products m ON t.product_id = m.product_id AND m.is_deleted = 0
+        GROUP BY COALESCE(m.subcategory_id, m.category_id)
+        """
+    ):
+        values.setdefault(row["category_id"], {})["stock_quantity"] = row["stock_quantity"]
+    facts, params = rollups.facts("sales", from_date, to_date)
+    for row in fetch_all(
+        f"""
+        SELECT COALESCE(m.subcategory_id, m.category_id) AS category_id,
+               SUM(f.quantity) AS sales_quantity,
+               SUM(f.amount) AS sales_revenue
+        FROM ({facts}) f
+        JOIN products m ON f.product_id = m.product_id AND m.is_deleted = 0
+        GROUP BY COALESCE(m.subcategory_id, m.category_id)
+        """,
+        params,
+    ):
+        values.setdefault(row["category_id"], {}).update(
+            sales_quantity=row["sales_quantity"], sales_revenue=row["sales_revenue"]
+        )
+    return tree.rollup(values, ("stock_quantity", "sales_quantity", "sales_revenue"))
+
+
 def add_category(name, parent_category_id=None):
-    return run_query(
+    result = run_query(
         "INSERT INTO categories (name, parent_category_id) VALUES (%s, %s)",
         (name, parent_category_id),
         return_lastrowid=True,
     )
+    reference_cache.invalidate("categories", "products")
+    return result
 
 
-def update_category(category_id, name=None, parent_category_id=None):
+def update_category(category_id, name=None, parent_category_id=None, clear_parent=False):
+    """``clear_parent`` moves the category back to the root."""
     fields = []
     params = []
     if name is not None:
         fields.append("name = %s")
         params.append(name)
-    if parent_category_id is not None:
+    if clear_parent:
+        fields.append("parent_category_id = NULL")
+    elif parent_category_id is not None:
         fields.append("parent_category_id = %s")
         params.append(parent_category_id)
     if not fields:
         return 0
     params.append(category_id)
-    return run_query(
+    result = run_query(
         f"UPDATE categories SET {', '.join(fields)} WHERE category_id = %s AND is_deleted = 0",
         params,
     )
+    reference_cache.invalidate("categories", "products")
+    return result
 
 
 def delete_category(category_id):
-    return run_query(
+    result = run_query(
         "UPDATE categories SET is_deleted = 1 WHERE category_id = %s", (category_id,)
     )
+    reference_cache.invalidate("categories", "products")
+    return result
 
 
 # PRODUCTS
+@reference_cache.cached("products")
 def list_products():
     return fetch_all(
         """
@@ -71,11 +134,16 @@ def list_products():
 
 
 def add_product(name, category_id, subcategory_id, price):
-    return run_query(
-        "INSERT INTO products (name, category_id, subcategory_id, price) VALUES (%s, %s, %s, %s)",
-        (name, category_id, subcategory_id, price),
-        return_lastrowid=True,
-    )
+    with transaction():
+        result = run_query(
+            "INSERT INTO products (name, category_id, subcategory_id, price) VALUES (%s, %s, %s, %s)",
+            (name, category_id, subcategory_id, price),
+            return_lastrowid=True,
+        )
+        # Stock writers lock this row first; see lock_stock_totals.
+        run_query(STOCK_TOTALS_CREATE_SQL, (result, 0))
+    reference_cache.invalidate("products")
+    return result
 
 
 def update_product(product_id, name=None, category_id=None, subcategory_id=None, price=None):
@@ -96,18 +164,23 @@ def update_product(product_id, name=None, category_id=None, subcategory_id=None,
     if not fields:
         return 0
     params.append(product_id)
-    return run_query(
+    result = run_query(
         f"UPDATE products SET {', '.join(fields)} WHERE product_id = %s AND is_deleted = 0",
         params,
     )
+    reference_cache.invalidate("products")
+    return result
 
 
 def delete_product(product_id):
-    return run_query(
+    result = run_query(
         "UPDATE products SET is_deleted = 1 WHERE product_id = %s", (product_id,)
     )
+    reference_cache.invalidate("products")
+    return result
 
 
+@reference_cache.cached("products")
 def get_product(product_id):
     return fetch_one(
         "SELECT * FROM products WHERE product_id = %s AND is_deleted = 0",
@@ -115,17 +188,132 @@ def get_product(product_id):
     )
 
 
+SEARCH_LIMIT = 20
+# The full-text indexes match trigrams (SQLite) or n-grams (MySQL); shorter
+# words filter the full-text matches instead of driving the lookup.
+FULLTEXT_MIN_WORD = 3
+
+
+def _like_escape(text):
+    # "!" escapes LIKE wildcards typed by the user; the same ESCAPE works on both backends.
+    return text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def _name_prefix_ids(term, limit):
+    pattern = _like_escape(term) + "%"
+    return fetch_all(
+        """
+        SELECT product_id
+        FROM products
+        WHERE is_deleted = 0 AND name LIKE %s ESCAPE '!'
+        ORDER BY name
+        LIMIT %s
+        """,
+        (pattern, limit),
+    )
+
+
+def _fulltext_ids(words, short_words, limit):
+    filters = "".join(" AND m.name LIKE %s ESCAPE '!'" for _ in short_words)
+    patterns = ["%" + _like_escape(word) + "%" for word in short_words]
+    if backend() == "sqlite":
+        return fetch_all(
+            f"""
+            SELECT products_fts.rowid AS product_id
+            FROM products_fts
+            JOIN products m ON products_fts.rowid = m.product_id AND m.is_deleted = 0
+            WHERE products_fts MATCH %s{filters}
+            ORDER BY products_fts.rank
+            LIMIT %s
+            """,
+            [" ".join('"' + word.replace('"', '""') + '"' for word in words)] + patterns + [limit],
+        )
+    query = " ".join('+"' + word.replace('"', "") + '"' for word in words)
+    return fetch_all(
+        f"""
+        SELECT m.product_id
+        FROM products m
+        WHERE m.is_deleted = 0 AND MATCH(m.name) AGAINST (%s IN BOOLEAN MODE){filters}
+        ORDER BY MATCH(m.name) AGAINST (%s IN BOOLEAN MODE) DESC
+        LIMIT %s
+        """,
+        [query] + patterns + [query, limit],
+    )
+
+
+def _category_product_ids(term, limit):
+    needle = term.lower()
+    category_ids = [c["category_id"] for c in list_all_categories() if needle in c["name"].lower()]
+    if not category_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(category_ids))
+    return fetch_all(
+        f"""
+        SELECT product_id
+        FROM products
+        WHERE is_deleted = 0 AND (category_id IN ({placeholders}) OR subcategory_id IN ({placeholders}))
+        ORDER BY name
+        LIMIT %s
+        """,
+        category_ids + category_ids + [limit],
+    )
+
+
+def search_products(term="", limit=SEARCH_LIMIT):
+    """
+    Up to ``limit`` products for a search box, as list_products rows, best first.
+
+    Names starting with ``term`` rank first (autocomplete), then names
+    containing every word of it by full-text relevance, then products in a
+    category or subcategory whose name contains it. Each step is an indexed
+    query cut off at ``limit``, so the cost does not grow with the catalogue.
+    An empty term lists the first products by name.
+    """
+    term = " ".join(term.split())
+    ranked = {}
+    steps = [lambda: _name_prefix_ids(term, limit)]
+    if term:
+        words = [word for word in term.split() if len(word) >= FULLTEXT_MIN_WORD]
+        short_words = [word for word in term.split() if len(word) < FULLTEXT_MIN_WORD]
+        if words:
+            steps.append(lambda: _fulltext_ids(words, short_words, limit))
+        steps.append(lambda: _category_product_ids(term, limit))
+    for step in steps:
+        for row in step():
+            ranked.setdefault(row["product_id"], None)
+        if len(ranked) >= limit:
+            break
+    ids = list(ranked)[:limit]
+    if not ids:
+        return []
+    rows = fetch_all(
+        f"""
+        SELECT p.*, cat.name AS category_name, subcat.name AS subcategory_name
+        FROM products p
+        LEFT JOIN categories cat ON p.category_id = cat.category_id AND cat.is_deleted = 0
+        LEFT JOIN categories subcat ON p.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
+        WHERE p.product_id IN ({", ".join(["%s"] * len(ids))})
+        """,
+        ids,
+    )
+    by_id = {row["product_id"]: row for row in rows}
+    return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+
 # SUPPLIERS
+@reference_cache.cached("suppliers")
 def list_suppliers():
     return fetch_all("SELECT * FROM suppliers WHERE is_deleted = 0")
 
 
 def add_supplier(name, contact_info):
-    return run_query(
+    result = run_query(
         "INSERT INTO suppliers (name, contact_info) VALUES (%s, %s)",
         (name, contact_info),
         return_lastrowid=True,
     )
+    reference_cache.invalidate("suppliers")
+    return result
 
 
 def update_supplier(supplier_id, name=None, contact_info=None):
@@ -140,42 +328,57 @@ def update_supplier(supplier_id, name=None, contact_info=None):
     if not fields:
         return 0
     params.append(supplier_id)
-    return run_query(
+    result = run_query(
         f"UPDATE suppliers SET {', '.join(fields)} WHERE supplier_id = %s AND is_deleted = 0",
         params,
     )
+    reference_cache.invalidate("suppliers")
+    return result
 
 
 def delete_supplier(supplier_id):
-    return run_query(
+    result = run_query(
         "UPDATE suppliers SET is_deleted = 1 WHERE supplier_id = %s", (supplier_id,)
     )
+    reference_cache.invalidate("suppliers")
+    return result
 
 
 # CUSTOMERS
+@reference_cache.cached("customers")
 def list_customers():
     return fetch_all("SELECT * FROM customers WHERE is_deleted = 0")
 
 
 def add_customer(name):
-    return run_query(
+    result = run_query(
         "INSERT INTO customers (name) VALUES (%s)", (name,), return_lastrowid=True
     )
+    reference_cache.invalidate("customers")
+    return result
 
 
 def update_customer(customer_id, name=None):
     if name is None:
         return 0
-    return run_query(
+    result = run_query(
         "UPDATE customers SET name = %s WHERE customer_id = %s AND is_deleted = 0",
         (name, customer_id),
     )
+    reference_cache.invalidate("customers")
+    return result
 
 
 def delete_customer(customer_id):
-    return run_query(
+    result = run_query(
         "UPDATE customers SET is_deleted = 1 WHERE customer_id = %s", (customer_id,)
     )
+    reference_cache.invalidate("customers")
+    return result
+
+
+def cache_stats():
+    return reference_cache.stats()
 
 
 # AUTHENTICATION
@@ -188,109 +391,607 @@ def validate_user(username, password):
 
 
 # PURCHASES
+PURCHASE_INSERT_SQL = (
+    "INSERT INTO purchases (product_id, supplier_id, quantity, purchase_date, expiry_date, purchase_price) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+PURCHASE_IMPORT_COLUMNS = (
+    "product_id",
+    "supplier_id",
+    "quantity",
+    "expiry_date",
+    "purchase_date",
+    "purchase_price",
+)
+
+
 def add_purchase(product_id, supplier_id, quantity, expiry_date=None, purchase_date=None, purchase_price=0.0):
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
     if purchase_date is None:
         purchase_date = date.today()
     # If no expiry provided, align with purchase_date to satisfy NOT NULL constraint.
     if expiry_date is None:
         expiry_date = purchase_date
-    purchase_id = run_query(
-        "INSERT INTO purchases (product_id, supplier_id, quantity, purchase_date, purchase_price) VALUES (%s, %s, %s, %s, %s)",
-        (product_id, supplier_id, quantity, purchase_date, purchase_price),
-        return_lastrowid=True,
-    )
-    upsert_stock(product_id, supplier_id, quantity, expiry_date)
+    with transaction():
+        lock_stock_totals([product_id])
+        purchase_id = run_query(
+            PURCHASE_INSERT_SQL,
+            (product_id, supplier_id, quantity, purchase_date, expiry_date, purchase_price),
+            return_lastrowid=True,
+        )
+        rollups.record_backdated("purchases", [(product_id, supplier_id, quantity, purchase_date, purchase_price)])
+        upsert_stock(product_id, supplier_id, quantity, expiry_date)
     return purchase_id
 
 
+def parse_purchase_row(row, product_ids, supplier_ids, default_date):
+    """Validate one import row; returns the purchase tuple or raises ValueError."""
+    try:
+        product_id = int(row.get("product_id") or "")
+        supplier_id = int(row.get("supplier_id") or "")
+        quantity = int(row.get("quantity") or "")
+    except ValueError:
+        raise ValueError("product_id, supplier_id and quantity must be whole numbers")
+    if product_id not in product_ids:
+        raise ValueError(f"Unknown product_id {product_id}")
+    if supplier_id not in supplier_ids:
+        raise ValueError(f"Unknown supplier_id {supplier_id}")
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    try:
+        purchase_date = date.fromisoformat(row["purchase_date"]) if row.get("purchase_date") else default_date
+        expiry_date = date.fromisoformat(row["expiry_date"]) if row.get("expiry_date") else purchase_date
+    except ValueError:
+        raise ValueError("Dates must be in YYYY-MM-DD format")
+    try:
+        purchase_price = float(row.get("purchase_price") or 0)
+    except ValueError:
+        raise ValueError("purchase_price must be a number")
+    if purchase_price < 0:
+        raise ValueError("purchase_price cannot be negative")
+    return (product_id, supplier_id, quantity, expiry_date, purchase_date, purchase_price)
+
+
+def write_purchase_batch(rows):
+    """
+    Insert (product_id, supplier_id, quantity, expiry_date, purchase_date, purchase_price)
+    rows in one transaction, merging stock upserts per batch key first.
+    """
+    merged = {}
+    for product_id, supplier_id, quantity, expiry_date, _, _ in rows:
+        key = (product_id, supplier_id, expiry_date)
+        merged[key] = merged.get(key, 0) + quantity
+    with transaction():
+        lock_stock_totals(p for p, _, _ in merged)
+        execute_many(
+            PURCHASE_INSERT_SQL,
+            [(p, s, q, pd, exp, price) for p, s, q, exp, pd, price in rows],
+        )
+        rollups.record_backdated("purchases", [(p, s, q, pd, price) for p, s, q, _, pd, price in rows])
+        execute_many(
+            STOCK_UPSERT_SQL,
+            [(p, s, q, exp) for (p, s, exp), q in merged.items()],
+        )
+        refresh_stock_totals(p for p, _, _ in merged)
+
+
+def import_purchases_csv(stream, chunk_size=500, on_progress=None):
+    """
+    Stream purchases from a CSV text stream with PURCHASE_IMPORT_COLUMNS headers.
+
+    Rows are validated against the current product and supplier ids and written
+    ``chunk_size`` at a time; invalid rows are skipped and reported. Returns
+    ``{"rows": ..., "imported": ..., "errors": [{"line": ..., "error": ...}]}``.
+    """
+    product_ids = {r["product_id"] for r in fetch_all("SELECT product_id FROM products WHERE is_deleted = 0")}
+    supplier_ids = {r["supplier_id"] for r in fetch_all("SELECT supplier_id FROM suppliers WHERE is_deleted = 0")}
+    today = date.today()
+    reader = csv.DictReader(stream)
+    missing = [c for c in ("product_id", "supplier_id", "quantity") if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    report = {"rows": 0, "imported": 0, "errors": []}
+    chunk = []
+    for row in reader:
+        report["rows"] += 1
+        try:
+            chunk.append(parse_purchase_row(row, product_ids, supplier_ids, today))
+        except ValueError as exc:
+            report["errors"].append({"line": reader.line_num, "error": str(exc)})
+        if len(chunk) >= chunk_size:
+            write_purchase_batch(chunk)
+            report["imported"] += len(chunk)
+            chunk = []
+            if on_progress:
+                on_progress(report)
+    if chunk:
+        write_purchase_batch(chunk)
+        report["imported"] += len(chunk)
+    if on_progress:
+        on_progress(report)
+    return report
+
+
 # SALES
+SALE_INSERT_SQL = (
+    "INSERT INTO sales (product_id, customer_id, quantity, sale_date, sale_price) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+
 def add_sale(product_id, customer_id, quantity, sale_date=None, sale_price=0.0):
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
     if sale_date is None:
         sale_date = date.today()
-    deduct_stock(product_id, quantity)
-    sale_id = run_query(
-        "INSERT INTO sales (product_id, customer_id, quantity, sale_date, sale_price) VALUES (%s, %s, %s, %s, %s)",
-        (product_id, customer_id, quantity, sale_date, sale_price),
-        return_lastrowid=True,
-    )
+    with transaction():
+        deduct_stock(product_id, quantity)
+        sale_id = run_query(
+            SALE_INSERT_SQL,
+            (product_id, customer_id, quantity, sale_date, sale_price),
+            return_lastrowid=True,
+        )
+        rollups.record_sales([(product_id, customer_id, quantity, sale_date, sale_price)])
     return sale_id
 
 
+def add_sale_order(customer_id, lines, sale_date=None):
+    """
+    Record a multi-line order for one customer as a single transaction.
+
+    ``lines`` are dicts with ``product_id``, ``quantity`` and optional ``sale_price``.
+    Batches for every product are locked and allocated FEFO together; if any
+    product is short the whole order is rejected with a ValueError naming each
+    shortage. Returns the number of sale rows written.
+    """
+    if not lines:
+        raise ValueError("Order has no lines")
+    if sale_date is None:
+        sale_date = date.today()
+    requested = {}
+    for line in lines:
+        if int(line["quantity"]) <= 0:
+            raise ValueError("Order quantities must be positive")
+        requested[line["product_id"]] = requested.get(line["product_id"], 0) + int(line["quantity"])
+
+    with transaction():
+        lock_stock_totals(requested)
+        allocations = []
+        shortages = []
+        for product_id, quantity in sorted(requested.items()):
+            allocated, shortfall = allocate_fefo(lock_stock_batches(product_id, quantity), quantity)
+            if shortfall > 0:
+                shortages.append(f"product {product_id} (short by {shortfall})")
+            allocations.extend(allocated)
+        if shortages:
+            raise ValueError("Insufficient stock for " + ", ".join(shortages))
+        apply_stock_deductions(allocations)
+        rows = [
+            (line["product_id"], customer_id, int(line["quantity"]), sale_date, line.get("sale_price", 0.0))
+            for line in lines
+        ]
+        execute_many(SALE_INSERT_SQL, rows)
+        rollups.record_sales(rows)
+    return len(lines)
+
+
 # STOCK HELPERS
+STOCK_UPSERT_SQL = upsert_sql(
+    "stock",
+    ("product_id", "supplier_id", "quantity", "expiry_date"),
+    keys=("product_id", "supplier_id", "expiry_date"),
+    add=("quantity",),
+)
+
+
 def upsert_stock(product_id, supplier_id, quantity, expiry_date):
-    query = """
-        INSERT INTO stock (product_id, supplier_id, quantity, expiry_date)
-        VALUES (%s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+    with transaction():
+        lock_stock_totals([product_id])
+        run_query(STOCK_UPSERT_SQL, (product_id, supplier_id, quantity, expiry_date))
+        refresh_stock_totals([product_id])
+
+
+STOCK_TOTALS_SELECT = """
+    SELECT p.product_id,
+           COALESCE(SUM(s.quantity), 0) AS total_quantity,
+           COUNT(CASE WHEN s.quantity > 0 THEN 1 END) AS batch_count,
+           MIN(CASE WHEN s.quantity > 0 THEN s.expiry_date END) AS earliest_expiry
+    FROM products p
+    LEFT JOIN stock s ON s.product_id = p.product_id
+    WHERE p.product_id IN ({placeholders})
+    GROUP BY p.product_id
+"""
+
+
+STOCK_TOTALS_CREATE_SQL = upsert_sql(
+    "product_stock_totals", ("product_id", "total_quantity"), keys=("product_id",), add=("total_quantity",)
+)
+
+
+def lock_stock_totals(product_ids):
     """
-    run_query(query, (product_id, supplier_id, quantity, expiry_date))
+    Lock the product_stock_totals rows of the given products, in product
+    order, creating any that are missing. Every transaction that changes
+    stock calls this before touching stock rows, so writers of the same
+    product queue here instead of deadlocking on each other's batch locks
+    (refresh_stock_totals reads all of a product's batches).
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    query = f"""
+        SELECT product_id FROM product_stock_totals
+        WHERE product_id IN ({', '.join(['%s'] * len(product_ids))})
+        ORDER BY product_id
+    """
+    found = {row["product_id"] for row in fetch_all(query, product_ids)}
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        # Created before locking: locking a missing row takes a gap lock, and two
+        # transactions inserting into a gap they both locked deadlock. Adding 0
+        # leaves a row another transaction created first unchanged.
+        execute_many(STOCK_TOTALS_CREATE_SQL, [(product_id, 0) for product_id in missing])
+    fetch_all(query + " FOR UPDATE", product_ids)
 
 
-def deduct_stock(product_id, quantity):
-    remaining = quantity
-    batches = fetch_all(
-        """
-        SELECT product_id, supplier_id, quantity, expiry_date
-        FROM stock
-        WHERE product_id = %s AND quantity > 0
-        ORDER BY expiry_date ASC
-        """,
-        (product_id,),
+def refresh_stock_totals(product_ids):
+    """
+    Recompute the product_stock_totals rows of the given products from their
+    batches. Called inside every transaction that changes stock, so the cost is
+    one indexed range read per touched product rather than a full aggregation.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    run_query(
+        "REPLACE INTO product_stock_totals (product_id, total_quantity, batch_count, earliest_expiry) "
+        + STOCK_TOTALS_SELECT.format(placeholders=placeholders),
+        product_ids,
     )
+
+
+def rebuild_stock_totals(chunk_size=1000):
+    """Recompute product_stock_totals for every stocked product; returns the product count."""
+    product_ids = sorted(
+        {r["product_id"] for r in fetch_all("SELECT DISTINCT product_id FROM stock")}
+        | {r["product_id"] for r in fetch_all("SELECT product_id FROM product_stock_totals")}
+    )
+    for start in range(0, len(product_ids), chunk_size):
+        with transaction():
+            refresh_stock_totals(product_ids[start:start + chunk_size])
+    return len(product_ids)
+
+
+def verify_stock_totals():
+    """Return a list of products whose stored totals differ from their batches."""
+    stored = {r["product_id"]: r for r in fetch_all("SELECT * FROM product_stock_totals")}
+    actual = {
+        r["product_id"]: r
+        for r in fetch_all(
+            """
+            SELECT product_id,
+                   SUM(quantity) AS total_quantity,
+                   COUNT(CASE WHEN quantity > 0 THEN 1 END) AS batch_count,
+                   MIN(CASE WHEN quantity > 0 THEN expiry_date END) AS earliest_expiry
+            FROM stock
+            GROUP BY product_id
+            """
+        )
+    }
+    empty = {"total_quantity": 0, "batch_count": 0, "earliest_expiry": None}
+    mismatches = []
+    for product_id in sorted(set(stored) | set(actual)):
+        have = stored.get(product_id)
+        want = actual.get(product_id, empty)
+        fields = ("total_quantity", "batch_count", "earliest_expiry")
+        if have is None or any(have[f] != want[f] for f in fields):
+            mismatches.append(
+                {
+                    "product_id": product_id,
+                    "stored": {f: have[f] for f in fields} if have else None,
+                    "actual": {f: want[f] for f in fields},
+                }
+            )
+    return mismatches
+
+
+LOCK_STOCK_BATCHES_SQL = """
+    SELECT product_id, supplier_id, quantity, expiry_date
+    FROM stock
+    WHERE product_id = %s AND quantity > 0
+    ORDER BY expiry_date ASC, supplier_id
+    LIMIT %s
+    FOR UPDATE
+"""
+
+
+def lock_stock_batches(product_id, quantity):
+    """
+    Return the first sellable batches of ``product_id`` in FEFO order that hold
+    at least ``quantity`` units (every batch if they hold fewer), locked with
+    FOR UPDATE. The locking read returns the latest committed quantities
+    rather than the transaction's snapshot. The batches are read in growing
+    pages (1, 4, 16, ...) along idx_stock_fefo, so a small sale reads and
+    locks the batch or two it takes from, not every batch of the product.
+    """
+    limit = 1
+    while True:
+        batches = fetch_all(LOCK_STOCK_BATCHES_SQL, (product_id, limit))
+        if len(batches) < limit or sum(batch["quantity"] for batch in batches) >= quantity:
+            return batches
+        limit *= 4
+
+
+def allocate_fefo(batches, quantity):
+    """
+    Split ``quantity`` across FEFO-ordered batches of one product.
+    Returns ``(allocations, shortfall)`` where allocations are (batch, units) pairs.
+    """
+    allocations = []
+    remaining = quantity
     for batch in batches:
         if remaining <= 0:
             break
-        to_remove = min(batch["quantity"], remaining)
-        run_query(
-            "UPDATE stock SET quantity = quantity - %s WHERE product_id = %s AND supplier_id = %s AND expiry_date = %s",
-            (to_remove, batch["product_id"], batch["supplier_id"], batch["expiry_date"]),
-        )
-        remaining -= to_remove
-    if remaining > 0:
-        raise ValueError("Insufficient stock to fulfill sale")
+        units = min(batch["quantity"], remaining)
+        allocations.append((batch, units))
+        remaining -= units
+    return allocations, remaining
+
+
+def apply_stock_deductions(allocations):
+    """Apply (batch, units) allocations with a single UPDATE; returns the batch count."""
+    if not allocations:
+        return 0
+    cases = []
+    keys = []
+    case_params = []
+    key_params = []
+    for batch, units in allocations:
+        cases.append("WHEN product_id = %s AND supplier_id = %s AND expiry_date = %s THEN %s")
+        keys.append("(%s, %s, %s)")
+        batch_key = (batch["product_id"], batch["supplier_id"], batch["expiry_date"])
+        case_params.extend(batch_key + (units,))
+        key_params.extend(batch_key)
+    run_query(
+        f"""
+        UPDATE stock
+        SET quantity = quantity - CASE {' '.join(cases)} ELSE 0 END
+        WHERE (product_id, supplier_id, expiry_date) IN ({', '.join(keys)})
+        """,
+        case_params + key_params,
+    )
+    refresh_stock_totals(batch["product_id"] for batch, _ in allocations)
+    return len(allocations)
+
+
+def deduct_stock(product_id, quantity):
+    with transaction():
+        lock_stock_totals([product_id])
+        batches = lock_stock_batches(product_id, quantity)
+        allocations, shortfall = allocate_fefo(batches, quantity)
+        if shortfall > 0:
+            raise ValueError("Insufficient stock to fulfill sale")
+        apply_stock_deductions(allocations)
+
+
+STOCK_ARCHIVE_INSERT_SQL = """
+    INSERT INTO stock_archive (product_id, supplier_id, expiry_date, quantity, reason, archived_on)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def sweep_stock(as_of=None, chunk_size=1000, dry_run=False):
+    """
+    Move batches that are empty or expired before ``as_of`` (default today)
+    from stock to stock_archive. An expired batch's remaining quantity is
+    recorded as a write-off (reason 'expired'); empty batches are archived
+    with reason 'empty'.
+
+    Each chunk is locked, copied, deleted and its product totals refreshed in
+    one transaction, so an interrupted sweep leaves nothing half-moved and a
+    repeat run only finds what is left. ``dry_run`` reports without moving.
+    Returns counts plus the units written off per product.
+    """
+    as_of = as_of or date.today()
+    report = {"as_of": as_of, "expired_batches": 0, "empty_batches": 0, "written_off_units": 0, "written_off": {}}
+    candidates = """
+        SELECT product_id, supplier_id, expiry_date, quantity
+        FROM stock
+        WHERE (expiry_date < %s OR quantity <= 0) {products}
+        ORDER BY product_id, supplier_id, expiry_date
+    """
+    if dry_run:
+        batches_seen = [row for rows in iter_batches(candidates.format(products=""), (as_of,)) for row in rows]
+        _tally_sweep(report, batches_seen)
+        return report
+    while True:
+        with transaction():
+            found = fetch_all(candidates.format(products="") + " LIMIT %s", (as_of, chunk_size))
+            if not found:
+                break
+            # Lock the chunk's stock totals before its batches, in the same order as sales and purchases.
+            product_ids = sorted({b["product_id"] for b in found})
+            lock_stock_totals(product_ids)
+            batches = fetch_all(
+                candidates.format(products=f"AND product_id IN ({', '.join(['%s'] * len(product_ids))})")
+                + " LIMIT %s FOR UPDATE",
+                (as_of, *product_ids, chunk_size),
+            )
+            if not batches:
+                continue
+            execute_many(
+                STOCK_ARCHIVE_INSERT_SQL,
+                [
+                    (
+                        b["product_id"],
+                        b["supplier_id"],
+                        b["expiry_date"],
+                        max(b["quantity"], 0),
+                        "expired" if b["quantity"] > 0 else "empty",
+                        as_of,
+                    )
+                    for b in batches
+                ],
+            )
+            keys = ", ".join(["(%s, %s, %s)"] * len(batches))
+            run_query(
+                f"DELETE FROM stock WHERE (product_id, supplier_id, expiry_date) IN ({keys})",
+                [value for b in batches for value in (b["product_id"], b["supplier_id"], b["expiry_date"])],
+            )
+            refresh_stock_totals(b["product_id"] for b in batches)
+        _tally_sweep(report, batches)
+        if len(found) < chunk_size:
+            break
+    return report
+
+
+def _tally_sweep(report, batches):
+    for batch in batches:
+        if batch["quantity"] > 0:
+            report["expired_batches"] += 1
+            report["written_off_units"] += batch["quantity"]
+            written_off = report["written_off"]
+            written_off[batch["product_id"]] = written_off.get(batch["product_id"], 0) + batch["quantity"]
+        else:
+            report["empty_batches"] += 1
 
 
 # REPORTS
+CURRENT_STOCK_SQL = """
+    SELECT s.product_id,
+           m.name AS product_name,
+           m.category_id,
+           m.subcategory_id,
+           cat.name AS category_name,
+           subcat.name AS subcategory_name,
+           s.supplier_id,
+           sup.name AS supplier_name,
+           s.quantity,
+           s.expiry_date
+    FROM stock s
+    JOIN products m ON s.product_id = m.product_id AND m.is_deleted = 0
+    LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
+    LEFT JOIN categories subcat ON m.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
+    JOIN suppliers sup ON s.supplier_id = sup.supplier_id AND sup.is_deleted = 0
+    ORDER BY s.expiry_date ASC
+"""
+
+
 def get_current_stock():
+    return fetch_all(CURRENT_STOCK_SQL)
+
+
+def iter_current_stock(batch_size=1000, columns=None):
+    return iter_batches(CURRENT_STOCK_SQL, batch_size=batch_size, columns=columns)
+
+
+def get_low_stock(threshold):
+    """
+    Products at or below their reorder point, or below ``threshold`` when no
+    forecast has been computed for them yet (see refresh_reorder_points).
+    """
     return fetch_all(
         """
-        SELECT s.product_id,
+        SELECT t.product_id,
                m.name AS product_name,
-               m.category_id,
-               m.subcategory_id,
                cat.name AS category_name,
                subcat.name AS subcategory_name,
-               s.supplier_id,
-               sup.name AS supplier_name,
-               s.quantity,
-               s.expiry_date
-        FROM stock s
-        JOIN products m ON s.product_id = m.product_id AND m.is_deleted = 0
+               t.total_quantity,
+               COALESCE(r.reorder_point, %s) AS reorder_point,
+               r.order_quantity
+        FROM product_stock_totals t
+        JOIN products m ON t.product_id = m.product_id AND m.is_deleted = 0
         LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
         LEFT JOIN categories subcat ON m.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
-        JOIN suppliers sup ON s.supplier_id = sup.supplier_id AND sup.is_deleted = 0
-        ORDER BY s.expiry_date ASC
-        """
+        LEFT JOIN reorder_points r ON t.product_id = r.product_id
+        WHERE t.total_quantity <= COALESCE(r.reorder_point, %s)
+        """,
+        (threshold, threshold),
     )
 
 
-def get_low_stock(threshold):
-    return fetch_all(
+def refresh_reorder_points(as_of=None, **overrides):
+    """
+    Recompute every active product's demand forecast and reorder point from
+    recent sales and replace the reorder_points table. ``overrides`` take
+    forecast.load_forecast_config keys. Returns the number of products.
+    """
+    return forecast.store(forecast.compute(as_of, **overrides))
+
+
+def get_product_stock(product_id):
+    """Stock totals of one product with its sellable batches in FEFO order."""
+    totals = fetch_one(
+        "SELECT total_quantity, batch_count, earliest_expiry FROM product_stock_totals WHERE product_id = %s",
+        (product_id,),
+    )
+    batches = fetch_all(
         """
-        SELECT s.product_id,
-               m.name AS product_name,
-               cat.name AS category_name,
-               subcat.name AS subcategory_name,
-               SUM(s.quantity) AS total_quantity
-        FROM stock s
-        JOIN products m ON s.product_id = m.product_id AND m.is_deleted = 0
-        LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
-        LEFT JOIN categories subcat ON m.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
-        GROUP BY s.product_id, m.name, cat.name, subcat.name
-        HAVING total_quantity <= %s
+        SELECT supplier_id, quantity, expiry_date
+        FROM stock
+        WHERE product_id = %s AND quantity > 0
+        ORDER BY expiry_date, supplier_id
         """,
-        (threshold,),
+        (product_id,),
     )
+    summary = {"product_id": product_id, "total_quantity": 0, "batch_count": 0, "earliest_expiry": None}
+    summary.update(totals or {})
+    summary["batches"] = batches
+    return summary
+
+
+def get_dashboard_summary(low_stock_threshold, recent=10):
+    """
+    Everything the dashboard shows, aggregated in SQL on one connection:
+    entity counts, expired batch count, per-product stock (from
+    product_stock_totals), low stock and the most recent purchases and
+    sales. Category and overall totals are summed from the per-product
+    aggregates.
+    """
+    with transaction(readonly=True):
+        summary = fetch_one(
+            """
+            SELECT (SELECT COUNT(*) FROM products WHERE is_deleted = 0) AS products,
+                   (SELECT COUNT(*) FROM suppliers WHERE is_deleted = 0) AS suppliers,
+                   (SELECT COUNT(*) FROM customers WHERE is_deleted = 0) AS customers,
+                   (SELECT COUNT(*)
+                    FROM stock s
+                    JOIN products m ON s.product_id = m.product_id AND m.is_deleted = 0
+                    JOIN suppliers sup ON s.supplier_id = sup.supplier_id AND sup.is_deleted = 0
+                    WHERE s.expiry_date < %s) AS expired_batches
+            """,
+            (date.today(),),
+        )
+        stock_by_product = fetch_all(
+            """
+            SELECT m.product_id,
+                   m.name AS product_name,
+                   cat.name AS category_name,
+                   t.total_quantity AS quantity
+            FROM product_stock_totals t
+            JOIN products m ON t.product_id = m.product_id AND m.is_deleted = 0
+            LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
+            ORDER BY m.name
+            """
+        )
+        summary["low_stock"] = get_low_stock(low_stock_threshold)
+        summary["recent_purchases"] = get_purchase_report(limit=recent)
+        summary["recent_sales"] = get_sales_report(limit=recent)
+
+    by_category = {}
+    for row in stock_by_product:
+        category = row["category_name"] or "Unassigned"
+        by_category[category] = by_category.get(category, 0) + row["quantity"]
+    summary["stock_by_product"] = stock_by_product
+    summary["stock_by_category"] = [
+        {"category_name": name, "quantity": quantity} for name, quantity in sorted(by_category.items())
+    ]
+    summary["total_stock"] = sum(by_category.values())
+    return summary
 
 
 def get_near_expiry(days=30):
@@ -328,9 +1029,57 @@ def get_expired():
     )
 
 
-def get_sales_report():
+def get_stock_write_offs(from_date=None, to_date=None):
+    """Units written off by the expiry sweep per product, largest first."""
+    where, params = _report_filters("a", "archive_id", "archived_on", None, from_date, to_date, {"reason": "expired"})
     return fetch_all(
-        """
+        f"""
+        SELECT a.product_id,
+               m.name AS product_name,
+               COUNT(*) AS batches,
+               SUM(a.quantity) AS units,
+               MIN(a.expiry_date) AS earliest_expiry,
+               MAX(a.archived_on) AS last_archived_on
+        FROM stock_archive a
+        JOIN products m ON a.product_id = m.product_id
+        {where}
+        GROUP BY a.product_id, m.name
+        ORDER BY units DESC
+        """,
+        params,
+    )
+
+
+def _report_filters(alias, id_column, date_column, before_id, from_date, to_date, equals):
+    conditions = []
+    params = []
+    if before_id is not None:
+        conditions.append(f"{alias}.{id_column} < %s")
+        params.append(before_id)
+    if from_date is not None:
+        conditions.append(f"{alias}.{date_column} >= %s")
+        params.append(from_date)
+    if to_date is not None:
+        conditions.append(f"{alias}.{date_column} <= %s")
+        params.append(to_date)
+    for column, value in equals.items():
+        if value is not None:
+            conditions.append(f"{alias}.{column} = %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def _sales_report_query(limit=None, before_id=None, from_date=None, to_date=None, product_id=None, customer_id=None):
+    where, params = _report_filters(
+        "sa", "sale_id", "sale_date", before_id, from_date, to_date,
+        {"product_id": product_id, "customer_id": customer_id},
+    )
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(limit)
+    query = f"""
         SELECT sa.sale_id,
                sa.product_id,
                m.name AS product_name,
@@ -346,14 +1095,36 @@ def get_sales_report():
         LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
         LEFT JOIN categories subcat ON m.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
         JOIN customers cust ON sa.customer_id = cust.customer_id AND cust.is_deleted = 0
+        {where}
         ORDER BY sa.sale_id DESC
-        """
-    )
+        {limit_clause}
+    """
+    return query, params
 
 
-def get_purchase_report():
-    return fetch_all(
-        """
+def get_sales_report(limit=None, before_id=None, from_date=None, to_date=None, product_id=None, customer_id=None):
+    """
+    Sales newest first. Pass ``limit`` and the last seen ``sale_id`` as
+    ``before_id`` to page through history; date/product/customer filters run in SQL.
+    """
+    return fetch_all(*_sales_report_query(limit, before_id, from_date, to_date, product_id, customer_id))
+
+
+def iter_sales_report(from_date=None, to_date=None, product_id=None, customer_id=None, batch_size=1000, columns=None):
+    query, params = _sales_report_query(None, None, from_date, to_date, product_id, customer_id)
+    return iter_batches(query, params, batch_size=batch_size, columns=columns)
+
+
+def _purchase_report_query(limit=None, before_id=None, from_date=None, to_date=None, product_id=None, supplier_id=None):
+    where, params = _report_filters(
+        "p", "purchase_id", "purchase_date", before_id, from_date, to_date,
+        {"product_id": product_id, "supplier_id": supplier_id},
+    )
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(limit)
+    query = f"""
         SELECT p.purchase_id,
                p.product_id,
                m.name AS product_name,
@@ -369,6 +1140,291 @@ def get_purchase_report():
         LEFT JOIN categories cat ON m.category_id = cat.category_id AND cat.is_deleted = 0
         LEFT JOIN categories subcat ON m.subcategory_id = subcat.category_id AND subcat.is_deleted = 0
         JOIN suppliers sup ON p.supplier_id = sup.supplier_id AND sup.is_deleted = 0
+        {where}
         ORDER BY p.purchase_id DESC
-        """
+        {limit_clause}
+    """
+    return query, params
+
+
+def get_purchase_report(limit=None, before_id=None, from_date=None, to_date=None, product_id=None, supplier_id=None):
+    """
+    Purchases newest first. Pass ``limit`` and the last seen ``purchase_id`` as
+    ``before_id`` to page through history; date/product/supplier filters run in SQL.
+    """
+    return fetch_all(*_purchase_report_query(limit, before_id, from_date, to_date, product_id, supplier_id))
+
+
+def iter_purchase_report(from_date=None, to_date=None, product_id=None, supplier_id=None, batch_size=1000, columns=None):
+    query, params = _purchase_report_query(None, None, from_date, to_date, product_id, supplier_id)
+    return iter_batches(query, params, batch_size=batch_size, columns=columns)
+
+
+def _average_price(rows, column):
+    # price_total / line_count reproduces AVG(price) over the raw rows.
+    for row in rows:
+        price_total = row.pop("price_total")
+        line_count = row.pop("line_count")
+        row[column] = price_total / line_count if line_count else None
+    return rows
+
+
+def get_sale_price_summary(from_date=None, to_date=None, product_id=None, customer_id=None):
+    facts, params = rollups.facts(
+        "sales", from_date, to_date, {"product_id": product_id, "customer_id": customer_id}
+    )
+    rows = fetch_all(
+        f"""
+        SELECT m.name AS product_name, SUM(f.price_total) AS price_total, SUM(f.line_count) AS line_count
+        FROM ({facts}) f
+        JOIN products m ON f.product_id = m.product_id AND m.is_deleted = 0
+        JOIN customers cust ON f.customer_id = cust.customer_id AND cust.is_deleted = 0
+        GROUP BY m.product_id, m.name
+        ORDER BY m.name
+        """,
+        params,
+    )
+    return _average_price(rows, "avg_sale_price")
+
+
+def get_purchase_price_summary(from_date=None, to_date=None, product_id=None, supplier_id=None):
+    facts, params = rollups.facts(
+        "purchases", from_date, to_date, {"product_id": product_id, "supplier_id": supplier_id}
     )
+    rows = fetch_all(
+        f"""
+        SELECT m.name AS product_name, SUM(f.price_total) AS price_total, SUM(f.line_count) AS line_count
+        FROM ({facts}) f
+        JOIN products m ON f.product_id = m.product_id AND m.is_deleted = 0
+        JOIN suppliers sup ON f.supplier_id = sup.supplier_id AND sup.is_deleted = 0
+        GROUP BY m.product_id, m.name
+        ORDER BY m.name
+        """,
+        params,
+    )
+    return _average_price(rows, "avg_purchase_price")
+
+
+TREND_WINDOWS = (7, 30, 365)
+
+
+def get_sales_trend(from_date=None, to_date=None, product_id=None, windows=TREND_WINDOWS):
+    """
+    Daily sales with trailing moving sums, read from sales_daily only.
+
+    One row per day from ``from_date`` (default a year before ``to_date``) to
+    ``to_date`` (default today), including days without sales, with quantity,
+    revenue and sale_count plus ``<column>_<n>d`` sums over the last n days.
+    """
+    to_date = to_date or date.today()
+    from_date = from_date or to_date - timedelta(days=364)
+    start = from_date - timedelta(days=max(windows) - 1)
+    where, params = _report_filters("d", None, "sale_date", None, start, to_date, {"product_id": product_id})
+    daily = {
+        row["sale_date"]: row
+        for row in fetch_all(
+            f"""
+            SELECT d.sale_date,
+                   SUM(d.quantity) AS quantity,
+                   SUM(d.revenue) AS revenue,
+                   SUM(d.sale_count) AS sale_count
+            FROM sales_daily d
+            {where}
+            GROUP BY d.sale_date
+            """,
+            params,
+        )
+    }
+    columns = ("quantity", "revenue", "sale_count")
+    # Prefix sums over a dense day range turn every window into one subtraction.
+    days = [start + timedelta(days=i) for i in range((to_date - start).days + 1)]
+    prefix = {column: [0] for column in columns}
+    for day in days:
+        row = daily.get(day)
+        for column in columns:
+            prefix[column].append(prefix[column][-1] + (row[column] if row else 0))
+    trend = []
+    for i, day in enumerate(days):
+        if day < from_date:
+            continue
+        point = {"day": day}
+        for column in columns:
+            point[column] = prefix[column][i + 1] - prefix[column][i]
+            for window in windows:
+                point[f"{column}_{window}d"] = prefix[column][i + 1] - prefix[column][max(i + 1 - window, 0)]
+        trend.append(point)
+    return trend
+
+
+# MARGINS
+MARGIN_FIELDS = ("units", "revenue", "cogs", "written_off_units", "write_off_cost", "uncosted_units")
+
+
+def _margin_rows(frame, group_by, fields):
+    if group_by == "category":
+        products = fetch_all("SELECT product_id, COALESCE(subcategory_id, category_id) AS category_id FROM products")
+        frame = margins.by_category(
+            frame, get_category_tree(), {p["product_id"]: p["category_id"] for p in products}, fields
+        )
+    elif group_by == "product":
+        names = {p["product_id"]: p["name"] for p in fetch_all("SELECT product_id, name FROM products")}
+        frame.insert(frame.columns.get_loc("product_id") + 1, "product_name", frame["product_id"].map(names))
+    else:
+        raise ValueError("group_by must be 'product' or 'category'")
+    return frame
+
+
+def get_margin_report(from_date=None, to_date=None, group_by="product", period=None):
+    """
+    Units sold, revenue, COGS, gross margin and expired write-off cost per
+    product or category (subtotals include subcategories), optionally split by
+    ``period`` ('day', 'month' or 'year'). Costs come from a FEFO replay of the
+    whole history through ``to_date``; see margins.replay.
+    """
+    issues, _ = margins.replay(to_date)
+    return _margin_report(issues, from_date, group_by, period)
+
+
+def _margin_report(issues, from_date, group_by, period):
+    table = margins.margin_table(issues, from_date, period)
+    table = _margin_rows(table, group_by, MARGIN_FIELDS)
+    return margins.add_margins(table).to_dict("records")
+
+
+def get_inventory_valuation(as_of=None, group_by="product"):
+    """Units and FEFO cost of the stock left at ``as_of`` per product or category."""
+    _, stock = margins.replay(as_of)
+    table = _margin_rows(stock[stock["units"] > 0], group_by, ("units", "value"))
+    return table.round({"value": 2}).to_dict("records")
+
+
+def get_margin_overview(from_date=None, to_date=None, group_by="product", period=None):
+    """
+    Everything the margins report shows from one FEFO replay: the
+    ``get_margin_report`` rows, the MARGIN_FIELDS totals over all products
+    and the FEFO cost of the stock left at ``to_date``.
+    """
+    issues, stock = margins.replay(to_date)
+    table = margins.margin_table(issues, from_date)
+    return {
+        "rows": _margin_report(issues, from_date, group_by, period),
+        "totals": {field: table[field].sum().item() for field in MARGIN_FIELDS},
+        "inventory_value": round(float(stock["value"].sum()), 2),
+    }
+
+
+# REPLENISHMENT
+def _supplier_history(threshold, since):
+    """
+    Purchase history of every low-stock product per active supplier since
+    ``since``, aggregated in SQL: units, quantity-weighted unit price, last
+    purchase date and average shelf life (days from purchase to expiry) of
+    the batches received.
+    """
+    return fetch_all(
+        f"""
+        SELECT p.product_id,
+               p.supplier_id,
+               sup.name AS supplier_name,
+               COUNT(*) AS purchase_count,
+               SUM(p.quantity) AS units,
+               SUM(p.quantity * p.purchase_price) AS amount,
+               MAX(p.purchase_date) AS last_purchase_date,
+               AVG({days_between_sql("p.expiry_date", "p.purchase_date")}) AS shelf_life_days
+        FROM purchases p
+        JOIN suppliers sup ON p.supplier_id = sup.supplier_id AND sup.is_deleted = 0
+        WHERE p.product_id IN (
+                SELECT t.product_id
+                FROM product_stock_totals t
+                LEFT JOIN reorder_points r ON t.product_id = r.product_id
+                WHERE t.total_quantity <= COALESCE(r.reorder_point, %s)
+              )
+          AND p.purchase_date >= %s
+        GROUP BY p.product_id, p.supplier_id, sup.name
+        """,
+        (threshold, since),
+    )
+
+
+def get_purchase_suggestions(threshold, lookback_days=365, price_weight=0.7):
+    """
+    Draft purchase orders for every product in get_low_stock, one per supplier.
+
+    Each product goes to the supplier with the best score over the last
+    ``lookback_days`` of purchases: ``price_weight`` times the cheapest price
+    relative to theirs plus the rest times their shelf life relative to the
+    longest, so 1.0 is cheapest and longest-lived. The quantity is the
+    forecast order quantity, and at least enough to lift stock above the
+    reorder point. Products never bought from an active supplier in the
+    window are returned as ``unsourced``.
+    """
+    low = {row["product_id"]: row for row in get_low_stock(threshold)}
+    offers = {}
+    for row in _supplier_history(threshold, date.today() - timedelta(days=lookback_days)):
+        if row["product_id"] in low and row["units"]:
+            row["unit_price"] = round(float(row["amount"]) / float(row["units"]), 2)
+            if row["shelf_life_days"] is not None:
+                row["shelf_life_days"] = float(row["shelf_life_days"])
+            offers.setdefault(row["product_id"], []).append(row)
+
+    orders = {}
+    unsourced = []
+    for product_id, product in sorted(low.items()):
+        quantity = max(product["order_quantity"] or 0, product["reorder_point"] - product["total_quantity"] + 1)
+        candidates = offers.get(product_id)
+        if not candidates:
+            unsourced.append({**product, "quantity": quantity})
+            continue
+        best_price = min(c["unit_price"] for c in candidates)
+        best_shelf = max(c["shelf_life_days"] or 0 for c in candidates)
+        for c in candidates:
+            price_score = best_price / c["unit_price"] if c["unit_price"] > 0 else 1.0
+            shelf_score = (c["shelf_life_days"] or 0) / best_shelf if best_shelf > 0 else 1.0
+            c["score"] = round(price_weight * price_score + (1 - price_weight) * shelf_score, 3)
+        best = max(candidates, key=lambda c: (c["score"], c["last_purchase_date"]))
+        order = orders.setdefault(
+            best["supplier_id"],
+            {"supplier_id": best["supplier_id"], "supplier_name": best["supplier_name"], "lines": [], "total": 0.0},
+        )
+        order["lines"].append(
+            {
+                "product_id": product_id,
+                "product_name": product["product_name"],
+                "quantity": quantity,
+                "unit_price": best["unit_price"],
+                "shelf_life_days": round(best["shelf_life_days"]) if best["shelf_life_days"] is not None else None,
+                "score": best["score"],
+                "suppliers_considered": len(candidates),
+                "total_quantity": product["total_quantity"],
+                "reorder_point": product["reorder_point"],
+            }
+        )
+        order["total"] = round(order["total"] + quantity * best["unit_price"], 2)
+    return {
+        "orders": sorted(orders.values(), key=lambda o: o["supplier_name"]),
+        "unsourced": unsourced,
+    }
+
+
+def accept_purchase_orders(orders, purchase_date=None):
+    """
+    Record draft orders from get_purchase_suggestions as purchases in one
+    transaction. Each batch expires after the supplier's average shelf life,
+    or on the purchase date when that is unknown, as in add_purchase.
+    Returns the number of purchase rows written.
+    """
+    purchase_date = purchase_date or date.today()
+    rows = []
+    for order in orders:
+        for line in order["lines"]:
+            quantity = int(line["quantity"])
+            if quantity <= 0:
+                raise ValueError("Order quantities must be positive")
+            shelf_life = line.get("shelf_life_days")
+            expiry_date = purchase_date + timedelta(days=shelf_life) if shelf_life else purchase_date
+            rows.append(
+                (line["product_id"], order["supplier_id"], quantity, expiry_date, purchase_date, line["unit_price"])
+            )
+    if rows:
+        write_purchase_batch(rows)
+    return len(rows)
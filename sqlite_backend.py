@@ -0,0 +1,141 @@
+import re
+import sqlite3
+from datetime import date
+from functools import lru_cache
+
+
+# Columns computed by aggregates (MIN(expiry_date) AS earliest_expiry, ...) carry no
+# declared type, so dates are recognised by the naming convention used throughout.
+DATE_COLUMN = re.compile(r"(_date|expiry|month)$")
+LOCKING_CLAUSE = re.compile(r"\s+FOR\s+(UPDATE|SHARE)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def translate(query):
+    """
+    Rewrite a MySQL-style statement for sqlite3: ``%s`` placeholders become
+    ``?`` and ``FOR UPDATE``/``FOR SHARE`` are dropped, since write
+    transactions already hold the database write lock from ``BEGIN IMMEDIATE``.
+    """
+    query = LOCKING_CLAUSE.sub("", query)
+    return query.replace("%s", "?").replace("%%", "%")
+
+
+def _dict_row(cursor, row):
+    record = {}
+    for (name, *_), value in zip(cursor.description, row):
+        if isinstance(value, str) and DATE_COLUMN.search(name):
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                pass
+        record[name] = value
+    return record
+
+
+class Cursor:
+    """The subset of the mysql-connector cursor API that db.py uses."""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def column_names(self):
+        return tuple(name for name, *_ in self._cursor.description or ())
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate(query), tuple(params))
+
+    def executemany(self, query, seq_params):
+        # One transaction for the whole batch rather than one per row in autocommit mode.
+        self._connection.begin_if_idle()
+        self._cursor.executemany(translate(query), [tuple(p) for p in seq_params])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """
+    sqlite3 connection behind the mysql-connector interface db.py expects.
+
+    The underlying connection runs in autocommit mode; transactions are opened
+    explicitly by ``start_transaction`` (``BEGIN IMMEDIATE`` for writes so a
+    read-then-write unit never fails upgrading its lock) and statements outside
+    one commit on their own.
+    """
+
+    unread_result = False
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self, dictionary=False, buffered=False):
+        return Cursor(self, dictionary=dictionary)
+
+    def start_transaction(self, readonly=False):
+        self.raw.execute("BEGIN" if readonly else "BEGIN IMMEDIATE")
+
+    def begin_if_idle(self):
+        if not self.raw.in_transaction:
+            self.raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.commit()
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.rollback()
+
+    def ping(self, reconnect=False):
+        self.raw.execute("SELECT 1").fetchone()
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        # Refreshes planner statistics for tables this connection queried, as SQLite
+        # recommends; pooled connections close on recycle, so stats stay current.
+        try:
+            self.raw.execute("PRAGMA optimize")
+        finally:
+            self.raw.close()
+
+
+def connect(path, busy_timeout=5000):
+    """
+    Open ``path`` in WAL mode with foreign keys enforced. Connections are
+    handed between threads by the pool, never shared by two at once.
+    """
+    raw = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    raw.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+    raw.execute("PRAGMA journal_mode = WAL")
+    raw.execute("PRAGMA synchronous = NORMAL")
+    raw.execute("PRAGMA foreign_keys = ON")
+    return Connection(raw)
@@ -0,0 +1,27 @@
+import os
+
+# The tests run against the embedded SQLite backend, or against MySQL when
+# TEST_MYSQL_DATABASE names a scratch database (reached with the usual DB_HOST,
+# DB_USER, ... settings) that every test drops and recreates. Modules build
+# some SQL for the configured backend at import time, so this must be set first.
+os.environ["DB_BACKEND"] = "mysql" if os.getenv("TEST_MYSQL_DATABASE") else "sqlite"
+
+import pytest
+
+import db
+import migrate
+from cache import reference_cache
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh database with the schema and its sample data; yields the SQLite file path."""
+    path = tmp_path / "inventory.db"
+    monkeypatch.setenv("DB_PATH", str(path))
+    monkeypatch.setenv("DB_NAME", os.getenv("TEST_MYSQL_DATABASE", ""))
+    db.reset_pool()
+    reference_cache.clear()
+    migrate.init_schema()
+    yield path
+    db.reset_pool()
+    reference_cache.clear()
@@ -0,0 +1,91 @@
+import asyncio
+import csv
+import io
+import json
+import os
+
+import pytest
+
+from api import APIServer, Download
+from db import fetch_one
+
+
+def request(method, target, body):
+    server = APIServer()
+    try:
+        return asyncio.run(server._respond(method, target, {}, json.dumps(body).encode(), "test"))
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize(
+    "target, body",
+    [
+        ("/sales", {"product_id": 1, "customer_id": 1, "quantity": -5}),
+        ("/sales", {"customer_id": 1, "lines": [{"product_id": 1, "quantity": 0}]}),
+        ("/purchases", {"product_id": 1, "supplier_id": 1, "quantity": -50}),
+    ],
+)
+def test_non_positive_quantities_are_rejected(database, target, body):
+    stock_before = fetch_one("SELECT SUM(quantity) AS units FROM stock WHERE product_id = 1")
+    status, result = request("POST", target, body)
+    assert status == 400
+    assert result == {"error": "quantity must be positive"}
+    assert fetch_one("SELECT SUM(quantity) AS units FROM stock WHERE product_id = 1") == stock_before
+
+
+@pytest.mark.parametrize(
+    "target, body",
+    [
+        ("/sales", {"product_id": 1, "customer_id": 9999, "quantity": 1}),
+        ("/purchases", {"product_id": 9999, "supplier_id": 1, "quantity": 1}),
+        ("/purchases", {"product_id": 1, "supplier_id": 9999, "quantity": 1}),
+    ],
+)
+def test_unknown_ids_are_not_found(database, target, body):
+    status, result = request("POST", target, body)
+    assert status == 404
+    assert "Unknown" in result["error"]
+
+
+class Sink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, chunk):
+        self.data.extend(chunk)
+
+    async def drain(self):
+        pass
+
+
+def test_export_is_sent_from_disk_and_removed(database, monkeypatch):
+    monkeypatch.setattr("api.EXPORT_CHUNK", 100)
+    status, download = request("GET", "/exports/stock.csv", {})
+    assert status == 200 and isinstance(download, Download)
+    sink = Sink()
+    server = APIServer()
+    try:
+        asyncio.run(server._write(sink, status, download, keep_alive=True))
+    finally:
+        server.close()
+    head, body = bytes(sink.data).split(b"\r\n\r\n", 1)
+    assert b"Content-Type: text/csv" in head
+    assert f"Content-Length: {len(body)}".encode() in head
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+    assert len(rows) == fetch_one("SELECT COUNT(*) AS n FROM stock")["n"]
+    assert not os.path.exists(download.path)
+
+
+def test_unknown_export_is_not_found(database):
+    status, result = request("GET", "/exports/secrets.csv", {})
+    assert status == 404
+
+
+@pytest.mark.parametrize("target", ["/products/search?q=a", "/reports/sales", "/reports/purchases"])
+@pytest.mark.parametrize("limit", ["0", "-1"])
+def test_non_positive_limits_are_rejected(database, target, limit):
+    separator = "&" if "?" in target else "?"
+    status, result = request("GET", f"{target}{separator}limit={limit}", {})
+    assert status == 400
+    assert result == {"error": "limit must be positive"}
@@ -0,0 +1,24 @@
+from cache import QueryCache
+from db import fetch_one, run_query
+
+
+def test_write_in_another_process_reaches_this_cache(database):
+    # Two caches stand in for two processes sharing the database.
+    app, api = QueryCache(), QueryCache()
+    loads = []
+
+    @api.cached("customers")
+    def customer_name(customer_id):
+        loads.append(customer_id)
+        return fetch_one("SELECT name FROM customers WHERE customer_id = %s", (customer_id,))["name"]
+
+    original = customer_name(1)
+    assert customer_name(1) == original
+    assert loads == [1]
+
+    run_query("UPDATE customers SET name = %s WHERE customer_id = 1", ("Renamed Clinic",))
+    app.invalidate("customers")
+
+    assert customer_name(1) == "Renamed Clinic"
+    assert customer_name(1) == "Renamed Clinic"
+    assert loads == [1, 1]
@@ -0,0 +1,20 @@
+import services
+
+
+def test_subcategory_moves_back_to_the_root(database):
+    root_id = services.add_category("Move Root")
+    child_id = services.add_category("Move Child", root_id)
+    assert services.get_category_tree().nodes[child_id]["parent_category_id"] == root_id
+
+    services.update_category(child_id, "Move Child", None, clear_parent=True)
+
+    tree = services.get_category_tree()
+    assert tree.nodes[child_id]["parent_category_id"] is None
+    assert child_id in [c["category_id"] for c in tree.roots()]
+
+
+def test_parent_is_kept_unless_cleared(database):
+    root_id = services.add_category("Keep Root")
+    child_id = services.add_category("Keep Child", root_id)
+    services.update_category(child_id, name="Kept Child")
+    assert services.get_category_tree().nodes[child_id]["parent_category_id"] == root_id
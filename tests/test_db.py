@@ -0,0 +1,43 @@
+import pytest
+
+from db import days_between_sql, fetch_one, run_query, upsert_sql
+
+
+@pytest.mark.parametrize(
+    "backend, expected",
+    [
+        ("sqlite", "INSERT INTO t (k, n, v) VALUES (%s, %s, %s) ON CONFLICT (k) DO UPDATE SET n = n + excluded.n, v = excluded.v"),
+        ("mysql", "INSERT INTO t (k, n, v) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n), v = VALUES(v)"),
+    ],
+)
+def test_upsert_sql_per_backend(monkeypatch, backend, expected):
+    monkeypatch.setenv("DB_BACKEND", backend)
+    assert upsert_sql("t", ("k", "n", "v"), keys=("k",), add=("n",), replace=("v",)) == expected
+
+
+@pytest.mark.parametrize(
+    "backend, expected",
+    [("sqlite", "CAST(julianday(a) - julianday(b) AS INTEGER)"), ("mysql", "DATEDIFF(a, b)")],
+)
+def test_days_between_sql_per_backend(monkeypatch, backend, expected):
+    monkeypatch.setenv("DB_BACKEND", backend)
+    assert days_between_sql("a", "b") == expected
+
+
+def test_upsert_adds_and_replaces(database):
+    add = upsert_sql("cache_generations", ("namespace", "generation"), keys=("namespace",), add=("generation",))
+    replace = upsert_sql("cache_generations", ("namespace", "generation"), keys=("namespace",), replace=("generation",))
+    generation = "SELECT generation FROM cache_generations WHERE namespace = 'upsert'"
+    run_query(add, ("upsert", 2))
+    run_query(add, ("upsert", 3))
+    assert fetch_one(generation)["generation"] == 5
+    run_query(replace, ("upsert", 1))
+    assert fetch_one(generation)["generation"] == 1
+
+
+def test_days_between_counts_whole_days_across_a_leap_day(database):
+    row = fetch_one(
+        f"SELECT {days_between_sql('expiry_date', 'purchase_date')} AS days FROM purchases "
+        "WHERE product_id = 4 AND purchase_date = '2024-01-28'"
+    )
+    assert row["days"] == 33
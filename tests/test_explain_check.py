@@ -0,0 +1,31 @@
+from explain_check import full_scans
+
+
+def plan(*details):
+    return [{"id": i, "parent": 0, "notused": 0, "detail": detail} for i, detail in enumerate(details)]
+
+
+PAGE = "SELECT sa.sale_id FROM sales sa JOIN products m ON sa.product_id = m.product_id ORDER BY sa.sale_id DESC LIMIT %s"
+
+
+def test_unfiltered_limit_walk_is_not_a_full_scan():
+    walk = plan("SCAN sa", "SEARCH m USING INTEGER PRIMARY KEY (rowid=?)")
+    assert full_scans(walk, set(), PAGE) == []
+
+
+def test_walk_that_sorts_reads_everything():
+    sorted_scan = plan("SCAN sa", "SEARCH m USING INTEGER PRIMARY KEY (rowid=?)", "USE TEMP B-TREE FOR ORDER BY")
+    assert [row["detail"] for row in full_scans(sorted_scan, set(), PAGE)] == ["SCAN sa"]
+
+
+def test_filtered_walk_is_a_full_scan():
+    query = PAGE.replace("ORDER BY", "WHERE sa.customer_id = %s ORDER BY")
+    walk = plan("SCAN sa", "SEARCH m USING INTEGER PRIMARY KEY (rowid=?)")
+    assert [row["detail"] for row in full_scans(walk, set(), query)] == ["SCAN sa"]
+
+
+def test_scan_of_a_joined_table_is_a_full_scan():
+    query = "SELECT * FROM sales sa JOIN products m ON sa.product_id = m.product_id LIMIT %s"
+    joined = plan("SEARCH sa USING INDEX idx_sales_customer (customer_id=?)", "SCAN m")
+    assert [row["detail"] for row in full_scans(joined, set(), query)] == ["SCAN m"]
+    assert full_scans(joined, {"m"}, query) == []
@@ -0,0 +1,26 @@
+import csv
+from datetime import date, timedelta
+
+import pyarrow.parquet as pq
+
+import exports
+
+FUTURE = date.today() + timedelta(days=365)
+
+
+def test_empty_csv_export_keeps_its_header(database, tmp_path):
+    path = tmp_path / "sales.csv"
+    assert exports.export_report("sales", "csv", path, from_date=FUTURE) == 0
+    with open(path, newline="") as fileobj:
+        reader = csv.reader(fileobj)
+        header = next(reader)
+        assert list(reader) == []
+    assert header[:3] == ["sale_id", "product_id", "product_name"]
+
+
+def test_empty_parquet_export_is_a_readable_file(database, tmp_path):
+    path = tmp_path / "purchases.parquet"
+    assert exports.export_report("purchases", "parquet", path, from_date=FUTURE) == 0
+    table = pq.read_table(path)
+    assert table.num_rows == 0
+    assert "purchase_id" in table.column_names and "supplier_name" in table.column_names
@@ -0,0 +1,109 @@
+from datetime import date
+
+import numpy as np
+
+from margins import fefo_costs
+
+
+def dates(*days):
+    return np.array(days, dtype="datetime64[D]")
+
+
+def test_sale_is_not_costed_against_a_later_purchase():
+    # Layers in FEFO order: the $5 batch bought Feb 1 expires first, but the
+    # Jan 2 sale can only take the $1 batch that was on hand.
+    cost, uncosted, products, units, value = fefo_costs(
+        layer_product=[1, 1],
+        layer_quantity=[100, 100],
+        layer_price=[5.0, 1.0],
+        layer_arrival=dates(date(2024, 2, 1), date(2024, 1, 1)),
+        issue_product=[1, 1],
+        issue_quantity=[10, 10],
+        issue_date=dates(date(2024, 1, 2), date(2024, 2, 2)),
+    )
+    assert cost.tolist() == [10.0, 50.0]
+    assert uncosted.tolist() == [0, 0]
+    assert units.tolist() == [180]
+    assert value.tolist() == [90 * 1.0 + 90 * 5.0]
+
+
+def test_later_purchases_leave_earlier_costs_unchanged():
+    layers = {
+        "layer_product": [1, 1],
+        "layer_quantity": [5, 20],
+        "layer_price": [3.0, 2.0],
+        "layer_arrival": dates(date(2024, 3, 1), date(2024, 1, 1)),
+    }
+    sale = {"issue_product": [1], "issue_quantity": [4], "issue_date": dates(date(2024, 1, 15))}
+    before, *_ = fefo_costs(**{k: v[1:] for k, v in layers.items()}, **sale)
+    after, *_ = fefo_costs(**layers, **sale)
+    assert before.tolist() == after.tolist() == [8.0]
+
+
+def test_units_beyond_stock_received_so_far_are_uncosted():
+    cost, uncosted, _, units, _ = fefo_costs(
+        layer_product=[1, 1],
+        layer_quantity=[3, 10],
+        layer_price=[1.0, 2.0],
+        layer_arrival=dates(date(2024, 1, 1), date(2024, 1, 10)),
+        issue_product=[1],
+        issue_quantity=[5],
+        issue_date=dates(date(2024, 1, 5)),
+    )
+    assert cost.tolist() == [3.0]
+    assert uncosted.tolist() == [2]
+    assert units.tolist() == [10]
+
+
+def reference_fefo(layers, issues):
+    """One issue at a time: take the earliest-expiring units already received."""
+    left = [quantity for _, _, quantity, _ in layers]
+    cost = []
+    uncosted = []
+    for day, need in issues:
+        total = 0.0
+        for k, (arrival, _, _, price) in enumerate(layers):
+            if arrival <= day:
+                take = min(left[k], need)
+                total += take * price
+                left[k] -= take
+                need -= take
+        cost.append(total)
+        uncosted.append(need)
+    return cost, uncosted, sum(left)
+
+
+def test_matches_issue_by_issue_fefo_on_random_histories():
+    rng = np.random.default_rng(7)
+    day_zero = np.datetime64("2024-01-01")
+    for _ in range(300):
+        layer_rows, issue_rows = [], []
+        expected_cost, expected_uncosted, expected_units = [], [], []
+        for product in range(1, rng.integers(1, 5) + 1):
+            # (arrival, expiry, quantity, price) in FEFO order; (date, quantity) in date order.
+            layers = [
+                (int(rng.integers(0, 20)), int(rng.integers(0, 40)), int(rng.integers(0, 8)), float(rng.integers(1, 9)))
+                for _ in range(rng.integers(1, 6))
+            ]
+            layers.sort(key=lambda layer: (layer[1], layer[0]))
+            issues = sorted((int(rng.integers(0, 25)), int(rng.integers(1, 6))) for _ in range(rng.integers(0, 8)))
+            layer_rows += [(product, quantity, price, arrival) for arrival, _, quantity, price in layers]
+            issue_rows += [(product, quantity, day) for day, quantity in issues]
+            cost, uncosted, units = reference_fefo(layers, issues)
+            expected_cost += cost
+            expected_uncosted += uncosted
+            expected_units.append(units)
+        layer_product, layer_quantity, layer_price, layer_arrival = zip(*layer_rows)
+        issue_product, issue_quantity, issue_date = zip(*issue_rows) if issue_rows else ((), (), ())
+        cost, uncosted, _, units, _ = fefo_costs(
+            layer_product,
+            layer_quantity,
+            layer_price,
+            day_zero + np.array(layer_arrival, dtype=np.int64),
+            np.array(issue_product, dtype=np.int64),
+            issue_quantity,
+            day_zero + np.array(issue_date, dtype=np.int64),
+        )
+        assert np.allclose(cost, expected_cost)
+        assert uncosted.tolist() == expected_uncosted
+        assert units.tolist() == expected_units
@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+import db
+
+NAME_SQL = "SELECT name FROM products WHERE product_id = 1"
+
+pytestmark = pytest.mark.skipif(db.backend() != "sqlite", reason="replicas are copies of the SQLite test database")
+
+
+@pytest.fixture
+def replicas(database, tmp_path, monkeypatch):
+    """Two copies of the database as read replicas, each naming product 1 after itself."""
+    paths = []
+    for name in ("replica-a", "replica-b"):
+        path = tmp_path / f"{name}.db"
+        # The backup API, since a file copy would miss pages still in the WAL.
+        source, copy = sqlite3.connect(database), sqlite3.connect(path)
+        source.backup(copy)
+        with copy:
+            copy.execute("UPDATE products SET name = ? WHERE product_id = 1", (name,))
+        source.close()
+        copy.close()
+        paths.append(str(path))
+    monkeypatch.setenv("DB_READ_REPLICAS", ",".join(paths))
+    monkeypatch.setenv("DB_READ_YOUR_WRITES_SECONDS", "60")
+    db.reset_pool()
+    return paths
+
+
+def read_name(session):
+    with db.session(session):
+        return db.fetch_one(NAME_SQL)["name"]
+
+
+def test_reads_alternate_between_replicas(replicas):
+    assert [read_name("reader") for _ in range(4)] == ["replica-a", "replica-b"] * 2
+    assert [rows[0]["name"] for rows in db.iter_batches(NAME_SQL)] == ["replica-a"]
+
+
+def test_writer_reads_its_own_writes_from_the_primary(replicas):
+    with db.session("writer"):
+        db.run_query("UPDATE products SET name = %s WHERE product_id = 1", ("primary",))
+    assert [read_name("writer") for _ in range(3)] == ["primary"] * 3
+    assert [read_name("reader") for _ in range(2)] == ["replica-a", "replica-b"]
+    assert db.replica_stats()["pinned_sessions"] == 1
+
+
+def test_unreadable_replica_fails_over(replicas, tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_READ_REPLICAS", f"{tmp_path / 'missing' / 'replica.db'},{replicas[1]}")
+    db.reset_pool()
+    original = db.fetch_one(NAME_SQL, ())
+    assert original["name"] not in ("replica-a", "replica-b")
+    # Once marked down, the missing replica is skipped until its retry time.
+    assert [read_name("reader") for _ in range(3)] == ["replica-b"] * 3
+    stats = db.replica_stats()
+    assert stats["replica_failures"] == 1
+    assert [replica["up"] for replica in stats["replicas"]] == [False, True]
+
+
+def test_bad_statement_does_not_mark_replica_down(replicas):
+    with pytest.raises(sqlite3.OperationalError, match="no such column"):
+        db.fetch_one("SELECT no_such_column FROM products")
+    stats = db.replica_stats()
+    assert stats["replica_failures"] == 0
+    assert all(replica["up"] for replica in stats["replicas"])
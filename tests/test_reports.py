@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+from db import fetch_one
+import services
+
+TODAY = date.today()
+
+
+def stocked_product(name, units=100):
+    product_id = services.add_product(name, 4, 12, 10)
+    supplier_id = services.add_supplier(f"{name} Supplier", "")
+    services.add_purchase(product_id, supplier_id, units, TODAY + timedelta(days=200), purchase_price=2.0)
+    return product_id
+
+
+def test_sales_report_pages_by_keyset(database):
+    product_id = stocked_product("Report Vase")
+    customer_id = services.add_customer("Report Customer")
+    sale_ids = [services.add_sale(product_id, customer_id, 1, sale_price=5.0) for _ in range(5)]
+
+    first = services.get_sales_report(limit=2, product_id=product_id)
+    second = services.get_sales_report(limit=2, before_id=first[-1]["sale_id"], product_id=product_id)
+    last = services.get_sales_report(limit=2, before_id=second[-1]["sale_id"], product_id=product_id)
+    assert [r["sale_id"] for r in first + second + last] == sorted(sale_ids, reverse=True)
+    assert services.get_sales_report(product_id=product_id, to_date=TODAY - timedelta(days=1)) == []
+
+
+def test_sales_trend_reads_daily_aggregates(database):
+    product_id = stocked_product("Trend Vase")
+    customer_id = services.add_customer("Trend Customer")
+    services.add_sale(product_id, customer_id, 2, sale_date=TODAY - timedelta(days=3), sale_price=5.0)
+    services.add_sale(product_id, customer_id, 3, sale_price=4.0)
+
+    trend = services.get_sales_trend(from_date=TODAY - timedelta(days=3), product_id=product_id)
+    assert [point["quantity"] for point in trend] == [2, 0, 0, 3]
+    today = trend[-1]
+    assert (today["quantity_7d"], today["sale_count_7d"], float(today["revenue_7d"])) == (5, 2, 22.0)
+    row = fetch_one("SELECT SUM(quantity) AS units FROM sales_daily WHERE product_id = %s", (product_id,))
+    assert row["units"] == 5
+
+
+def test_suggestions_prefer_the_cheaper_supplier_and_are_accepted(database):
+    product_id = services.add_product("Suggest Vase", 4, 12, 10)
+    dear = services.add_supplier("Suggest Dear", "")
+    cheap = services.add_supplier("Suggest Cheap", "")
+    expiry = TODAY + timedelta(days=100)
+    services.add_purchase(product_id, dear, 1, expiry, purchase_date=TODAY, purchase_price=10.0)
+    services.add_purchase(product_id, cheap, 1, expiry, purchase_date=TODAY, purchase_price=5.0)
+
+    suggestions = services.get_purchase_suggestions(threshold=10)
+    orders = [o for o in suggestions["orders"] if any(line["product_id"] == product_id for line in o["lines"])]
+    assert [o["supplier_id"] for o in orders] == [cheap]
+    line = next(line for line in orders[0]["lines"] if line["product_id"] == product_id)
+    assert line["suppliers_considered"] == 2 and line["unit_price"] == 5.0
+    assert line["quantity"] > line["reorder_point"] - line["total_quantity"]
+
+    before = fetch_one("SELECT total_quantity FROM product_stock_totals WHERE product_id = %s", (product_id,))
+    services.accept_purchase_orders(orders)
+    after = fetch_one("SELECT total_quantity FROM product_stock_totals WHERE product_id = %s", (product_id,))
+    assert after["total_quantity"] == before["total_quantity"] + line["quantity"]
+
+
+def test_search_ranks_prefix_matches_first_and_honours_limit(database):
+    services.add_product("Zephyr Lamp", 2, 7, 10)
+    services.add_product("Zephyr Rug", 3, 9, 10)
+    services.add_product("Quiet Zephyr Pillow", 3, 10, 10)
+
+    names = [p["name"] for p in services.search_products("zeph")]
+    assert names[:2] == ["Zephyr Lamp", "Zephyr Rug"]
+    assert [p["name"] for p in services.search_products("zephyr")][2] == "Quiet Zephyr Pillow"
+    assert len(services.search_products("zeph", limit=1)) == 1
+    assert "Ceramic Table Lamp" in [p["name"] for p in services.search_products("Lighting")]
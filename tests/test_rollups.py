@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+from cache import reference_cache
+from db import fetch_one
+import rollups
+import services
+
+
+def test_backdated_purchase_lands_in_month_closed_by_another_process(database, monkeypatch):
+    product_id = services.add_product("Rollup Vase", 1, None, 10)
+    supplier_id = services.add_supplier("Rollup Supplier", "")
+    last_month = rollups.month_start(date.today()) - timedelta(days=1)
+    services.add_purchase(product_id, supplier_id, 3, purchase_date=last_month, purchase_price=2.0)
+
+    # This process caches "nothing closed"; the close below runs as if in
+    # manage.py, which cannot invalidate this process's cache.
+    assert rollups.boundary("purchases") is None
+    monkeypatch.setattr(reference_cache, "invalidate", lambda *namespaces: None)
+    rollups.close_months("purchases")
+    assert rollups.boundary("purchases") is None
+
+    services.add_purchase(product_id, supplier_id, 4, purchase_date=last_month, purchase_price=5.0)
+
+    row = fetch_one(
+        "SELECT quantity, amount, line_count FROM purchases_monthly WHERE month = %s AND product_id = %s",
+        (rollups.month_start(last_month), product_id),
+    )
+    assert (row["quantity"], float(row["amount"]), row["line_count"]) == (7, 26.0, 2)
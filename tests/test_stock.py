@@ -0,0 +1,108 @@
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from db import fetch_all, fetch_one
+import services
+
+TODAY = date.today()
+
+
+def stock_units(product_id):
+    return fetch_one("SELECT COALESCE(SUM(quantity), 0) AS units FROM stock WHERE product_id = %s", (product_id,))["units"]
+
+
+def total_row(product_id):
+    return fetch_one(
+        "SELECT total_quantity, batch_count, earliest_expiry FROM product_stock_totals WHERE product_id = %s",
+        (product_id,),
+    )
+
+
+def test_second_sweep_moves_nothing(database):
+    product_id = services.add_product("Sweep Vase", 1, None, 10)
+    supplier_id = services.add_supplier("Sweep Supplier", "")
+    customer_id = services.add_customer("Sweep Customer")
+    services.add_purchase(product_id, supplier_id, 3, TODAY - timedelta(days=2), purchase_price=1.0)
+    services.add_purchase(product_id, supplier_id, 5, TODAY - timedelta(days=1), purchase_price=1.0)
+    services.add_purchase(product_id, supplier_id, 3, TODAY + timedelta(days=20), purchase_price=1.0)
+    # FEFO empties the oldest batch and leaves 4 units in the other expired one.
+    services.add_sale(product_id, customer_id, 4, sale_price=5.0)
+
+    first = services.sweep_stock(chunk_size=2)
+    assert first["written_off"][product_id] == 4
+    assert stock_units(product_id) == 3
+    totals = total_row(product_id)
+    assert (totals["total_quantity"], totals["batch_count"]) == (3, 1)
+
+    second = services.sweep_stock(chunk_size=2)
+    assert (second["expired_batches"], second["empty_batches"], second["written_off"]) == (0, 0, {})
+    assert total_row(product_id) == totals
+    assert services.verify_stock_totals() == []
+    archived = fetch_all(
+        "SELECT reason, quantity FROM stock_archive WHERE product_id = %s ORDER BY expiry_date", (product_id,)
+    )
+    assert archived == [{"reason": "empty", "quantity": 0}, {"reason": "expired", "quantity": 4}]
+
+
+def test_dry_run_sweep_moves_nothing(database):
+    before = fetch_one("SELECT COUNT(*) AS n FROM stock")["n"]
+    report = services.sweep_stock(dry_run=True)
+    assert report["expired_batches"] + report["empty_batches"] > 0
+    assert fetch_one("SELECT COUNT(*) AS n FROM stock")["n"] == before
+    assert fetch_one("SELECT COUNT(*) AS n FROM stock_archive")["n"] == 0
+
+
+def test_short_order_writes_nothing(database):
+    supplier_id = services.add_supplier("Order Supplier", "")
+    customer_id = services.add_customer("Order Customer")
+    plenty = services.add_product("Order Plenty", 1, None, 10)
+    scarce = services.add_product("Order Scarce", 1, None, 10)
+    services.add_purchase(plenty, supplier_id, 5, TODAY + timedelta(days=30), purchase_price=1.0)
+    services.add_purchase(scarce, supplier_id, 1, TODAY + timedelta(days=30), purchase_price=1.0)
+    sales_before = fetch_one("SELECT COUNT(*) AS n FROM sales")["n"]
+
+    lines = [{"product_id": plenty, "quantity": 3}, {"product_id": scarce, "quantity": 2}]
+    with pytest.raises(ValueError, match=f"product {scarce} \\(short by 1\\)"):
+        services.add_sale_order(customer_id, lines)
+
+    assert (stock_units(plenty), stock_units(scarce)) == (5, 1)
+    assert fetch_one("SELECT COUNT(*) AS n FROM sales")["n"] == sales_before
+    assert fetch_all("SELECT * FROM sales_daily WHERE product_id IN (%s, %s)", (plenty, scarce)) == []
+    assert services.verify_stock_totals() == []
+
+
+def test_order_takes_every_line(database):
+    supplier_id = services.add_supplier("Order Supplier", "")
+    customer_id = services.add_customer("Order Customer")
+    product_id = services.add_product("Order Lamp", 2, None, 10)
+    services.add_purchase(product_id, supplier_id, 4, TODAY + timedelta(days=5), purchase_price=1.0)
+    services.add_purchase(product_id, supplier_id, 4, TODAY + timedelta(days=50), purchase_price=1.0)
+
+    lines = [{"product_id": product_id, "quantity": 3}, {"product_id": product_id, "quantity": 3, "sale_price": 9.0}]
+    assert services.add_sale_order(customer_id, lines) == 2
+    batches = fetch_all("SELECT quantity FROM stock WHERE product_id = %s ORDER BY expiry_date", (product_id,))
+    assert [b["quantity"] for b in batches] == [0, 2]
+
+
+def test_import_merges_batches_and_reports_bad_rows(database):
+    expiry = (TODAY + timedelta(days=90)).isoformat()
+    rows = [
+        "product_id,supplier_id,quantity,expiry_date,purchase_price",
+        f"1,2,4,{expiry},3.5",
+        f"1,2,6,{expiry},3.5",
+        "1,99,1,,",
+        "1,2,many,,",
+    ]
+    before = stock_units(1)
+    report = services.import_purchases_csv(io.StringIO("\n".join(rows) + "\n"), chunk_size=1)
+    assert (report["rows"], report["imported"]) == (4, 2)
+    assert [e["line"] for e in report["errors"]] == [4, 5]
+    assert "Unknown supplier_id 99" in report["errors"][0]["error"]
+    batch = fetch_one(
+        "SELECT quantity FROM stock WHERE product_id = 1 AND supplier_id = 2 AND expiry_date = %s", (expiry,)
+    )
+    assert batch["quantity"] == 10
+    assert stock_units(1) == before + 10
+    assert services.verify_stock_totals() == []
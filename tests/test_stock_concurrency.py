@@ -0,0 +1,141 @@
+import threading
+from datetime import date, timedelta
+
+from mysql.connector import errors
+import pytest
+
+import db
+from db import fetch_one, transaction
+import services
+
+# On SQLite, BEGIN IMMEDIATE serialises every writer and FOR UPDATE is dropped,
+# so these tests check the stock logic under concurrency but not the InnoDB
+# row locks. Set TEST_MYSQL_DATABASE to run them, and the lock tests below,
+# against MySQL.
+mysql_only = pytest.mark.skipif(db.backend() != "mysql", reason="needs TEST_MYSQL_DATABASE for InnoDB row locks")
+
+
+def test_parallel_sales_never_oversell(database):
+    product_id = services.add_product("Concurrency Vase", 1, None, 10)
+    supplier_id = services.add_supplier("Concurrency Supplier", "")
+    customer_id = services.add_customer("Concurrency Customer")
+    expiry = date.today() + timedelta(days=365)
+    # Several small batches, so sales also race across batch boundaries.
+    for units in (7, 8, 5):
+        services.add_purchase(product_id, supplier_id, units, expiry, purchase_price=1.0)
+        expiry += timedelta(days=1)
+
+    threads, sales_per_thread = 8, 5
+    sold = []
+    rejected = []
+    failures = []
+    start = threading.Barrier(threads)
+
+    def till():
+        start.wait()
+        for _ in range(sales_per_thread):
+            try:
+                services.add_sale(product_id, customer_id, 1, sale_price=10.0)
+                sold.append(1)
+            except ValueError:
+                rejected.append(1)
+            except Exception as exc:
+                failures.append(exc)
+
+    workers = [threading.Thread(target=till) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert failures == []
+    assert len(sold) == 20
+    assert len(rejected) == threads * sales_per_thread - 20
+    stock = fetch_one(
+        "SELECT SUM(quantity) AS units, MIN(quantity) AS smallest FROM stock WHERE product_id = %s", (product_id,)
+    )
+    assert stock["units"] == 0
+    assert stock["smallest"] == 0
+    sales = fetch_one("SELECT SUM(quantity) AS units FROM sales WHERE product_id = %s", (product_id,))
+    assert sales["units"] == 20
+    assert services.verify_stock_totals() == []
+
+
+def test_parallel_purchases_and_sales_keep_totals_exact(database):
+    product_id = services.add_product("Concurrency Lamp", 1, None, 10)
+    supplier_id = services.add_supplier("Concurrency Supplier", "")
+    customer_id = services.add_customer("Concurrency Customer")
+    # Enough for every sale even if the sellers run before any purchase lands.
+    services.add_purchase(product_id, supplier_id, 15, date.today() + timedelta(days=30), purchase_price=1.0)
+    failures = []
+    start = threading.Barrier(6)
+
+    def buyer(offset):
+        start.wait()
+        for day in range(5):
+            # Each purchase lands in its own (supplier, expiry) batch.
+            expiry = date.today() + timedelta(days=100 + offset * 10 + day)
+            try:
+                services.add_purchase(product_id, supplier_id, 2, expiry, purchase_price=1.0)
+            except Exception as exc:
+                failures.append(exc)
+
+    def seller():
+        start.wait()
+        for _ in range(5):
+            try:
+                services.add_sale(product_id, customer_id, 1, sale_price=10.0)
+            except Exception as exc:
+                failures.append(exc)
+
+    workers = [threading.Thread(target=buyer, args=(i,)) for i in range(3)]
+    workers += [threading.Thread(target=seller) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert failures == []
+    assert services.verify_stock_totals() == []
+    stored = fetch_one("SELECT total_quantity FROM product_stock_totals WHERE product_id = %s", (product_id,))
+    assert stored["total_quantity"] == 15 + 3 * 5 * 2 - 3 * 5
+
+
+@mysql_only
+def test_sale_locks_for_update_only_the_batches_it_takes_from(database):
+    product_id = services.add_product("Lock Scope Vase", 1, None, 10)
+    supplier_id = services.add_supplier("Lock Scope Supplier", "")
+    customer_id = services.add_customer("Lock Scope Customer")
+    first, later = date.today() + timedelta(days=30), date.today() + timedelta(days=60)
+    for expiry in (first, later):
+        services.add_purchase(product_id, supplier_id, 5, expiry, purchase_price=1.0)
+    selling = threading.Event()
+    release = threading.Event()
+    failures = []
+
+    def till():
+        try:
+            with transaction():
+                services.add_sale(product_id, customer_id, 1, sale_price=10.0)
+                selling.set()
+                release.wait(10)
+        except Exception as exc:
+            failures.append(exc)
+            selling.set()
+
+    seller = threading.Thread(target=till)
+    seller.start()
+    try:
+        assert selling.wait(10)
+        # refresh_stock_totals reads every batch of the product with shared
+        # locks, so only a batch the sale took from refuses a shared lock.
+        probe = "SELECT quantity FROM stock WHERE product_id = %s AND expiry_date = %s FOR SHARE NOWAIT"
+        with transaction():
+            assert fetch_one(probe, (product_id, later)) == {"quantity": 5}
+        with pytest.raises(errors.DatabaseError):
+            with transaction():
+                fetch_one(probe, (product_id, first))
+    finally:
+        release.set()
+        seller.join()
+    assert failures == []